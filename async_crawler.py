@@ -0,0 +1,290 @@
+"""
+异步引擎
+基于 asyncio + aiohttp：一次爬取期间在后台线程运行一个事件循环，课程目录、卡片API、
+预览页面和图片请求都经同一个共享连接池的 aiohttp 会话发出，数百张图片同时下载也只占一个线程。
+
+engine="async" 时 ChaoxingImageCrawler 在爬取开始时启动它：
+- 页面请求经 get()，接口与 requests.Session.get 相同，返回 requests.Response，
+  页面缓存、重试和登录页检测沿用同步引擎的实现
+- 图片经 submit(download_image(...)) 提交到事件循环，续传信息写在与同步引擎相同的 .part.json 中
+- 下载清单、PDF 合成、后处理和结果汇报仍由 ChaoxingImageCrawler 负责
+作业页面需要边接收边交给解析器，仍由 requests 流式读取，其中的图片同样交给事件循环下载
+"""
+
+import asyncio
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.cookies import morsel_to_cookie
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:  # aiohttp 为可选依赖
+    aiohttp = None
+
+from chaoxing_crawler import CHUNK_SIZE, ChaoxingImageCrawler, IncompleteDownloadError
+from flow_control import RequestSlot, is_retryable
+
+# 单个事件循环中同时进行的图片请求数
+DEFAULT_CONCURRENCY = 200
+
+
+def to_response(response, body=b""):
+    """把 aiohttp 的响应转换为 requests.Response（包括重定向历史），供同步引擎的代码直接使用"""
+    converted = requests.Response()
+    converted.status_code = response.status
+    converted.reason = response.reason
+    converted.url = str(response.url)
+    converted.headers = CaseInsensitiveDict(response.headers)
+    converted.encoding = get_encoding_from_headers(converted.headers)
+    converted.history = [to_response(r) for r in response.history]
+    converted._content = body
+    return converted
+
+
+class AsyncChaoxingImageCrawler:
+    """
+    用法:
+        engine = AsyncChaoxingImageCrawler(cookies, crawler=crawler).start()
+        response = engine.get(url, headers=headers, timeout=10)   # 在事件循环中请求，阻塞到完成
+        future = engine.submit(engine.download_image(img_url, save_dir, course_name, chapter_name, i))
+        engine.close()
+    """
+
+    def __init__(self, cookies, concurrency=DEFAULT_CONCURRENCY, crawler=None):
+        if aiohttp is None:
+            raise RuntimeError("异步引擎需要安装 aiohttp: pip install aiohttp")
+        self.cookies = dict(cookies)
+        self.concurrency = max(1, int(concurrency))
+        # 页面解析、文件命名和日志复用同步爬虫的实现
+        self.crawler = crawler or ChaoxingImageCrawler(cookies)
+        self.headers = self.crawler.headers
+        self.loop = None
+        self.thread = None
+        self.session = None
+
+    def log(self, message):
+        self.crawler.log(message)
+
+    def create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, limit_per_host=self.concurrency
+        )
+        return aiohttp.ClientSession(
+            connector=connector, cookies=self.cookies, headers=self.headers
+        )
+
+    def start(self):
+        """在后台线程启动事件循环并创建 aiohttp 会话，返回 self"""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.thread.start()
+            self.session = self.run(self.open_session())
+        return self
+
+    async def open_session(self):
+        # aiohttp 的会话需要在事件循环中创建
+        return self.create_session()
+
+    def submit(self, coro):
+        """把协程交给事件循环，返回 concurrent.futures.Future，不能在事件循环线程中等待它"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def close(self):
+        """关闭会话和事件循环，已提交的下载应先等待完成"""
+        if self.loop is None:
+            return
+        try:
+            self.run(self.session.close())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = self.thread = self.session = None
+
+    def get(self, url, headers=None, timeout=10, **kwargs):
+        """
+        在事件循环中发出 GET 请求并等待完成，返回 requests.Response；
+        连接错误和超时转换为 requests 的异常，同步引擎的重试规则照常生效
+        """
+        return self.run(self.fetch_page(url, headers, timeout))
+
+    async def fetch_page(self, url, headers=None, timeout=10):
+        client_timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=timeout, sock_read=timeout
+        )
+        # 页面 URL 由爬虫拼接、已经编码，原样发送（默认会把 %3A 等解码），与 requests 发出的请求一致，
+        # 没有重定向时响应的 URL 也与 url 相同
+        request_url = URL(url, encoded=True)
+        try:
+            async with self.session.get(
+                request_url, headers=headers, timeout=client_timeout
+            ) as response:
+                body = await response.read()
+        except asyncio.TimeoutError as e:
+            raise requests.Timeout(f"请求超时: {url}") from e
+        except aiohttp.ClientError as e:
+            raise requests.ConnectionError(e) from e
+        self.absorb_cookies(response)
+        return to_response(response, body)
+
+    def absorb_cookies(self, response):
+        """响应（包括重定向）通过 Set-Cookie 轮换的 Cookie 写回同步爬虫的 Session，由调用方保存到 Cookie 文件"""
+        for r in (*response.history, response):
+            for morsel in r.cookies.values():
+                cookie = morsel_to_cookie(morsel)
+                if not cookie.domain:
+                    cookie.domain = r.url.host
+                self.crawler.session.cookies.set_cookie(cookie)
+
+    async def download_image(self, img_url, save_dir, course_name, chapter_name, index, after=None):
+        """after: 相同图片正在进行的下载（Future），先等它完成，之后直接链接它保存的文件"""
+        if after is not None:
+            await asyncio.wrap_future(after)
+        start = time.perf_counter()
+        outcome, filename = await self.fetch_image(
+            img_url, save_dir, course_name, chapter_name, index
+        )
+        self.crawler.metrics.observe("image", time.perf_counter() - start)
+        self.crawler.metrics.inc("images", status=outcome)
+        self.crawler.outcomes[outcome].append(filename)
+        self.crawler.progress("image", outcome=outcome)
+        ok = outcome in ("ok", "retried")
+        # 后处理积压过多时会阻塞事件循环，下载随之放慢
+        self.crawler.image_saved(
+            save_dir, course_name, chapter_name, index, filename if ok else None
+        )
+        return ok
+
+    async def fetch_image(self, img_url, save_dir, course_name, chapter_name, index):
+        """重试、续传和熔断规则与同步引擎相同，返回 (结果, 文件名)"""
+        filename = img_url
+        try:
+            img_url, filename, filepath = self.crawler.build_image_path(
+                img_url, save_dir, course_name, chapter_name, index
+            )
+            if self.crawler.reuse_download(img_url, filepath):
+                self.log(f"相同图片已经下载，未重复请求: {filename}")
+                return "ok", filename
+            part_path = filepath + ".part"
+            host = urlparse(img_url).netloc
+            breaker = self.crawler.breakers.get(host)
+            retry = self.crawler.retry
+
+            attempt = 0
+            while True:
+                attempt += 1
+                if not breaker.allow():
+                    self.log(f"⛔ 图片服务器 {host} 熔断中，跳过: {filename}")
+                    return "circuit_open", filename
+
+                status, retry_after, error = await self.request_part(img_url, part_path)
+                # 传输中断时服务器已经响应过，只需续传，不算主机故障
+                resumable = isinstance(error, IncompleteDownloadError)
+                if (error is not None and not resumable) or (status or 0) >= 500:
+                    if breaker.record_failure():
+                        self.crawler.metrics.inc("circuit_opened")
+                        self.log(
+                            f"⛔ 图片服务器 {host} 连续失败，{breaker.reset_timeout:.0f}s 内不再向其请求"
+                        )
+                else:
+                    # 服务器有响应（包括 404、429），主机本身没有故障，限流交给并发控制处理
+                    breaker.record_success()
+                if error is None and (status == 200 or not is_retryable(status)):
+                    break
+                if attempt >= retry.attempts:
+                    break
+
+                self.crawler.metrics.inc("retries", kind="image")
+                self.crawler.progress("retry", kind="image")
+                if resumable and os.path.exists(part_path):
+                    # 已收到的字节保留在 .part 文件中，立即续传
+                    self.crawler.metrics.inc("resumes")
+                    self.log(f"传输中断，断点续传: {filename} ({error})")
+                    continue
+                delay = retry.delay(attempt, retry_after)
+                reason = f"状态码 {status}" if error is None else error
+                self.log(f"下载失败（{reason}），{delay:.1f}s 后重试: {filename}")
+                await asyncio.sleep(delay)
+
+            if error is not None:
+                raise error
+            if status != 200:
+                self.log(f"下载失败: {img_url} (状态码: {status})")
+                return "failed", filename
+
+            self.crawler.store_file(part_path, filepath, img_url)
+            try:
+                os.remove(part_path + ".json")
+            except OSError:
+                pass
+            self.log(f"下载成功: {filename}")
+            self.log(f"保存路径: {filepath}")
+            return ("ok" if attempt == 1 else "retried"), filename
+        except Exception as e:
+            self.log(f"下载图片失败: {img_url}, 错误: {e}")
+            return "failed", filename
+
+    async def request_part(self, img_url, part_path):
+        """占用一个并发额度请求一次图片，返回 (状态码, Retry-After, 异常)"""
+        limiter = self.crawler.limiter
+        if limiter:
+            await limiter.acquire_async()
+        slot = RequestSlot()
+        start = time.perf_counter()
+        status = error = None
+        try:
+            status = await self.fetch_part(img_url, part_path, slot)
+        except (aiohttp.ClientError, asyncio.TimeoutError, IncompleteDownloadError) as e:
+            error = e
+        finally:
+            if limiter:
+                limiter.release(
+                    slot.status, time.perf_counter() - start, slot.retry_after,
+                    error=slot.status is None,
+                )
+        return status, slot.retry_after, error
+
+    async def fetch_part(self, img_url, part_path, slot):
+        """
+        把图片下载到 .part 文件，续传规则见 ChaoxingImageCrawler.fetch_part；
+        返回状态码，200 表示 .part 文件已完整
+        """
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=10)
+        headers, meta, offset = self.crawler.part_request_headers(img_url, part_path)
+        async with self.session.get(img_url, headers=headers, timeout=timeout) as response:
+            status = slot.status = response.status
+            slot.retry_after = response.headers.get("Retry-After")
+            mode, length = self.crawler.open_part(
+                img_url, part_path, status, response.headers, meta, offset
+            )
+            if mode == "restart":
+                return await self.fetch_part(img_url, part_path, slot)
+            if mode == "done":
+                return 200
+            if mode is None:
+                return status
+
+            with open(part_path, mode) as f:
+                try:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        self.crawler.metrics.inc("bytes", len(chunk), kind="image")
+                        self.crawler.progress("bytes", n=len(chunk))
+                except aiohttp.ClientPayloadError:
+                    # 连接中断时保留已收到的字节，由下面的长度检查触发续传；长度未知时无法续传
+                    if length is None:
+                        raise
+
+        self.crawler.check_part_size(part_path, length)
+        return 200
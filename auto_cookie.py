@@ -1,24 +1,48 @@
 """
 自动获取学习通Cookie模块
-使用 Selenium 打开浏览器让用户登录，然后自动获取Cookie
+使用 Selenium 打开浏览器让用户登录，然后自动获取Cookie。
+打开浏览器只是 Cookie 无法通过 HTTP 续期（见 cookie_store.CookieStore.renew）时的后备手段；
+浏览器由 driver_factory 创建，测试时可换成 stub_server.StubDriver，不需要 Chrome
 """
 
 import time
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
+LOGIN_URL = "https://passport2.chaoxing.com/login"
+# 等待用户登录的最长时间(秒)和检查间隔(秒)
+LOGIN_TIMEOUT = 300
+POLL_INTERVAL = 1
 
-def get_cookie_auto(callback=None, keep_browser_open=False):
+
+def chrome_driver():
+    """默认的浏览器：Chrome（首次使用时才导入 Selenium）"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    return webdriver.Chrome(options=chrome_options)
+
+
+def get_cookie_auto(
+    callback=None,
+    keep_browser_open=False,
+    driver_factory=chrome_driver,
+    login_url=LOGIN_URL,
+    timeout=LOGIN_TIMEOUT,
+    store=None,
+):
     """
     自动获取学习通Cookie
     
     Args:
         callback: 回调函数，用于更新日志
         keep_browser_open: 是否保持浏览器打开，默认False
+        driver_factory: 创建浏览器的函数，返回具有 Selenium WebDriver 接口的对象
+        login_url: 登录页面地址
+        timeout: 等待登录的最长时间(秒)
+        store: cookie_store.CookieStore，提供时把浏览器中的 Cookie（含域名和过期时间）写入并保存
         
     Returns:
         str: Cookie字符串，失败返回None
@@ -33,20 +57,14 @@ def get_cookie_auto(callback=None, keep_browser_open=False):
     try:
         log("正在启动浏览器...")
         
-        # 配置Chrome选项
-        chrome_options = Options()
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
         # 启动浏览器
-        driver = webdriver.Chrome(options=chrome_options)
+        driver = driver_factory()
         driver.maximize_window()
         
         log("浏览器已启动，正在打开学习通登录页面...")
         
         # 打开学习通登录页面
-        driver.get("https://passport2.chaoxing.com/login")
+        driver.get(login_url)
         
         log("请在浏览器中完成登录...")
         log("登录成功后，程序将自动获取Cookie")
@@ -55,11 +73,11 @@ def get_cookie_auto(callback=None, keep_browser_open=False):
         login_detected = False
         start_time = time.time()
         
-        while time.time() - start_time < 300:  # 5分钟超时
+        while time.time() - start_time < timeout:
             try:
                 # 检查URL是否变化
                 current_url = driver.current_url
-                if "passport2.chaoxing.com/login" not in current_url:
+                if not current_url.startswith(login_url):
                     login_detected = True
                     break
                 
@@ -70,7 +88,7 @@ def get_cookie_auto(callback=None, keep_browser_open=False):
                     login_detected = True
                     break
                     
-                time.sleep(1)
+                time.sleep(POLL_INTERVAL)
             except:
                 pass
         
@@ -106,6 +124,10 @@ def get_cookie_auto(callback=None, keep_browser_open=False):
         cookie_str = "; ".join([f"{cookie['name']}={cookie['value']}" for cookie in cookies])
         
         log(f"成功获取Cookie！共 {len(cookies)} 个Cookie项")
+
+        if store is not None:
+            store.update_from_driver(cookies)
+            store.save()
         
         # 根据参数决定是否关闭浏览器
         if not keep_browser_open:
@@ -0,0 +1,656 @@
+"""
+下载性能基准测试
+使用本地模拟服务器（stub_server.py），不访问学习通
+
+用法:
+    python benchmark.py [--pages 60] [--latency 0.05] [--size 200000] [--workers 8]
+    python benchmark.py --resume    # 模拟传输中断，检查断点续传不重复传输字节
+    python benchmark.py --extract   # extract_images 在大页面上的解析速度
+    python benchmark.py --throttle 6 --workers 32
+                                    # 服务器超过 6 个并发即返回 429，对比固定并发与自适应并发
+    python benchmark.py --e2e [--error-rate 0.01] [--output bench_results.jsonl] [--compare]
+                                    # crawl_images / crawl_homework_images 端到端测试
+    python benchmark.py --shard 4 [--chapters 16] [--filler-kb 64]
+                                    # 整门课程用 cli.py --processes 1 与 --processes 4 爬取的耗时对比
+    python benchmark.py --startup [--rounds 5] [--compare]
+                                    # gui.py 冷启动: -X importtime 导入耗时和窗口首次显示耗时
+    python benchmark.py --cookies   # 用 StubDriver 自动获取 Cookie、保存 Cookie 文件并通过 HTTP 续期，
+                                    # 检查失败时退出码为 1
+    python benchmark.py --queue     # SQLite 任务队列: 工作进程崩溃后租约到期重新分配、
+                                    # 超过最大尝试次数进入 dead，检查失败时退出码为 1
+"""
+
+import argparse
+import json
+import multiprocessing
+import re
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+from async_crawler import aiohttp
+from auto_cookie import get_cookie_auto
+from chaoxing_crawler import ChaoxingImageCrawler
+from cookie_store import AUTH_TOKEN_COOKIE, CookieStore
+from job_queue import STATUS_DEAD, SqliteBroker
+from stub_server import (
+    StubDriver,
+    course_url,
+    homework_url,
+    start_server,
+    start_server_process,
+)
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+
+def run_resume_check(pages, size, workers):
+    server, base_url = start_server(image_size=size, drop_first=True)
+    stats = server.stats
+    try:
+        elapsed, success = run_download(base_url, pages, workers)
+    finally:
+        server.shutdown()
+
+    expected = pages * size
+    print(f"断点续传: 成功 {success}/{pages}, 耗时 {elapsed:.2f}s, 请求 {stats['requests']} 次")
+    print(f"服务器发送 {stats['bytes_sent']} 字节, 图片总大小 {expected} 字节")
+    if stats["bytes_sent"] == expected:
+        print("✓ 中断后续传没有重复传输任何字节")
+    else:
+        print(f"✗ 多传输了 {stats['bytes_sent'] - expected} 字节")
+
+
+def run_throttle_check(pages, size, latency, workers, threshold):
+    """服务器并发超过 threshold 时返回 429，对比固定并发与自适应并发"""
+    print(f"限流测试: 服务器并发上限 {threshold}, 客户端最大并发 {workers}, 图片 {pages} 张")
+    for label, adaptive in (("固定并发", False), ("自适应并发", True)):
+        server, base_url = start_server(
+            image_size=size, latency=latency, throttle_concurrency=threshold
+        )
+        crawler = ChaoxingImageCrawler({}, max_workers=workers, adaptive=adaptive)
+        try:
+            elapsed, success = run_download(base_url, pages, workers, crawler=crawler)
+        finally:
+            server.shutdown()
+        limit = crawler.limiter.current if crawler.limiter else workers
+        print(
+            f"{label}: 成功 {success}/{pages}, 耗时 {elapsed:.2f}s, "
+            f"{success / elapsed:.1f} 张/s, 被限流 {server.stats['throttled']} 次, "
+            f"结束时并发数 {limit}"
+        )
+
+
+# 旧版 extract_images：九个正则依次扫描整个页面，用来对比速度和结果
+LEGACY_IMG_PATTERNS = [
+    r'<img[^>]+src="([^"]+)"',
+    r"<img[^>]+src=\'([^\']+)\'",
+    r'"url":"([^"]+\.jpg[^"]*)"',
+    r'"url":"([^"]+\.png[^"]*)"',
+    r'"orig":"([^"]+)"',
+    r'background-image:\s*url\(["\']?([^)"\']+)["\']?\)',
+    r'https?://[^"\'>\s]+ananas[^"\'>\s]+',
+    r'https?://[^"\'>\s]+/sv-w8/[^"\'>\s]+',
+    r'https://s[0-9]\.ananas\.chaoxing\.com[^\s"\'<>]+',
+]
+
+
+def legacy_extract_images(html):
+    images = []
+    for pattern in LEGACY_IMG_PATTERNS:
+        for match in re.findall(pattern, html):
+            if match and not match.startswith("data:"):
+                if "/sv-w8/doc/" in match or "ananas.chaoxing.com" in match:
+                    images.append(match)
+    return list(set(images))
+
+
+def build_preview_page(pages, filler_kb):
+    """生成预览页面：每页一张课件图片，夹杂正文、普通链接、内联 base64 图片和脚本"""
+    filler = "<p>" + "课程资料正文 lorem ipsum dolor sit amet " * (filler_kb * 32) + "</p>\n"
+    inline = "data:image/png;base64," + "iVBORw0KGgo" * 200
+    parts = []
+    for i in range(1, pages + 1):
+        host = f"s{i % 9 + 1}.ananas.chaoxing.com"
+        parts.append(
+            f'<div class="page"><img class="lazy" data-id="{i}" '
+            f'src="https://{host}/sv-w8/doc/0a/1b/{i}/orig.png?v={i}" alt="page {i}"></div>\n'
+            f'<a href="https://mooc1.chaoxing.com/course/{i}">第{i}页</a>'
+            f'<img src="{inline}">\n{filler}'
+            f'<script>var page={{"id":{i},"title":"第{i}页"}};</script>\n'
+        )
+    return "".join(parts)
+
+
+def run_extract_benchmark(pages, filler_kb, rounds):
+    html = build_preview_page(pages, filler_kb)
+    crawler = ChaoxingImageCrawler({}, use_manifest=False)
+
+    legacy = min(timed(legacy_extract_images, html) for _ in range(rounds))
+    current = min(timed(crawler.extract_images, html) for _ in range(rounds))
+    same = set(legacy_extract_images(html)) == set(crawler.extract_images(html))
+
+    print(f"预览页面: {len(html) / 1e6:.1f} MB, {pages} 张图片, 取 {rounds} 次最快")
+    print(f"旧版九次扫描: {legacy * 1000:.1f} ms")
+    print(f"预编译+锚点过滤: {current * 1000:.1f} ms")
+    print(f"加速比: {legacy / current:.1f}x, 结果一致: {'是' if same else '否'}")
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run_download(base_url, pages, workers, engine="thread", adaptive=True, crawler=None):
+    """下载 pages 张图片，返回 (耗时秒数, 成功数量)"""
+    images = [f"{base_url}/sv-w8/doc/page/{i}.png" for i in range(1, pages + 1)]
+    save_dir = tempfile.mkdtemp(prefix="chaoxing_bench_")
+    try:
+        crawler = crawler or ChaoxingImageCrawler(
+            {}, max_workers=workers, engine=engine, adaptive=adaptive
+        )
+        crawler.log_callback = lambda message: None
+        start = time.perf_counter()
+        success = crawler.download_images(images, save_dir, "课程", "章节")
+        return time.perf_counter() - start, success
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+
+class TimedCrawler(ChaoxingImageCrawler):
+    """记录每张图片下载耗时的爬虫"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def download_image(self, *args, **kwargs):
+        start = time.perf_counter()
+        ok = super().download_image(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        return ok
+
+
+def percentile(values, pct):
+    """最近秩法百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位是字节，Linux 是 KB
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def server_stats(base_url):
+    return requests.get(f"{base_url}/__stats", timeout=10).json()
+
+
+def measure_crawl(mode, base_url, workers, result_queue):
+    """在独立进程中跑一次爬取，峰值内存只包含这一次爬取"""
+    save_dir = tempfile.mkdtemp(prefix="chaoxing_e2e_")
+    try:
+        crawler = TimedCrawler(
+            {}, max_workers=workers, use_manifest=False, use_http_cache=False
+        )
+        crawler.MOOC_BASE_URL = crawler.PAN_BASE_URL = base_url
+        crawler.log_callback = lambda message: None
+
+        before = server_stats(base_url)
+        start = time.perf_counter()
+        if mode == "crawl_images":
+            crawler.crawl_images(course_url(base_url), save_dir)
+        else:
+            crawler.crawl_homework_images(homework_url(base_url), save_dir)
+        elapsed = time.perf_counter() - start
+        after = server_stats(base_url)
+
+        result_queue.put(
+            {
+                "elapsed_s": round(elapsed, 4),
+                "images": len(crawler.latencies),
+                "mb": round((after["bytes_sent"] - before["bytes_sent"]) / 1e6, 3),
+                # 新建的 TCP 连接数（不含读取统计本身的连接），连接复用正常时远小于图片数
+                "connections": after["connections"] - before["connections"] - 1,
+                "latencies": crawler.latencies,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+        )
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+
+def run_e2e(args):
+    scenario = {
+        "pages": args.pages,
+        "image_size": args.size,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "workers": args.workers,
+    }
+    process, base_url = start_server_process(
+        chapters=1,
+        pages=args.pages,
+        image_size=args.size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+    )
+    records = []
+    try:
+        for mode in ("crawl_images", "crawl_homework_images"):
+            result_queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(
+                target=measure_crawl, args=(mode, base_url, args.workers, result_queue)
+            )
+            worker.start()
+            result = result_queue.get()
+            worker.join()
+
+            latencies = result.pop("latencies")
+            elapsed = result["elapsed_s"]
+            p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+            records.append(
+                {
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                    "mode": mode,
+                    "scenario": scenario,
+                    **result,
+                    "images_per_s": round(result["images"] / elapsed, 2),
+                    "mb_per_s": round(result["mb"] / elapsed, 2),
+                    "latency_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+                    "latency_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+                }
+            )
+    finally:
+        process.terminate()
+
+    previous = load_records(args.output) if args.compare else []
+    for record in records:
+        rss = record["peak_rss_mb"]
+        print(
+            f"{record['mode']}: {record['images']} 张, {record['elapsed_s']:.2f}s, "
+            f"{record['images_per_s']} 张/s, {record['mb_per_s']} MB/s, "
+            f"p50 {record['latency_p50_ms']} ms, p99 {record['latency_p99_ms']} ms, "
+            f"新建连接 {record['connections']} 个, "
+            f"峰值内存 {f'{rss:.1f} MB' if rss else '未知'}"
+        )
+        baseline = find_baseline(previous, record)
+        if baseline:
+            print_comparison(baseline, record)
+
+    with open(args.output, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"结果已追加到: {args.output}")
+
+
+def run_shard_check(args):
+    """整门课程分别用单进程和 args.shard 个进程爬取，比较总耗时"""
+    process, base_url = start_server_process(
+        chapters=args.chapters,
+        pages=args.pages,
+        image_size=args.size,
+        latency=args.latency,
+        filler_kb=args.filler_kb,
+    )
+    env = dict(os.environ, CHAOXING_COOKIE="stub=1")
+    cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    try:
+        print(
+            f"章节数: {args.chapters}, 每章图片: {args.pages}, 每页正文: {args.filler_kb} KB, "
+            f"CPU 核心: {os.cpu_count()}"
+        )
+        for processes in (1, args.shard):
+            save_dir = tempfile.mkdtemp(prefix="chaoxing_shard_")
+            try:
+                start = time.perf_counter()
+                result = subprocess.run(
+                    [
+                        sys.executable, cli_path, course_url(base_url),
+                        "--mode", "whole_course",
+                        "--base-url", base_url,
+                        "--output-dir", save_dir,
+                        "--processes", str(processes),
+                        "--workers", str(args.workers),
+                        "--quiet",
+                    ],
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                )
+                elapsed = time.perf_counter() - start
+            finally:
+                shutil.rmtree(save_dir, ignore_errors=True)
+            summary = json.loads(result.stdout)
+            images = sum(r["images"]["ok"] for r in summary["results"] if "images" in r)
+            print(
+                f"进程数 {processes}: {elapsed:.2f}s, 成功 {images}/{args.chapters * args.pages} 张, "
+                f"{images / elapsed:.1f} 张/s"
+            )
+    finally:
+        process.terminate()
+
+
+def run_cookie_check(args):
+    """
+    在模拟服务器上检查 Cookie 流程：StubDriver 登录 -> 写入 Cookie 文件 -> 重新读取 -> HTTP 续期，
+    未登录时续期应失败。返回是否全部通过
+    """
+    server, base_url = start_server()
+    save_dir = tempfile.mkdtemp(prefix="chaoxing_cookies_")
+    results = []
+
+    def check(name, ok):
+        results.append(ok)
+        print(f"{'✓' if ok else '✗'} {name}")
+
+    try:
+        jar_path = os.path.join(save_dir, "cookies.lwp")
+        store = CookieStore(jar_path)
+        cookie_string = get_cookie_auto(
+            callback=lambda message: None,
+            driver_factory=StubDriver,
+            login_url=f"{base_url}/login",
+            timeout=10,
+            store=store,
+        )
+        check("自动获取 Cookie", bool(cookie_string) and AUTH_TOKEN_COOKIE in cookie_string)
+        check("Cookie 文件已保存", os.path.exists(jar_path))
+
+        reloaded = CookieStore(jar_path)
+        check("重新读取 Cookie 文件", reloaded.as_dict() == store.as_dict() and bool(store.as_dict()))
+        check("p_auth_token 未过期", (reloaded.expiry() or 0) > time.time())
+
+        # 登录后跳转到 /space/ 时已经续期过一次
+        renewals = server.stats["renewals"]
+        renewed = reloaded.renew(requests.Session(), url=f"{base_url}/space/")
+        check("HTTP 续期", renewed and server.stats["renewals"] == renewals + 1)
+        check("续期后的 Cookie 写回文件", CookieStore(jar_path).as_dict() == reloaded.as_dict())
+
+        logged_out = CookieStore(os.path.join(save_dir, "empty.lwp"))
+        check("未登录时续期失败", not logged_out.renew(requests.Session(), url=f"{base_url}/space/"))
+    finally:
+        server.shutdown()
+        shutil.rmtree(save_dir, ignore_errors=True)
+    return all(results)
+
+
+def lease_and_crash(path, visibility_timeout):
+    """在子进程中租用一个任务后直接退出，模拟执行中崩溃的工作节点"""
+    broker = SqliteBroker(path, visibility_timeout=visibility_timeout)
+    broker.lease("crashed-node")
+    os._exit(1)
+
+
+def run_queue_check(args):
+    """
+    检查 SQLite 任务队列：租用中的任务不会分给其他节点，工作进程崩溃后租约到期重新分配，
+    旧租约不能再确认，超过最大尝试次数的任务进入 dead。返回是否全部通过
+    """
+    queue_dir = tempfile.mkdtemp(prefix="chaoxing_queue_")
+    path = os.path.join(queue_dir, "queue.db")
+    timeout = 0.5
+    results = []
+
+    def check(name, ok):
+        results.append(ok)
+        print(f"{'✓' if ok else '✗'} {name}")
+
+    broker = SqliteBroker(path, visibility_timeout=timeout, max_attempts=2)
+    try:
+        journal_mode = broker.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        check("使用回滚日志（不用 WAL）", journal_mode.lower() == "delete")
+        check(
+            "放入任务并按 key 去重",
+            broker.put({"n": 1}, key="a") and broker.put({"n": 2}, key="b")
+            and not broker.put({"n": 1}, key="a"),
+        )
+
+        crashed = multiprocessing.Process(target=lease_and_crash, args=(path, timeout))
+        crashed.start()
+        crashed.join()
+        leased = broker.lease("node-1")
+        check("崩溃节点租用中的任务不会分给其他节点", [t.payload["n"] for t in leased] == [2])
+        broker.ack(leased[0])
+
+        time.sleep(timeout + 0.1)
+        redelivered = broker.lease("node-1")
+        check(
+            "租约到期后重新分配",
+            [(t.payload["n"], t.attempts) for t in redelivered] == [(1, 2)],
+        )
+        stale = redelivered[0]
+        time.sleep(timeout + 0.1)
+        check(
+            "最后一次尝试的租约到期后进入 dead",
+            broker.lease("node-2") == [] and broker.stats()[STATUS_DEAD] == 1,
+        )
+        check("进入 dead 后旧租约不能延长或确认", not broker.extend(stale) and not broker.ack(stale))
+
+        broker.put({"n": 3}, key="c")
+        task = broker.lease("node-1")[0]
+        broker.nack(task, delay=timeout, error="测试失败")
+        check("nack 后在 delay 内不可见", broker.lease("node-1") == [])
+        time.sleep(timeout + 0.1)
+        task = broker.lease("node-1")[0]
+        broker.nack(task, error="测试失败")
+        stats = broker.stats()
+        check("达到最大尝试次数的 nack 进入 dead", stats[STATUS_DEAD] == 2 and stats["done"] == 1)
+    finally:
+        broker.close()
+        shutil.rmtree(queue_dir, ignore_errors=True)
+    return all(results)
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块, 自身耗时ms, 累计耗时ms, 缩进层级)]"""
+    modules = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append((name, int(own) / 1000, int(cumulative) / 1000, len(indent) // 2))
+    return modules
+
+
+def measure_first_window(gui_path):
+    """启动 gui.py 到窗口第一次绘制完成的耗时(秒)，没有图形界面时返回 (None, 错误信息)"""
+    env = dict(os.environ, CHAOXING_STARTUP_PROBE="1")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, gui_path], env=env, capture_output=True, text=True, timeout=60
+    )
+    elapsed = time.perf_counter() - start
+    if "window ready" not in result.stdout:
+        lines = result.stderr.strip().splitlines()
+        return None, lines[-1] if lines else f"退出码 {result.returncode}"
+    return elapsed, None
+
+
+def run_startup_check(args):
+    gui_dir = os.path.dirname(os.path.abspath(__file__))
+    import_times = []
+    modules = []
+    for _ in range(args.rounds):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import gui"],
+            cwd=gui_dir,
+            capture_output=True,
+            text=True,
+        )
+        modules = parse_importtime(result.stderr)
+        total = next((m for m in modules if m[0] == "gui" and m[3] == 0), None)
+        if result.returncode or total is None:
+            print(f"导入 gui 失败: {result.stderr.strip().splitlines()[-1:]}")
+            return
+        import_times.append(total[2])
+
+    window_times = []
+    error = None
+    for _ in range(args.rounds):
+        elapsed, error = measure_first_window(os.path.join(gui_dir, "gui.py"))
+        if elapsed is None:
+            break
+        window_times.append(elapsed * 1000)
+
+    import_ms = percentile(import_times, 50)
+    print(f"import gui: 中位数 {import_ms:.1f} ms（{args.rounds} 次，最快 {min(import_times):.1f} ms）")
+    print("  耗时最多的直接依赖:")
+    # 子模块的行在父模块之前输出：gui 之前、上一个顶层模块之后的一级模块是 gui 的直接依赖
+    end = max(i for i, m in enumerate(modules) if m[0] == "gui" and m[3] == 0)
+    begin = max((i for i, m in enumerate(modules[:end]) if m[3] == 0), default=-1) + 1
+    direct = sorted((m for m in modules[begin:end] if m[3] == 1), key=lambda m: -m[2])
+    for name, _, cumulative, _ in direct[:8]:
+        print(f"    {name:<28} {cumulative:8.1f} ms")
+    if window_times:
+        first_window_ms = percentile(window_times, 50)
+        print(f"窗口首次显示: 中位数 {first_window_ms:.1f} ms（最快 {min(window_times):.1f} ms）")
+    else:
+        first_window_ms = None
+        print(f"窗口首次显示: 无法测量（{error}）")
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "mode": "startup",
+        "scenario": {"rounds": args.rounds},
+        "import_ms": round(import_ms, 2),
+        "first_window_ms": round(first_window_ms, 2) if first_window_ms else None,
+    }
+    if args.compare:
+        baseline = find_baseline(load_records(args.output), record)
+        if baseline:
+            print_comparison(baseline, record, STARTUP_FIELDS)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"结果已追加到: {args.output}")
+
+
+def load_records(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def find_baseline(records, record):
+    """找到同一模式、同一参数下最近一次的结果"""
+    for previous in reversed(records):
+        if previous["mode"] == record["mode"] and previous["scenario"] == record["scenario"]:
+            return previous
+    return None
+
+
+# 对比的字段及是否越大越好
+E2E_FIELDS = (
+    ("images_per_s", True),
+    ("mb_per_s", True),
+    ("latency_p99_ms", False),
+    ("peak_rss_mb", False),
+)
+STARTUP_FIELDS = (("import_ms", False), ("first_window_ms", False))
+
+
+def print_comparison(baseline, record, fields=E2E_FIELDS):
+    for field, higher_is_better in fields:
+        old, new = baseline.get(field), record.get(field)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = change < 0 if higher_is_better else change > 0
+        mark = "⚠️ 退化" if worse and abs(change) > 10 else ""
+        print(f"    {field}: {old} → {new} ({change:+.1f}%) {mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="学习通图片下载基准测试")
+    parser.add_argument("--pages", type=int, default=60, help="图片数量")
+    parser.add_argument("--latency", type=float, default=0.05, help="服务器响应延迟(秒)")
+    parser.add_argument("--size", type=int, default=200_000, help="单张图片字节数")
+    parser.add_argument("--workers", type=int, default=8, help="并发线程数")
+    parser.add_argument("--resume", action="store_true", help="测试断点续传")
+    parser.add_argument("--extract", action="store_true", help="测试图片URL提取速度")
+    parser.add_argument("--filler-kb", type=int, default=4, help="每页正文大小(KB)")
+    parser.add_argument("--rounds", type=int, default=5, help="提取测试 / 启动测试重复次数")
+    parser.add_argument("--e2e", action="store_true", help="端到端爬取测试")
+    parser.add_argument("--throttle", type=int, default=0, help="限流测试: 服务器的并发上限")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="图片请求失败概率")
+    parser.add_argument("--output", default="bench_results.jsonl", help="端到端结果文件")
+    parser.add_argument("--compare", action="store_true", help="与上次同参数结果对比")
+    parser.add_argument("--startup", action="store_true", help="gui.py 冷启动耗时测试")
+    parser.add_argument("--cookies", action="store_true", help="Cookie 获取、保存和续期检查")
+    parser.add_argument("--queue", action="store_true", help="任务队列租约与重新分配检查")
+    parser.add_argument("--shard", type=int, default=0, help="多进程分片测试: 进程数")
+    parser.add_argument("--chapters", type=int, default=16, help="分片测试的章节数")
+    args = parser.parse_args()
+
+    if args.e2e:
+        run_e2e(args)
+        return
+
+    if args.extract:
+        run_extract_benchmark(args.pages, args.filler_kb, args.rounds)
+        return
+
+    if args.resume:
+        run_resume_check(args.pages, args.size, args.workers)
+        return
+
+    if args.shard:
+        run_shard_check(args)
+        return
+
+    if args.startup:
+        run_startup_check(args)
+        return
+
+    if args.cookies:
+        sys.exit(0 if run_cookie_check(args) else 1)
+
+    if args.queue:
+        sys.exit(0 if run_queue_check(args) else 1)
+
+    if args.throttle:
+        run_throttle_check(args.pages, args.size, args.latency, args.workers, args.throttle)
+        return
+
+    server, base_url = start_server(latency=args.latency, image_size=args.size)
+    try:
+        serial_time, serial_ok = run_download(base_url, args.pages, 1)
+        pool_time, pool_ok = run_download(base_url, args.pages, args.workers)
+        async_result = None
+        if aiohttp is not None:
+            async_result = run_download(base_url, args.pages, args.workers, "async")
+    finally:
+        server.shutdown()
+
+    print(f"图片数量: {args.pages}, 延迟: {args.latency}s, 大小: {args.size} 字节")
+    print(f"串行下载:   {serial_time:.2f}s (成功 {serial_ok}/{args.pages})")
+    print(f"并发下载x{args.workers}: {pool_time:.2f}s (成功 {pool_ok}/{args.pages})")
+    if async_result:
+        async_time, async_ok = async_result
+        print(f"异步引擎x{args.workers}: {async_time:.2f}s (成功 {async_ok}/{args.pages})")
+    # 旧版串行循环每张图片后固定 sleep(0.5)
+    legacy_time = serial_time + 0.5 * args.pages
+    print(f"旧版串行(含0.5s间隔)估算: {legacy_time:.2f}s")
+    print(f"加速比: {serial_time / pool_time:.1f}x (相对旧版 {legacy_time / pool_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
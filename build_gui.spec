@@ -1,7 +1,12 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
 block_cipher = None
 
+# 默认打包为单个 exe，每次启动都要先把全部文件解压到临时目录；
+# 设置环境变量 CHAOXING_ONEDIR=1 时打包为目录（dist/学习通图片爬取工具/），启动时直接加载，冷启动更快
+ONEDIR = os.environ.get('CHAOXING_ONEDIR') == '1'
+
 a = Analysis(
     ['gui.py'],
     pathex=[],
@@ -29,6 +34,8 @@ a.datas = [x for x in a.datas if not any([
     'build.spec' in x[0],
     'saved_cookie.json' in x[0],
     'saved_cookies.json' in x[0],
+    'cookies.lwp' in x[0],
+    'cookie_validity.json' in x[0],
     'gui_settings.json' in x[0],
     'cyforkk.bat' in x[0],
     'cyforkk.ps1' in x[0],
@@ -44,10 +51,9 @@ pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
+    *([] if ONEDIR else [a.binaries, a.zipfiles, a.datas]),
     [],
+    exclude_binaries=ONEDIR,
     name='学习通图片爬取工具',
     debug=False,
     bootloader_ignore_signals=False,
@@ -63,3 +69,15 @@ exe = EXE(
     entitlements_file=None,
     icon='鲸鱼.ico',  # 设置程序图标
 )
+
+if ONEDIR:
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        strip=False,
+        upx=False,  # UPX 压缩的 DLL 每次加载都要解压，目录模式下不压缩
+        upx_exclude=[],
+        name='学习通图片爬取工具',
+    )
@@ -1,18 +1,203 @@
 import requests
 import re
 import os
-from urllib.parse import urljoin
+import asyncio
+import functools
+import json
+import threading
 import time
+from contextlib import nullcontext
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from cookie_store import is_login_response
+from crawl_metrics import METRICS_FILENAME, CrawlMetrics
+from download_manifest import DownloadManifest, file_sha256
+from flow_control import (
+    AdaptiveLimiter,
+    CircuitBreakers,
+    RequestSlot,
+    RetryPolicy,
+    is_retryable,
+)
+from homework_parser import HomeworkPageParser
+from http_cache import HttpCache
+from pdf_writer import PdfBook
+from postprocess import PostProcessor, create_stages
+from transport import DEFAULT_POOL_SIZE, create_session
+
+# 并发下载线程数，ananas 图片服务器在 8 个并发左右吞吐最好且不易被限流
+DEFAULT_MAX_WORKERS = 8
+# 自适应并发的初始值，之后在 1 ~ max_workers 之间根据服务器响应调整
+ADAPTIVE_INITIAL_LIMIT = 4
+# 流式下载的分块大小，单个下载占用的内存不超过这个值
+CHUNK_SIZE = 64 * 1024
+# 请求失败（连接错误、超时、429/5xx、传输中断）时包括第一次在内的最多尝试次数
+RETRY_ATTEMPTS = 4
+
+# extract_images 使用的预编译正则: (锚点子串, 正则)，页面不含锚点时跳过这次扫描
+IMAGE_PATTERNS = [
+    ('src="', re.compile(r'<img[^>]+src="([^"]+)"')),
+    ("src='", re.compile(r"<img[^>]+src='([^']+)'")),
+    ('"url":"', re.compile(r'"url":"([^"]+\.jpg[^"]*)"')),
+    ('"url":"', re.compile(r'"url":"([^"]+\.png[^"]*)"')),
+    ('"orig":"', re.compile(r'"orig":"([^"]+)"')),
+    ("background-image", re.compile(r'background-image:\s*url\(["\']?([^)"\']+)["\']?\)')),
+]
+# 页面中的裸 URL，ananas、/sv-w8/ 和 sN.ananas 三类链接都在这一次扫描里判断
+URL_TOKEN_PATTERN = re.compile(r'(https?://)[^"\'>\s]+')
+# sN.ananas 链接的停止字符比裸 URL 多，匹配一定落在某个裸 URL 之内，只需在这些裸 URL 里查找
+ANANAS_HOST_PATTERN = re.compile(r'https://s[0-9]\.ananas\.chaoxing\.com[^\s"\'<>]+')
+# sN.ananas 是同一图片服务器的镜像，路径相同即为同一张图片
+ANANAS_MIRROR_PATTERN = re.compile(r"^https?://s[0-9]+\.ananas\.chaoxing\.com/")
+
+
+# 单张图片的下载结果: 首次成功 / 重试后成功 / 失败 / 图片服务器熔断未下载
+OUTCOME_STATUSES = ("ok", "retried", "failed", "circuit_open")
+
+
+class IncompleteDownloadError(requests.ConnectionError):
+    """响应体比 Content-Length 短，.part 文件保留用于续传"""
+
+
+class CookieExpiredError(Exception):
+    """页面请求被重定向到登录页，Cookie 已失效"""
+
+
+def canonical_image_url(img_url):
+    """
+    判断两个图片URL是否为同一资源用的键，只合并 sN.ananas 镜像：
+    orig 与 /sv-w8/ 是不同尺寸的版本，查询参数可能是签名或尺寸，都不合并，由内容哈希去重
+    """
+    return ANANAS_MIRROR_PATTERN.sub("https://ananas.chaoxing.com/", img_url)
+
+
+def crawl_entry(crawl):
+    """
+    爬取入口的装饰器：清空上次爬取的重试/失败记录并统计整次爬取耗时，
+    结束后（包括失败时）汇报重试与失败情况并导出指标。
+    爬取期间 self.metrics 换成本次爬取单独的实例，同时计入原来的（可能由多个任务共用的）实例
+    """
+
+    @functools.wraps(crawl)
+    def wrapper(self, course_url, save_dir="images"):
+        self.reset_outcomes()
+        self.progress("start")
+        success = False
+        aggregate = self.metrics
+        self.metrics = CrawlMetrics(parent=aggregate)
+        temporary_engine = self.start_async_engine()
+        try:
+            with self.metrics.phase("crawl"):
+                success = crawl(self, course_url, save_dir)
+                return success
+        finally:
+            # 后处理完成后才能确定 PDF 是否收齐页面
+            self.wait_postprocessing()
+            if temporary_engine:
+                self.close_async_engine()
+            if self.owns_postprocessor:
+                self.postprocessor.shutdown()
+            self.abort_pdf_books()
+            self.report_outcomes()
+            self.export_metrics(os.path.abspath(save_dir), aggregate)
+            self.metrics = aggregate
+            self.progress("finish", success=bool(success))
+
+    return wrapper
 
 
 class ChaoxingImageCrawler:
-    def __init__(self, cookies):
-        self.session = requests.Session()
+    # 课程接口和文档预览的站点地址，本地模拟服务器（stub_server.py）测试时可替换
+    MOOC_BASE_URL = "https://mooc1.chaoxing.com"
+    PAN_BASE_URL = "https://pan-yz.chaoxing.com"
+
+    def __init__(
+        self,
+        cookies,
+        max_workers=DEFAULT_MAX_WORKERS,
+        engine=None,
+        use_manifest=True,
+        use_http_cache=True,
+        metrics_textfile=None,
+        adaptive=True,
+        retry=None,
+        session=None,
+        http2=False,
+        pdf=False,
+        postprocessor=None,
+    ):
+        self.max_workers = max(1, int(max_workers))
+        # 每个保存目录一个下载清单，重新爬取时跳过已完成的图片
+        self.use_manifest = use_manifest
+        self.manifests = {}
+        # 卡片API、预览页面的条件请求缓存，页面未变化时服务器只返回 304
+        self.use_http_cache = use_http_cache
+        self.http_caches = {}
+        # 内容哈希 -> 已保存文件，相同内容的图片只保存一份
+        self.content_index = {}
+        self.file_hashes = {}
+        self.store_lock = threading.Lock()
+        # 图片（见 canonical_image_url）-> (已保存文件, 内容哈希)，同一图片只请求一次；
+        # 正在下载的图片 -> Future，之后提交的相同图片等它完成后直接链接
+        self.url_downloads = {}
+        self.pending_urls = {}
+        # 课程图片同时按页码顺序合成每个文档（objectid）的 PDF，边下载边写入；
+        # 未指定时读取环境变量 CHAOXING_PDF=1
+        self.pdf = pdf or os.environ.get("CHAOXING_PDF") == "1"
+        self.pdf_books = {}
+        self.pdf_lock = threading.Lock()
+        # 下载后的处理阶段（见 postprocess.py）在进程池中执行，多个爬虫可以共用一个 PostProcessor；
+        # 未指定时读取环境变量 CHAOXING_POSTPROCESS（如 "recompress,thumbnail:256"），
+        # 自己创建的进程池在每次爬取结束时关闭
+        self.postprocessor = postprocessor
+        self.owns_postprocessor = False
+        if postprocessor is None and os.environ.get("CHAOXING_POSTPROCESS"):
+            self.postprocessor = PostProcessor(create_stages(os.environ["CHAOXING_POSTPROCESS"]))
+            self.owns_postprocessor = True
+        # 文件路径 -> 后处理完成的 Future，写入下载清单前等待
+        self.post_futures = {}
+        self.post_lock = threading.Lock()
+        # 网络引擎: "thread" 线程池 / "async" asyncio 事件循环（需要 aiohttp）
+        # 未指定时读取环境变量 CHAOXING_ENGINE，GUI 和 main() 无需改代码即可切换；
+        # async 时每次爬取期间页面和图片请求都交给 async_engine（见 async_crawler.py）
+        self.engine = engine or os.environ.get("CHAOXING_ENGINE", "thread")
+        self.async_engine = None
+        # 各阶段的次数、字节数和耗时，爬取结束后写入保存目录的 .chaoxing_metrics.json；
+        # 指定 metrics_textfile（或环境变量 CHAOXING_METRICS_TEXTFILE）时同时导出 Prometheus 格式
+        self.metrics = CrawlMetrics()
+        self.metrics_textfile = metrics_textfile or os.environ.get("CHAOXING_METRICS_TEXTFILE")
+        # 图片请求的并发数在 max_workers 以内自适应：正常时逐步增加，被限流时立即减半
+        # adaptive=False 时固定使用 max_workers 个并发
+        self.limiter = None
+        if adaptive:
+            self.limiter = AdaptiveLimiter(
+                initial=min(ADAPTIVE_INITIAL_LIMIT, self.max_workers),
+                max_limit=self.max_workers,
+                on_change=self.on_limit_change,
+            )
+        # 失败请求按指数退避重试；图片服务器按主机熔断，故障镜像的图片直接失败而不占用线程
+        self.retry = retry or RetryPolicy(RETRY_ATTEMPTS)
+        self.breakers = CircuitBreakers()
+        self.reset_outcomes()
+        # 按主机配置连接池的 Session（见 transport.py），连接池不小于下载并发数，连接始终复用；
+        # 传入 session 时沿用调用方已经建立的连接（例如 GUI 验证 Cookie 时的连接）
+        # http2 未指定时读取环境变量 CHAOXING_HTTP2=1，图片服务器改用 HTTP/2（需要 httpx[http2]）
+        http2 = http2 or os.environ.get("CHAOXING_HTTP2") == "1"
+        self.session = session or create_session(
+            pool_size=max(DEFAULT_POOL_SIZE, self.max_workers), http2=http2
+        )
         self.session.cookies.update(cookies)
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
         }
         self.log_callback = None
+        self.progress_callback = None
+        # 第一个页面请求的响应即可说明 Cookie 是否有效：None 未知，True 有效，False 已失效
+        self.cookie_valid = None
+        # 章节ID -> 保存文件用的章节名称，代替卡片API中的名称；
+        # 整门课程拆分为逐章节任务时（见 cli.py），同名章节的名称由拆分时确定
+        self.chapter_names = {}
 
     def log(self, message):
         if self.log_callback:
@@ -20,6 +205,110 @@ class ChaoxingImageCrawler:
         else:
             print(message)
 
+    def progress(self, event, **fields):
+        """
+        发送结构化的进度事件 progress_callback(event, fields)，可能在下载线程中调用:
+            start / finish(success)        一次爬取开始和结束
+            planned(images, skipped)       找到的图片数和其中清单里已完成的数量
+            image(outcome)                 一张图片下载结束，outcome 为 OUTCOME_STATUSES 之一
+            bytes(n)                       收到 n 字节图片数据
+            retry(kind)                    页面或图片请求将要重试
+        """
+        if self.progress_callback:
+            self.progress_callback(event, fields)
+
+    def on_limit_change(self, limit, reason):
+        self.metrics.inc("throttled")
+        self.log(f"⚠️ 服务器限流或变慢（{reason}），并发数降至 {limit}")
+
+    def request_slot(self):
+        """图片请求的并发额度，未启用自适应并发时不限制"""
+        return self.limiter.slot() if self.limiter else nullcontext(RequestSlot())
+
+    def start_async_engine(self):
+        """
+        engine="async" 且异步引擎还没有运行时启动它，返回是否由这次调用启动；
+        未安装 aiohttp 时改用线程池
+        """
+        if self.engine != "async" or self.async_engine is not None:
+            return False
+        from async_crawler import AsyncChaoxingImageCrawler, aiohttp
+
+        if aiohttp is None:
+            self.log("⚠️ 未安装 aiohttp，改用线程池")
+            self.engine = "thread"
+            return False
+        self.async_engine = AsyncChaoxingImageCrawler(
+            self.session.cookies.get_dict(), concurrency=self.max_workers, crawler=self
+        ).start()
+        return True
+
+    def close_async_engine(self):
+        engine, self.async_engine = self.async_engine, None
+        if engine is not None:
+            engine.close()
+
+    def http_client(self):
+        """页面请求用的客户端：异步引擎运行时为它（get 的用法与 requests.Session 相同），否则为 self.session"""
+        return self.async_engine or self.session
+
+    def with_retry(self, send, description, phase="page"):
+        """
+        发送页面请求，连接错误、超时或可重试的状态码按 self.retry 退避后重试
+
+        Args:
+            send: 发送请求并返回 response 的函数
+            description: 日志中的页面名称
+        """
+        for attempt in range(1, self.retry.attempts + 1):
+            try:
+                response = send()
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            status = response.status_code if response is not None else None
+            if response is not None and is_login_response(response):
+                self.cookie_valid = False
+                raise CookieExpiredError(f"{description}请求被重定向到登录页，Cookie 已失效")
+            if status == 200 and self.cookie_valid is None:
+                self.cookie_valid = True
+            if not is_retryable(status) or attempt == self.retry.attempts:
+                if attempt > 1 and status == 200:
+                    self.outcomes["retried_pages"].append(description)
+                if error is not None:
+                    raise error
+                return response
+
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            delay = self.retry.delay(attempt, retry_after)
+            reason = f"状态码 {status}" if error is None else error
+            self.metrics.inc("retries", kind=phase)
+            self.progress("retry", kind=phase)
+            self.log(f"{description}请求失败（{reason}），{delay:.1f}s 后重试")
+            time.sleep(delay)
+
+    def reset_outcomes(self):
+        """清空各图片结果的文件名列表、清单中已完成而跳过的图片和经重试成功的页面列表"""
+        self.outcomes = {status: [] for status in OUTCOME_STATUSES}
+        self.outcomes["skipped"] = []
+        self.outcomes["retried_pages"] = []
+
+    def report_outcomes(self):
+        """爬取结束时分别汇报重试后成功、失败和熔断跳过的图片"""
+        retried_pages = self.outcomes["retried_pages"]
+        if retried_pages:
+            self.log(f"🔁 {len(retried_pages)} 个页面请求经重试后成功: {'、'.join(retried_pages)}")
+        retried = self.outcomes["retried"]
+        if retried:
+            self.log(f"🔁 {len(retried)} 张图片经重试后下载成功")
+        failed = self.outcomes["failed"]
+        if failed:
+            names = "、".join(failed[:10]) + (" 等" if len(failed) > 10 else "")
+            self.log(f"✗ {len(failed)} 张图片下载失败: {names}")
+        skipped = self.outcomes["circuit_open"]
+        if skipped:
+            self.log(f"⛔ {len(skipped)} 张图片因图片服务器熔断未下载，稍后重新爬取即可补全")
+
     def get_course_content(self, url):
         try:
             response = self.session.get(url, headers=self.headers)
@@ -30,54 +319,784 @@ class ChaoxingImageCrawler:
             return None
 
     def extract_images(self, html):
-        images = []
+        """按页面顺序提取课件图片URL（已去重）"""
+        # 结果必须包含其中一个标记，两个都没有时整页都不用扫描
+        if "/sv-w8/doc/" not in html and "ananas.chaoxing.com" not in html:
+            return []
+
+        def wanted(match):
+            return (
+                match
+                and not match.startswith("data:")
+                and ("/sv-w8/doc/" in match or "ananas.chaoxing.com" in match)
+            )
+
+        found = []
+        for anchor, pattern in IMAGE_PATTERNS:
+            if anchor in html:
+                found.extend(
+                    (m.start(1), m.group(1))
+                    for m in pattern.finditer(html)
+                    if wanted(m.group(1))
+                )
+
+        for m in URL_TOKEN_PATTERN.finditer(html):
+            token = m.group(0)
+            # 等价于 https?://[^"'>\s]+ananas[^"'>\s]+ 和 .../sv-w8/... 两个正则：
+            # 标记前后至少各有一个字符
+            start, end = len(m.group(1)) + 1, len(token) - 1
+            if (
+                token.find("ananas", start, end) != -1
+                or token.find("/sv-w8/", start, end) != -1
+            ) and wanted(token):
+                found.append((m.start(), token))
+            if "https://s" in token:
+                found.extend(
+                    (host.start(), host.group(0))
+                    for host in ANANAS_HOST_PATTERN.finditer(html, m.start(), m.end())
+                    if wanted(host.group(0))
+                )
+
+        found.sort()
+        images = [match for _, match in found]
+
+        # 保序去重，保证每次运行的页码序号一致
+        return list(dict.fromkeys(images))
+
+    def build_image_path(self, img_url, save_dir, course_name, chapter_name, index):
+        """补全图片URL并生成保存文件名，返回 (img_url, filename, filepath)"""
+        if not img_url.startswith("http"):
+            img_url = urljoin(self.MOOC_BASE_URL + "/", img_url)
+
+        ext = os.path.splitext(img_url.split("?")[0])[1] or ".png"
+        filename = f"{course_name}-{chapter_name}-{index}{ext}"
+        filename = re.sub(r'[<>:"/\\|?*]', "_", filename)
+
+        return img_url, filename, os.path.join(save_dir, filename)
+
+    def load_part_meta(self, meta_path, img_url):
+        """读取 .part 文件的续传信息，URL 不一致或文件损坏时返回 None"""
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("url") == img_url else None
+
+    def part_request_headers(self, img_url, part_path):
+        """
+        请求图片用的请求头：已有 .part 文件和续传信息时用 Range 只请求剩下的部分
+
+        Returns:
+            (请求头, 续传信息或 None, 已下载的字节数)
+        """
+        meta = self.load_part_meta(part_path + ".json", img_url)
+        offset = os.path.getsize(part_path) if meta and os.path.exists(part_path) else 0
+
+        headers = dict(self.headers)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            validator = meta.get("etag") or meta.get("last_modified")
+            if validator:
+                headers["If-Range"] = validator
+        return headers, meta, offset
+
+    def open_part(self, img_url, part_path, status, headers, meta, offset):
+        """
+        按响应的状态码和响应头决定怎样写入 .part 文件，同步和异步引擎共用
+
+        Returns:
+            (写入方式, 完整长度)，写入方式为:
+            "ab" 续传 / "wb" 从头写入（已写好 .part.json）/ "done" 上次已经下载完整 /
+            "restart" 已丢弃 .part 文件，需要从头重新请求 / None 无法下载
+        """
+        if status == 416 and offset:
+            if offset == meta.get("length"):
+                # 上次已经下载完整，只是没来得及重命名
+                return "done", offset
+            # 续传的起点超出了文件（例如服务器上的文件变短了且没有校验信息），
+            # 不删除的话每次重试和重新爬取都会发送同样的 Range 而失败
+            self.discard_part(part_path)
+            return "restart", None
+
+        etag = headers.get("ETag")
+        # 只有请求了 Range（offset > 0，此时一定有续传信息）时 206 才是续传的响应
+        if status == 206 and offset and etag and etag != meta.get("etag"):
+            # 续传得到的是另一个版本的文件，丢弃 .part 后从头下载
+            os.remove(part_path)
+            return "restart", None
+        if status == 206 and offset:
+            range_match = re.search(r"/(\d+)$", headers.get("Content-Range", ""))
+            length = int(range_match.group(1)) if range_match else meta.get("length")
+            return "ab", length
+        if status != 200:
+            return None, None
+
+        # 服务器不支持续传或文件已变化，从头下载
+        encoded = headers.get("Content-Encoding", "identity") != "identity"
+        content_length = headers.get("Content-Length")
+        length = int(content_length) if content_length and not encoded else None
+        with open(part_path + ".json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "url": img_url,
+                    "etag": etag,
+                    "last_modified": headers.get("Last-Modified"),
+                    "length": length,
+                },
+                f,
+            )
+        return "wb", length
+
+    def discard_part(self, part_path):
+        """删除 .part 文件和续传信息，下次从头下载"""
+        for path in (part_path, part_path + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def check_part_size(self, part_path, length):
+        """.part 文件比完整长度短时抛出 IncompleteDownloadError 触发续传"""
+        size = os.path.getsize(part_path)
+        if length is not None and size < length:
+            raise IncompleteDownloadError(f"只收到 {size}/{length} 字节")
+        if length is not None and size > length:
+            # 内容与续传信息不符，丢弃后下次从头下载
+            os.remove(part_path)
+            raise IncompleteDownloadError(f"文件大小 {size} 超过 {length} 字节")
 
-        img_patterns = [
-            r'<img[^>]+src="([^"]+)"',
-            r"<img[^>]+src=\'([^\']+)\'",
-            r'"url":"([^"]+\.jpg[^"]*)"',
-            r'"url":"([^"]+\.png[^"]*)"',
-            r'"orig":"([^"]+)"',
-            r'background-image:\s*url\(["\']?([^)"\']+)["\']?\)',
-            r'https?://[^"\'>\s]+ananas[^"\'>\s]+',
-            r'https?://[^"\'>\s]+/sv-w8/[^"\'>\s]+',
-            r'https://s[0-9]\.ananas\.chaoxing\.com[^\s"\'<>]+',
-        ]
-
-        for pattern in img_patterns:
-            matches = re.findall(pattern, html)
-            for match in matches:
-                if match and not match.startswith("data:"):
-                    if "/sv-w8/doc/" in match or "ananas.chaoxing.com" in match:
-                        images.append(match)
-
-        return list(set(images))
+    def fetch_part(self, img_url, part_path, slot=None):
+        """
+        把图片下载到 .part 文件，服务器支持时用 Range 请求断点续传
+
+        Args:
+            slot: RequestSlot，用于把状态码和 Retry-After 反馈给并发控制
+
+        Returns:
+            int: 状态码，200 表示 .part 文件已完整
+        """
+        headers, meta, offset = self.part_request_headers(img_url, part_path)
+        response = self.session.get(img_url, headers=headers, timeout=10, stream=True)
+        with response:
+            status = response.status_code
+            if slot is not None:
+                slot.status = status
+                slot.retry_after = response.headers.get("Retry-After")
+            mode, length = self.open_part(
+                img_url, part_path, status, response.headers, meta, offset
+            )
+            if mode == "restart":
+                return self.fetch_part(img_url, part_path, slot)
+            if mode == "done":
+                return 200
+            if mode is None:
+                return status
+
+            # 连接中断时保留已收到的字节，由下面的长度检查触发续传
+            response.raw.enforce_content_length = False
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    self.metrics.inc("bytes", len(chunk), kind="image")
+                    self.progress("bytes", n=len(chunk))
+
+        self.check_part_size(part_path, length)
+        return 200
 
     def download_image(self, img_url, save_dir, course_name, chapter_name, index):
+        with self.metrics.phase("image"):
+            outcome, filename = self.fetch_image(
+                img_url, save_dir, course_name, chapter_name, index
+            )
+        self.metrics.inc("images", status=outcome)
+        self.outcomes[outcome].append(filename)
+        self.progress("image", outcome=outcome)
+        ok = outcome in ("ok", "retried")
+        self.image_saved(save_dir, course_name, chapter_name, index, filename if ok else None)
+        return ok
+
+    def fetch_image(self, img_url, save_dir, course_name, chapter_name, index):
+        """
+        下载一张图片并保存，可重试的失败按 self.retry 退避后重试
+
+        Returns:
+            (结果, 文件名)，结果为 OUTCOME_STATUSES 之一
+        """
+        filename = img_url
         try:
-            if not img_url.startswith("http"):
-                img_url = urljoin("https://mooc1.chaoxing.com/", img_url)
-
-            ext = os.path.splitext(img_url.split("?")[0])[1] or ".png"
-            filename = f"{course_name}-{chapter_name}-{index}{ext}"
-            filename = re.sub(r'[<>:"/\\|?*]', "_", filename)
-
-            filepath = os.path.join(save_dir, filename)
-
-            response = self.session.get(img_url, headers=self.headers, timeout=10)
-            if response.status_code == 200:
-                with open(filepath, "wb") as f:
-                    f.write(response.content)
-                self.log(f"下载成功: {filename}")
-                self.log(f"保存路径: {filepath}")
-                return True
-            else:
-                self.log(f"下载失败: {img_url} (状态码: {response.status_code})")
-                return False
+            img_url, filename, filepath = self.build_image_path(
+                img_url, save_dir, course_name, chapter_name, index
+            )
+            if self.reuse_download(img_url, filepath):
+                self.log(f"相同图片已经下载，未重复请求: {filename}")
+                return "ok", filename
+            part_path = filepath + ".part"
+            host = urlparse(img_url).netloc
+            breaker = self.breakers.get(host)
+
+            attempt = 0
+            while True:
+                attempt += 1
+                if not breaker.allow():
+                    self.log(f"⛔ 图片服务器 {host} 熔断中，跳过: {filename}")
+                    return "circuit_open", filename
+
+                status = error = retry_after = None
+                try:
+                    with self.request_slot() as slot:
+                        status = self.fetch_part(img_url, part_path, slot)
+                    retry_after = slot.retry_after
+                except (
+                    requests.ConnectionError,
+                    requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError,
+                ) as e:
+                    error = e
+
+                # 传输中断时服务器已经响应过，只需续传，不算主机故障
+                resumable = isinstance(error, IncompleteDownloadError)
+                if (error is not None and not resumable) or (status or 0) >= 500:
+                    if breaker.record_failure():
+                        self.metrics.inc("circuit_opened")
+                        self.log(
+                            f"⛔ 图片服务器 {host} 连续失败，{breaker.reset_timeout:.0f}s 内不再向其请求"
+                        )
+                else:
+                    # 服务器有响应（包括 404、429），主机本身没有故障，限流交给并发控制处理
+                    breaker.record_success()
+                if error is None and (status == 200 or not is_retryable(status)):
+                    break
+                if attempt >= self.retry.attempts:
+                    break
+
+                self.metrics.inc("retries", kind="image")
+                self.progress("retry", kind="image")
+                if resumable and os.path.exists(part_path):
+                    # 已收到的字节保留在 .part 文件中，立即续传
+                    self.metrics.inc("resumes")
+                    self.log(f"传输中断，断点续传: {filename} ({error})")
+                    continue
+                delay = self.retry.delay(attempt, retry_after)
+                reason = f"状态码 {status}" if error is None else error
+                self.log(f"下载失败（{reason}），{delay:.1f}s 后重试: {filename}")
+                time.sleep(delay)
+
+            if error is not None:
+                raise error
+            if status != 200:
+                self.log(f"下载失败: {img_url} (状态码: {status})")
+                return "failed", filename
+
+            self.store_file(part_path, filepath, img_url)
+            try:
+                os.remove(part_path + ".json")
+            except OSError:
+                pass
+            self.log(f"下载成功: {filename}")
+            self.log(f"保存路径: {filepath}")
+            return ("ok" if attempt == 1 else "retried"), filename
         except Exception as e:
             self.log(f"下载图片失败: {img_url}, 错误: {e}")
+            return "failed", filename
+
+    def has_content(self, filepath, sha256):
+        """文件存在且内容的哈希仍为 sha256（记录之后可能被后处理或用户改写）"""
+        try:
+            return file_sha256(filepath) == sha256
+        except OSError:
+            return False
+
+    def find_duplicate(self, sha256, filepath):
+        """查找内容相同的已保存文件（本次运行或下载清单中），没有时返回 None"""
+        candidates = [self.content_index.get(sha256)]
+        save_dir = os.path.dirname(filepath)
+        manifest = self.manifest_for(save_dir)
+        if manifest:
+            filename = manifest.find_by_hash(sha256)
+            if filename:
+                candidates.append(os.path.join(save_dir, filename))
+
+        for existing in candidates:
+            if not existing or existing == filepath:
+                continue
+            # 链接前重新计算哈希，索引和清单中的记录可能已经过时
+            if self.has_content(existing, sha256):
+                return existing
+            if self.content_index.get(sha256) == existing:
+                del self.content_index[sha256]
+        return None
+
+    def link_existing(self, existing, filepath):
+        """把 filepath 替换为 existing 的硬链接，文件系统不支持硬链接时返回 False"""
+        link_path = filepath + ".link"
+        try:
+            if os.path.exists(link_path):
+                os.remove(link_path)
+            os.link(existing, link_path)
+            os.replace(link_path, filepath)
+        except OSError:
             return False
+        self.metrics.inc("dedup_links")
+        self.log(f"内容重复，已硬链接到: {os.path.basename(existing)}")
+        return True
+
+    def store_file(self, part_path, filepath, img_url=None):
+        """
+        把完整的 .part 文件保存为 filepath
+        内容与已保存的文件相同时改为硬链接，相同内容只占一份存储
+        """
+        sha256 = file_sha256(part_path)
+        with self.store_lock:
+            existing = self.find_duplicate(sha256, filepath)
+            if existing and self.link_existing(existing, filepath):
+                os.remove(part_path)
+            else:
+                # 文件系统不支持硬链接时保留独立副本
+                os.replace(part_path, filepath)
+            self.content_index.setdefault(sha256, filepath)
+            self.file_hashes[filepath] = sha256
+            if img_url:
+                self.url_downloads[canonical_image_url(img_url)] = (filepath, sha256)
+
+    def reuse_download(self, img_url, filepath):
+        """
+        同一图片本次运行已经下载过、保存的文件也未被改写时直接硬链接为 filepath，
+        不再请求图片服务器；返回是否已链接
+        """
+        with self.store_lock:
+            entry = self.url_downloads.get(canonical_image_url(img_url))
+            if not entry:
+                return False
+            existing, sha256 = entry
+            if existing == filepath or not self.has_content(existing, sha256):
+                return False
+            if not self.link_existing(existing, filepath):
+                return False
+            self.file_hashes[filepath] = sha256
+            return True
+
+    def submit_downloads(self, executor, tasks, total, save_dir, course_name, chapter_name):
+        """
+        把 (序号, 图片URL) 任务交给下载引擎，返回与 tasks 一一对应的 Future 列表，结果为是否成功：
+        线程池引擎提交到 executor，异步引擎提交到它的事件循环（不占用 executor 的线程）
+
+        Args:
+            total: 图片总数，仅用于日志，未知时为 None
+        """
+        engine = self.async_engine
+
+        def download_one(i, img_url, leader):
+            position = f"{i}/{total}" if total else i
+            self.log(f"[{position}] 正在下载: {img_url[:70]}...")
+            if engine is not None:
+                return engine.submit(
+                    engine.download_image(
+                        img_url, save_dir, course_name, chapter_name, i, after=leader
+                    )
+                )
+            if leader is not None:
+                # 相同图片正在下载，等它完成后直接链接（见 reuse_download）；
+                # leader 比本任务先提交，不会出现相互等待
+                leader.result()
+            return self.download_image(img_url, save_dir, course_name, chapter_name, i)
+
+        def forget(key, future):
+            with self.store_lock:
+                if self.pending_urls.get(key) is future:
+                    del self.pending_urls[key]
+
+        futures = []
+        for i, img_url in tasks:
+            key = canonical_image_url(img_url)
+            with self.store_lock:
+                leader = self.pending_urls.get(key)
+            if engine is not None:
+                future = download_one(i, img_url, leader)
+            else:
+                future = executor.submit(download_one, i, img_url, leader)
+            if leader is None:
+                with self.store_lock:
+                    self.pending_urls[key] = future
+                future.add_done_callback(functools.partial(forget, key))
+            futures.append(future)
+        return futures
+
+    def run_downloads(self, tasks, total, save_dir, course_name, chapter_name):
+        """并发执行 (序号, 图片URL) 任务，返回与 tasks 一一对应的结果列表"""
+        if not tasks:
+            return []
+
+        # 不在一次爬取中（例如直接调用 download_images）时只为这批图片启动异步引擎
+        temporary_engine = self.start_async_engine()
+        try:
+            if self.async_engine is not None:
+                futures = self.submit_downloads(
+                    None, tasks, total, save_dir, course_name, chapter_name
+                )
+                return [future.result() for future in futures]
+
+            workers = min(self.max_workers, len(tasks))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = self.submit_downloads(
+                    executor, tasks, total, save_dir, course_name, chapter_name
+                )
+                return [future.result() for future in futures]
+        finally:
+            if temporary_engine:
+                self.close_async_engine()
+
+    def plan_downloads(self, images, save_dir, course_name, chapter_name, key=None):
+        """
+        按下载清单筛选需要下载的图片
+
+        Returns:
+            (tasks, skipped): 待下载的 (序号, 图片URL) 列表和跳过的数量
+        """
+        manifest = self.manifest_for(save_dir) if key else None
+        total = len(images)
+        if self.pdf and key:
+            self.open_pdf_book(save_dir, course_name, chapter_name, total)
+
+        tasks = []
+        skipped = 0
+        for i, img_url in enumerate(images, 1):
+            _, filename, filepath = self.build_image_path(
+                img_url, save_dir, course_name, chapter_name, i
+            )
+            if manifest and manifest.is_complete(key, img_url, filepath):
+                skipped += 1
+                self.metrics.inc("images", status="skipped")
+                self.outcomes["skipped"].append(filename)
+                self.log(f"[{i}/{total}] 已下载，跳过: {filename}")
+                self.add_pdf_page(save_dir, course_name, chapter_name, i, filename)
+                continue
+            tasks.append((i, img_url))
+
+        if skipped:
+            self.log(f"清单中已有 {skipped} 张图片，需下载 {len(tasks)} 张")
+        self.progress("planned", images=total, skipped=skipped)
+        return tasks, skipped
+
+    def image_saved(self, save_dir, course_name, chapter_name, index, filename):
+        """
+        一张图片下载结束（失败时 filename 为 None）：
+        有后处理时先交给进程池，处理完成后再写入 PDF；积压过多时在这里阻塞，下载随之放慢
+        """
+        if not filename or self.postprocessor is None:
+            self.add_pdf_page(save_dir, course_name, chapter_name, index, filename)
+            return
+        filepath = os.path.join(save_dir, filename)
+        before = os.stat(filepath)
+
+        def on_done(timings, error):
+            for name, seconds in timings:
+                self.metrics.observe(f"post_{name}", seconds)
+            self.metrics.inc("postprocessed", status="failed" if error else "ok")
+            if error:
+                self.log(f"⚠️ 后处理失败（{error}）: {filename}")
+            self.rehash_if_changed(filepath, before)
+            self.add_pdf_page(save_dir, course_name, chapter_name, index, filename)
+
+        future, waited = self.postprocessor.submit(filepath, on_done)
+        self.metrics.observe("post_wait", waited)
+        with self.post_lock:
+            self.post_futures[filepath] = future
+
+    def rehash_if_changed(self, filepath, before):
+        """
+        后处理改写了文件时重新计算哈希：下载清单记录的哈希与磁盘上的内容一致，
+        去重也不会把下载到的原始内容硬链接到处理后的文件上
+        """
+        try:
+            after = os.stat(filepath)
+        except OSError:
+            return
+        if (after.st_ino, after.st_size, after.st_mtime_ns) == (
+            before.st_ino, before.st_size, before.st_mtime_ns
+        ):
+            return
+        sha256 = file_sha256(filepath)
+        with self.store_lock:
+            old_sha256 = self.file_hashes.get(filepath)
+            if old_sha256 and self.content_index.get(old_sha256) == filepath:
+                del self.content_index[old_sha256]
+            self.content_index.setdefault(sha256, filepath)
+            self.file_hashes[filepath] = sha256
+
+    def wait_postprocessing(self, filepath=None):
+        """等待 filepath（未指定时为全部图片）的后处理完成"""
+        with self.post_lock:
+            if filepath is None:
+                futures = list(self.post_futures.values())
+                self.post_futures.clear()
+            else:
+                futures = [self.post_futures.pop(filepath, None)]
+        for future in futures:
+            if future is not None:
+                future.result()
+
+    def build_pdf_path(self, save_dir, course_name, chapter_name):
+        filename = re.sub(r'[<>:"/\\|?*]', "_", f"{course_name}-{chapter_name}.pdf")
+        return os.path.join(save_dir, filename)
+
+    def open_pdf_book(self, save_dir, course_name, chapter_name, total):
+        """开始合成一个文档的 PDF，之后每张图片下载结束时由 add_pdf_page 按页码写入"""
+        path = self.build_pdf_path(save_dir, course_name, chapter_name)
+        with self.pdf_lock:
+            previous = self.pdf_books.get((save_dir, course_name, chapter_name))
+            self.pdf_books[(save_dir, course_name, chapter_name)] = PdfBook(
+                path, total, log=self.log
+            )
+        if previous is not None:
+            # 同一文件名的上一个 PDF 还没收齐页面，放弃它并删除临时文件
+            previous.abort()
+
+    def add_pdf_page(self, save_dir, course_name, chapter_name, index, filename):
+        """第 index 页已保存为 filename（下载失败时为 None），交给对应的 PDF"""
+        key = (save_dir, course_name, chapter_name)
+        with self.pdf_lock:
+            book = self.pdf_books.get(key)
+        if book is None:
+            return
+        filepath = os.path.join(save_dir, filename) if filename else None
+        if book.add(index, filepath):
+            with self.pdf_lock:
+                if self.pdf_books.get(key) is book:
+                    del self.pdf_books[key]
+
+    def abort_pdf_books(self):
+        """爬取结束时仍未收齐页面的 PDF 不再生成"""
+        with self.pdf_lock:
+            books = list(self.pdf_books.values())
+            self.pdf_books.clear()
+        for book in books:
+            book.abort()
+
+    def record_downloads(self, tasks, results, save_dir, course_name, chapter_name, key=None):
+        """把下载结果写入下载清单"""
+        manifest = self.manifest_for(save_dir) if key else None
+        for (i, img_url), ok in zip(tasks, results):
+            _, _, filepath = self.build_image_path(
+                img_url, save_dir, course_name, chapter_name, i
+            )
+            # 清单中记录后处理之后的文件大小，重新爬取时才能识别为已完成
+            self.wait_postprocessing(filepath)
+            sha256 = self.file_hashes.pop(filepath, None)
+            if manifest:
+                manifest.record(key, img_url, filepath, ok, sha256)
+
+    def download_images(self, images, save_dir, course_name, chapter_name, key=None):
+        """
+        并发下载图片，文件序号与图片在列表中的位置一一对应
+
+        Args:
+            key: 下载清单的 (课程, 章节, objectid)，提供时跳过清单中已完成的图片
+
+        Returns:
+            int: 成功数量（包含之前已下载完成而跳过的图片）
+        """
+        tasks, skipped = self.plan_downloads(
+            images, save_dir, course_name, chapter_name, key
+        )
+        results = self.run_downloads(
+            tasks, len(images), save_dir, course_name, chapter_name
+        )
+        self.record_downloads(tasks, results, save_dir, course_name, chapter_name, key)
+        return skipped + sum(1 for ok in results if ok)
+
+    def manifest_for(self, save_dir):
+        """返回保存目录对应的下载清单，use_manifest=False 时返回 None"""
+        if not self.use_manifest:
+            return None
+        if save_dir not in self.manifests:
+            self.manifests[save_dir] = DownloadManifest.in_dir(save_dir)
+        return self.manifests[save_dir]
+
+    def http_cache_for(self, save_dir):
+        """返回保存目录对应的页面缓存，use_http_cache=False 时返回 None"""
+        if not self.use_http_cache:
+            return None
+        if save_dir not in self.http_caches:
+            self.http_caches[save_dir] = HttpCache.in_dir(save_dir)
+        return self.http_caches[save_dir]
+
+    def get_page(self, url, save_dir, phase="page"):
+        """请求卡片API或预览页面，启用缓存时发送条件请求，耗时记入 phase 阶段"""
+        cache = self.http_cache_for(save_dir)
+        description = {"cards": "卡片API", "preview": "预览页面"}.get(phase, "页面")
+
+        def send():
+            if cache is None:
+                response = self.http_client().get(url, headers=self.headers, timeout=10)
+                response.from_cache = False
+                return response
+            return cache.get(self.http_client(), url, headers=self.headers, timeout=10)
 
+        with self.metrics.phase(phase):
+            response = self.with_retry(send, description, phase)
+
+        if response.from_cache:
+            self.metrics.inc("pages", phase=phase, source="cache")
+            self.log("页面未变化 (304)，使用本地缓存")
+        else:
+            self.metrics.inc("pages", phase=phase, source="network")
+            self.metrics.inc("bytes", len(response.content), kind=phase)
+        return response
+
+    def export_metrics(self, save_dir, aggregate=None):
+        """
+        把本次爬取的指标摘要写入保存目录；配置了 textfile 路径时同时写 Prometheus 格式，
+        其中是 aggregate（所有爬取累计）的指标，计数器不会因为新的一次爬取而回落
+        """
+        try:
+            if os.path.isdir(save_dir):
+                self.metrics.write_json(os.path.join(save_dir, METRICS_FILENAME))
+            if self.metrics_textfile:
+                (aggregate or self.metrics).write_prometheus(self.metrics_textfile)
+        except OSError as e:
+            self.log(f"⚠️ 导出爬取指标失败: {e}")
+            return
+        phases = self.metrics.summary()["phases"]
+        timing = ", ".join(
+            f"{phase} {stats['sum']:.2f}s/{stats['count']}次"
+            for phase, stats in phases.items()
+            if phase != "crawl"
+        )
+        if timing:
+            self.log(f"各阶段耗时: {timing}")
+
+    def parse_homework_html(self, html):
+        """解析作业页面，返回 (课程名, 题目名, 图片列表)"""
+        # 提取课程名
+        course_name_match = re.search(r'"coursename"\s*:\s*"([^"]+)"', html)
+        course_name = course_name_match.group(1) if course_name_match else "课程"
+
+        # 优先从 mark_title 提取题目名称
+        title_match = re.search(r'<h2 class="mark_title"[^>]*>([^<]+)</h2>', html)
+        if title_match:
+            homework_name = title_match.group(1).strip()
+        else:
+            # 如果没有，尝试从 knowledgename 提取
+            knowledge_name_match = re.search(r'"knowledgename"\s*:\s*"([^"]+)"', html)
+            homework_name = knowledge_name_match.group(1) if knowledge_name_match else "作业"
+
+        # 匹配 stuAnswerContent 区域的图片
+        answer_pattern = r'<dd class="textwrap stuAnswerContent[^"]*">(.*?)</dd>'
+        answer_sections = re.findall(answer_pattern, html, re.DOTALL)
+
+        images = []
+        for section in answer_sections:
+            # 提取 data-original 属性（原图）
+            img_matches = re.findall(r'data-original="([^"]+)"', section)
+            images.extend(img_matches)
+
+            # 如果没有 data-original，尝试提取 src
+            if not img_matches:
+                src_matches = re.findall(r'<img[^>]+src="([^"]+)"', section)
+                images.extend(src_matches)
+
+        # 保序去重
+        return course_name, homework_name, list(dict.fromkeys(images))
+
+    def parse_course_url(self, course_url):
+        """从课程链接提取 courseId / clazzid / cpi，chapterId 可能为 None"""
+        chapter_id_match = re.search(r"chapterId=([^&]+)", course_url)
+        course_id_match = re.search(r"courseId=([^&]+)", course_url, re.IGNORECASE)
+        clazz_id_match = re.search(r"clazzid=([^&]+)", course_url, re.IGNORECASE)
+        cpi_match = re.search(r"cpi=([^&]+)", course_url)
+        return {
+            "chapter_id": chapter_id_match.group(1) if chapter_id_match else None,
+            "course_id": course_id_match.group(1) if course_id_match else "254411132",
+            "clazz_id": clazz_id_match.group(1) if clazz_id_match else "126771918",
+            "cpi": cpi_match.group(1) if cpi_match else "355954326",
+        }
+
+    def parse_chapter_url(self, course_url):
+        """从课程章节链接提取参数，缺少 chapterId 时返回 None"""
+        params = self.parse_course_url(course_url)
+        return params if params["chapter_id"] else None
+
+    def build_course_url(self, params):
+        return f"{self.MOOC_BASE_URL}/mooc-ans/mycourse/studentcourse?courseid={params['course_id']}&clazzid={params['clazz_id']}&cpi={params['cpi']}&ut=s"
+
+    def list_chapter_ids(self, params):
+        """请求课程目录，按目录顺序返回章节ID，目录为空时退回链接中的 chapterId"""
+        with self.metrics.phase("course"):
+            response = self.with_retry(
+                lambda: self.http_client().get(
+                    self.build_course_url(params), headers=self.headers, timeout=10
+                ),
+                "课程目录",
+                "course",
+            )
+        self.metrics.inc("pages", phase="course", source="network")
+        self.metrics.inc("bytes", len(response.content), kind="course")
+        response.encoding = "utf-8"
+        chapter_ids = self.parse_chapter_ids(response.text)
+        if not chapter_ids and params["chapter_id"]:
+            chapter_ids = [params["chapter_id"]]
+        return chapter_ids
+
+    def build_chapter_url(self, params, chapter_id):
+        """单个章节的链接，可直接交给 crawl_images"""
+        return f"{self.MOOC_BASE_URL}/mycourse/studentstudy?chapterId={chapter_id}&courseId={params['course_id']}&clazzid={params['clazz_id']}&cpi={params['cpi']}"
+
+    def parse_chapter_ids(self, course_html):
+        """从课程目录页面按顺序提取所有章节ID"""
+        chapter_ids = re.findall(
+            r'(?:chapterId=|id="cur)(\d+)', course_html, re.IGNORECASE
+        )
+        return list(dict.fromkeys(chapter_ids))
+
+    def build_cards_url(self, params):
+        return f"{self.MOOC_BASE_URL}/mooc-ans/knowledge/cards?clazzid={params['clazz_id']}&courseid={params['course_id']}&knowledgeid={params['chapter_id']}&num=0&ut=s&cpi={params['cpi']}&v=2025-0424-1038-3&mooc2=1&isMicroCourse=false&editorPreview=0"
+
+    def parse_cards_html(self, cards_html):
+        """解析卡片API响应，返回 (课程名, 章节名, objectid)，objectid 可能为 None"""
+        course_name_match = re.search(r'"coursename"\s*:\s*"([^"]+)"', cards_html)
+        course_name = course_name_match.group(1) if course_name_match else "课程"
+
+        knowledge_name_match = re.search(
+            r'"knowledgename"\s*:\s*"([^"]+)"', cards_html
+        )
+        knowledge_name = (
+            knowledge_name_match.group(1) if knowledge_name_match else "章节"
+        )
+
+        objectid_match = re.search(r'"objectid"\s*:\s*"([^"]+)"', cards_html)
+        if not objectid_match:
+            objectid_match = re.search(r'objectid=([^\s"\'>]+)', cards_html)
+        objectid = objectid_match.group(1) if objectid_match else None
+
+        return course_name, knowledge_name, objectid
+
+    def fetch_chapter_name(self, params, save_dir):
+        """只请求卡片API，返回章节名称，请求失败时返回 None；响应存入保存目录的页面缓存"""
+        response = self.get_page(self.build_cards_url(params), save_dir, phase="cards")
+        if response.status_code != 200:
+            return None
+        return self.parse_cards_html(response.text)[1]
+
+    def claim_chapter_name(self, claimed_names, chapter_id, knowledge_name):
+        """
+        同名章节的图片和 PDF 文件名会相互覆盖：按目录顺序第一个章节使用原名，
+        之后的同名章节在名称后加上章节ID
+
+        Args:
+            claimed_names: 章节名称 -> 使用这个名称的章节ID，按目录顺序依次传入各章节
+        """
+        if claimed_names.setdefault(knowledge_name, chapter_id) == chapter_id:
+            return knowledge_name
+        renamed = f"{knowledge_name}-{chapter_id}"
+        self.log(f"章节名称重复，章节 {chapter_id} 保存为「{renamed}」")
+        return renamed
+
+    def build_preview_url(self, objectid):
+        ext_param = f"%7B%22_from_%22%3A%22254411132_126771918_305455632_834b328b9c76ad47c6ea0999c20c6ba0%22%7D"
+        return f"{self.PAN_BASE_URL}/preview/objectshowpreview.html?objectid={objectid}&puid=111690846&ext={ext_param}"
+
+    @crawl_entry
     def crawl_homework_images(self, course_url, save_dir="images"):
         """爬取作业图片"""
         save_dir = os.path.abspath(save_dir)
@@ -87,48 +1106,77 @@ class ChaoxingImageCrawler:
         self.log("正在获取作业页面...")
         
         try:
-            response = self.session.get(course_url, headers=self.headers)
+            page_start = time.perf_counter()
+            response = self.with_retry(
+                lambda: self.session.get(
+                    course_url, headers=self.headers, timeout=10, stream=True
+                ),
+                "作业页面",
+                "homework_page",
+            )
             response.encoding = "utf-8"
-            html = response.text
-            
-            self.log(f"页面响应长度: {len(html)}")
-            
-            # 提取课程名
-            course_name_match = re.search(r'"coursename"\s*:\s*"([^"]+)"', html)
-            course_name = course_name_match.group(1) if course_name_match else "课程"
-            self.log(f"课程名称: {course_name}")
-            
-            # 优先从 mark_title 提取题目名称
-            title_match = re.search(r'<h2 class="mark_title"[^>]*>([^<]+)</h2>', html)
-            if title_match:
-                homework_name = title_match.group(1).strip()
-            else:
-                # 如果没有，尝试从 knowledgename 提取
-                knowledge_name_match = re.search(r'"knowledgename"\s*:\s*"([^"]+)"', html)
-                homework_name = knowledge_name_match.group(1) if knowledge_name_match else "作业"
-            self.log(f"题目名称: {homework_name}")
-            
-            # 提取作业图片（从 stuAnswerContent 区域）
-            self.log("正在查找作业图片...")
-            
-            # 匹配 stuAnswerContent 区域的图片
-            answer_pattern = r'<dd class="textwrap stuAnswerContent[^"]*">(.*?)</dd>'
-            answer_sections = re.findall(answer_pattern, html, re.DOTALL)
-            
-            images = []
-            for section in answer_sections:
-                # 提取 data-original 属性（原图）
-                img_matches = re.findall(r'data-original="([^"]+)"', section)
-                images.extend(img_matches)
-                
-                # 如果没有 data-original，尝试提取 src
-                if not img_matches:
-                    src_matches = re.findall(r'<img[^>]+src="([^"]+)"', section)
-                    images.extend(src_matches)
-            
-            # 去重
-            images = list(set(images))
-            
+
+            # 边接收边解析，每个答案区块结束后即可开始下载其中的图片
+            parser = HomeworkPageParser()
+            key = None
+            tasks = []
+            futures = []
+            submitted = 0
+            skipped = 0
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+                def submit_new_images():
+                    nonlocal key, submitted, skipped
+                    course_name, homework_name = parser.names()
+                    if key is None:
+                        key = (course_name, homework_name, "")
+                        self.log(f"课程名称: {course_name}")
+                        self.log(f"题目名称: {homework_name}")
+                        # 提取作业图片（从 stuAnswerContent 区域）
+                        self.log("正在查找作业图片...")
+                    manifest = self.manifest_for(save_dir)
+                    while submitted < len(parser.images):
+                        img_url = parser.images[submitted]
+                        submitted += 1
+                        i = submitted
+                        _, filename, filepath = self.build_image_path(
+                            img_url, save_dir, course_name, homework_name, i
+                        )
+                        # 图片边解析边发现，总数逐张增加，进度面板随之更新
+                        if manifest and manifest.is_complete(key, img_url, filepath):
+                            skipped += 1
+                            self.metrics.inc("images", status="skipped")
+                            self.outcomes["skipped"].append(filename)
+                            self.log(f"[{i}] 已下载，跳过: {filename}")
+                            self.progress("planned", images=1, skipped=1)
+                            continue
+                        self.progress("planned", images=1, skipped=0)
+                        tasks.append((i, img_url))
+                        futures.extend(
+                            self.submit_downloads(
+                                executor, [(i, img_url)], None,
+                                save_dir, course_name, homework_name,
+                            )
+                        )
+
+                with response:
+                    for chunk in response.iter_content(CHUNK_SIZE, decode_unicode=True):
+                        parser.feed(chunk)
+                        if parser.names_ready:
+                            submit_new_images()
+                parser.close()
+                submit_new_images()
+                # 页面接收与解析交织在一起，这里统计的是整页流式接收+解析的耗时
+                self.metrics.observe("homework_page", time.perf_counter() - page_start)
+                self.metrics.inc("pages", phase="homework_page", source="network")
+                self.metrics.inc("bytes", response.raw.tell(), kind="homework_page")
+
+                results = [future.result() for future in futures]
+
+            course_name, homework_name = parser.names()
+            images = parser.images
+            self.log(f"页面响应长度: {parser.received}")
             self.log(f"找到 {len(images)} 张图片")
             
             if not images:
@@ -138,13 +1186,9 @@ class ChaoxingImageCrawler:
                 self.log("    - 请确认作业答案区域包含图片")
                 self.log("    - 如果是课程章节，请选择“📚 课程图片”模式")
                 return False
-            
-            success_count = 0
-            for i, img_url in enumerate(images, 1):
-                self.log(f"[{i}/{len(images)}] 正在下载: {img_url[:70]}...")
-                if self.download_image(img_url, save_dir, course_name, homework_name, i):
-                    success_count += 1
-                time.sleep(0.5)
+
+            self.record_downloads(tasks, results, save_dir, course_name, homework_name, key)
+            success_count = skipped + sum(1 for ok in results if ok)
             
             self.log(f"\n下载完成! 成功下载 {success_count}/{len(images)} 张图片")
             
@@ -157,102 +1201,183 @@ class ChaoxingImageCrawler:
             self.log(f"爬取作业图片失败: {e}")
             return False
 
+    def fetch_chapter(self, params, save_dir):
+        """
+        请求卡片API和预览页面
+
+        Returns:
+            (课程名, 章节名, objectid, 图片列表)，卡片API请求失败时返回 None
+        """
+        cards_url = self.build_cards_url(params)
+        self.log(f"正在请求卡片API: {cards_url[:70]}...")
+
+        response = self.get_page(cards_url, save_dir, phase="cards")
+        if response.status_code != 200:
+            self.log(f"请求失败，状态码: {response.status_code}")
+            return None
+
+        cards_html = response.text
+        self.log(f"卡片API响应长度: {len(cards_html)}")
+
+        course_name, knowledge_name, objectid = self.parse_cards_html(cards_html)
+        self.log(f"课程名称: {course_name}")
+        self.log(f"章节名称: {knowledge_name}")
+
+        self.log("正在查找PDF文档信息...")
+        images = []
+        if objectid:
+            self.log(f"找到objectid: {objectid}")
+
+            self.log("正在尝试直接请求预览页面...")
+            preview_url = self.build_preview_url(objectid)
+            self.log(f"正在请求: {preview_url[:90]}...")
+
+            preview_response = self.get_page(preview_url, save_dir, phase="preview")
+            if preview_response.status_code == 200:
+                preview_html = preview_response.text
+                self.log(f"预览页面响应长度: {len(preview_html)}")
+
+                with self.metrics.phase("extract"):
+                    images = self.extract_images(preview_html)
+            else:
+                self.log(f"预览页面请求失败: {preview_response.status_code}")
+        else:
+            self.log("未找到objectid")
+
+        return course_name, knowledge_name, objectid, images
+
+    @crawl_entry
     def crawl_images(self, course_url, save_dir="images"):
         save_dir = os.path.abspath(save_dir)
         os.makedirs(save_dir, exist_ok=True)
         self.log(f"保存目录: {save_dir}")
 
         self.log("正在从URL提取参数...")
-        chapter_id_match = re.search(r"chapterId=([^&]+)", course_url)
-        if not chapter_id_match:
+        params = self.parse_chapter_url(course_url)
+        if not params:
             self.log("⚠️ 无法从URL提取chapterId")
             self.log("💡 提示：请确认您选择了正确的爬取模式：")
             self.log("    - 课程图片：需要课程章节链接（包含chapterId参数）")
             self.log("    - 作业图片：需要作业页面链接")
             return False
 
-        chapter_id = chapter_id_match.group(1)
-        course_id_match = re.search(r"courseId=([^&]+)", course_url)
-        course_id = course_id_match.group(1) if course_id_match else "254411132"
-        clazz_id_match = re.search(r"clazzid=([^&]+)", course_url)
-        clazz_id = clazz_id_match.group(1) if clazz_id_match else "126771918"
-        cpi_match = re.search(r"cpi=([^&]+)", course_url)
-        cpi = cpi_match.group(1) if cpi_match else "355954326"
+        self.log(
+            f"课程ID: {params['course_id']}, 章节ID: {params['chapter_id']}, 班级ID: {params['clazz_id']}"
+        )
 
-        self.log(f"课程ID: {course_id}, 章节ID: {chapter_id}, 班级ID: {clazz_id}")
+        chapter = self.fetch_chapter(params, save_dir)
+        if chapter is None:
+            return False
+        course_name, knowledge_name, objectid, images = chapter
+        knowledge_name = self.chapter_names.get(params["chapter_id"], knowledge_name)
 
-        cards_url = f"https://mooc1.chaoxing.com/mooc-ans/knowledge/cards?clazzid={clazz_id}&courseid={course_id}&knowledgeid={chapter_id}&num=0&ut=s&cpi={cpi}&v=2025-0424-1038-3&mooc2=1&isMicroCourse=false&editorPreview=0"
-        self.log(f"正在请求卡片API: {cards_url[:70]}...")
+        self.log(f"找到 {len(images)} 张图片")
 
-        response = self.session.get(cards_url, headers=self.headers)
+        if not images:
+            self.log("未找到图片")
+            return False
 
-        if response.status_code == 200:
-            cards_html = response.text
-            self.log(f"卡片API响应长度: {len(cards_html)}")
+        success_count = self.download_images(
+            images, save_dir, course_name, knowledge_name,
+            key=(params["course_id"], params["chapter_id"], objectid),
+        )
 
-            course_name_match = re.search(r'"coursename"\s*:\s*"([^"]+)"', cards_html)
-            course_name = course_name_match.group(1) if course_name_match else "课程"
-            self.log(f"课程名称: {course_name}")
+        self.log(f"\n下载完成! 成功下载 {success_count}/{len(images)} 张图片")
 
-            knowledge_name_match = re.search(
-                r'"knowledgename"\s*:\s*"([^"]+)"', cards_html
-            )
-            knowledge_name = (
-                knowledge_name_match.group(1) if knowledge_name_match else "章节"
-            )
-            self.log(f"章节名称: {knowledge_name}")
+        if success_count > 0:
+            self.log(f"✓ 图片已保存到: {save_dir}")
 
-            self.log("正在查找PDF文档信息...")
-            objectid_match = re.search(r'"objectid"\s*:\s*"([^"]+)"', cards_html)
-            if not objectid_match:
-                objectid_match = re.search(r'objectid=([^\s"\'>]+)', cards_html)
+        return success_count > 0
 
-            if objectid_match:
-                objectid = objectid_match.group(1)
-                self.log(f"找到objectid: {objectid}")
+    @crawl_entry
+    def crawl_course(self, course_url, save_dir="images"):
+        """
+        爬取整门课程：从课程目录发现所有章节，
+        章节元数据请求和图片下载共用一个线程池，总并发数为 max_workers；
+        异步引擎时图片改在它的事件循环中下载，线程池只用于章节元数据
+        """
+        save_dir = os.path.abspath(save_dir)
+        os.makedirs(save_dir, exist_ok=True)
+        self.log(f"保存目录: {save_dir}")
 
-                self.log("正在尝试直接请求预览页面...")
-                ext_param = f"%7B%22_from_%22%3A%22254411132_126771918_305455632_834b328b9c76ad47c6ea0999c20c6ba0%22%7D"
-                preview_url = f"https://pan-yz.chaoxing.com/preview/objectshowpreview.html?objectid={objectid}&puid=111690846&ext={ext_param}"
-                self.log(f"正在请求: {preview_url[:90]}...")
+        params = self.parse_course_url(course_url)
+        self.log(f"课程ID: {params['course_id']}, 班级ID: {params['clazz_id']}")
 
-                preview_response = self.session.get(preview_url, headers=self.headers)
-                if preview_response.status_code == 200:
-                    preview_html = preview_response.text
-                    self.log(f"预览页面响应长度: {len(preview_html)}")
+        self.log("正在获取课程目录...")
+        try:
+            chapter_ids = self.list_chapter_ids(params)
+        except Exception as e:
+            self.log(f"获取课程目录失败: {e}")
+            return False
 
-                    images = self.extract_images(preview_html)
-                else:
-                    self.log(f"预览页面请求失败: {preview_response.status_code}")
-                    images = []
-            else:
-                self.log("未找到objectid")
-                images = []
+        self.log(f"找到 {len(chapter_ids)} 个章节")
+        if not chapter_ids:
+            self.log("⚠️ 未找到章节，请确认课程链接包含 courseId 和 clazzid")
+            return False
 
-            self.log(f"找到 {len(images)} 张图片")
+        total_images = 0
+        success_count = 0
+        # 每个章节: (章节信息, 待下载任务, 图片 futures, 跳过数量)
+        chapters = []
+        # 章节名称 -> 使用这个名称的章节ID
+        claimed_names = {}
 
-            if not images:
-                self.log("未找到图片")
-                return False
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            metadata_futures = {
+                executor.submit(
+                    self.fetch_chapter, dict(params, chapter_id=chapter_id), save_dir
+                ): chapter_id
+                for chapter_id in chapter_ids
+            }
 
-            success_count = 0
-            for i, img_url in enumerate(images, 1):
-                self.log(f"[{i}/{len(images)}] 正在下载: {img_url[:70]}...")
-                if self.download_image(
-                    img_url, save_dir, course_name, knowledge_name, i
-                ):
-                    success_count += 1
-                time.sleep(0.5)
+            # 按目录顺序取各章节的元数据，一返回就把它的图片提交到同一个线程池；
+            # 元数据请求全部先于图片提交，线程池本来就按提交顺序执行，按目录顺序等待不影响并发，
+            # 同名章节的命名也与运行顺序无关，和 cli.py 拆分为逐章节任务时一致
+            for future, chapter_id in metadata_futures.items():
+                try:
+                    chapter = future.result()
+                except Exception as e:
+                    self.log(f"章节 {chapter_id} 获取失败: {e}")
+                    continue
+                if chapter:
+                    course_name, knowledge_name, objectid, images = chapter
+                    knowledge_name = self.claim_chapter_name(
+                        claimed_names, chapter_id, knowledge_name
+                    )
+                    chapter = (course_name, knowledge_name, objectid, images)
+                if not chapter or not chapter[3]:
+                    self.log(f"章节 {chapter_id} 未找到图片")
+                    continue
 
-            self.log(f"\n下载完成! 成功下载 {success_count}/{len(images)} 张图片")
+                key = (params["course_id"], chapter_id, objectid)
+                tasks, skipped = self.plan_downloads(
+                    images, save_dir, course_name, knowledge_name, key
+                )
+                image_futures = self.submit_downloads(
+                    executor, tasks, len(images), save_dir, course_name, knowledge_name
+                )
+                total_images += len(images)
+                chapters.append((chapter, key, tasks, image_futures, skipped))
+                self.log(f"章节「{knowledge_name}」: {len(images)} 张图片，开始下载")
 
-            if success_count > 0:
-                self.log(f"✓ 图片已保存到: {save_dir}")
+            # 按目录顺序汇总各章节结果
+            for chapter, key, tasks, image_futures, skipped in chapters:
+                course_name, knowledge_name, _, images = chapter
+                results = [f.result() for f in image_futures]
+                self.record_downloads(
+                    tasks, results, save_dir, course_name, knowledge_name, key
+                )
+                chapter_success = skipped + sum(1 for ok in results if ok)
+                success_count += chapter_success
+                self.log(f"章节「{knowledge_name}」完成: {chapter_success}/{len(images)}")
 
-            return success_count > 0
-        else:
-            self.log(f"请求失败，状态码: {response.status_code}")
-            return False
+        self.log(
+            f"\n整门课程下载完成! {len(chapters)} 个章节，成功下载 {success_count}/{total_images} 张图片"
+        )
+        if success_count > 0:
+            self.log(f"✓ 图片已保存到: {save_dir}")
+
+        return success_count > 0
 
 
 def main():
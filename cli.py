@@ -0,0 +1,572 @@
+"""
+命令行批量爬取（无界面，不依赖 tkinter）
+适合在无图形界面的 Linux 服务器上用 cron 定时批量镜像课程
+
+用法:
+    python cli.py --cookie-file saved_cookie.json --jobs jobs.txt --summary summary.json
+    cat jobs.txt | python cli.py --cookie-file cookie.txt --parallel 4
+    python cli.py --cookie-file cookie.txt --mode whole_course "https://mooc1.chaoxing.com/...&courseId=...&clazzid=..."
+    python cli.py --cookie-file cookie.txt --jobs jobs.txt --processes 4
+                                    # 多进程分片，正则提取和文件 I/O 分摊到多个 CPU 核心
+    python cli.py --cookie-file cookie.txt --jobs jobs.txt --queue /shared/crawl_queue.db
+    python cli.py --cookie-file cookie.txt --queue /shared/crawl_queue.db --worker
+                                    # 共用任务队列：先放入任务，再启动工作进程；SQLite 队列跨机器共用时
+                                    # 网络文件系统须支持文件锁（见 job_queue.py）
+    python cli.py --cookie-file cookie.txt --jobs jobs.txt --postprocess recompress,thumbnail:256
+                                    # 下载后在进程池中重新压缩 PNG、生成缩略图
+
+任务文件每行一个任务，空行和 # 开头的行忽略:
+    URL [模式] [保存目录]
+    {"url": "...", "mode": "homework", "save_dir": "作业"}
+模式: course（课程图片，默认）/ homework（作业图片）/ whole_course（整门课程）
+
+Cookie 文件支持: GUI 保存的 saved_cookie.json、{"名称": "值"} 形式的 JSON、
+或浏览器复制的 "name=value; name2=value2" 文本
+
+退出码: 0 全部成功，1 有任务失败，2 参数错误
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from chaoxing_crawler import ADAPTIVE_INITIAL_LIMIT, DEFAULT_MAX_WORKERS, ChaoxingImageCrawler
+from crawl_metrics import CrawlMetrics
+from flow_control import AdaptiveLimiter, CircuitBreakers, FixedLimiter, RetryPolicy
+from postprocess import PostProcessor, create_stages
+from job_queue import DEFAULT_MAX_ATTEMPTS, DEFAULT_VISIBILITY_TIMEOUT, open_broker
+from transport import DEFAULT_POOL_SIZE, create_session
+
+MODES = ("course", "homework", "whole_course")
+DEFAULT_PARALLEL_JOBS = 2
+# 工作节点 --wait 时队列为空的轮询间隔(秒)
+QUEUE_POLL_INTERVAL = 5
+
+print_lock = threading.Lock()
+
+
+def parse_cookie_string(cookie_str):
+    """解析 "name=value; name2=value2" 格式的 Cookie"""
+    cookies = {}
+    for pair in cookie_str.split(";"):
+        pair = pair.strip()
+        if "=" in pair:
+            key, value = pair.split("=", 1)
+            cookies[key.strip()] = value.strip()
+    return cookies
+
+
+def load_cookies(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return parse_cookie_string(text)
+    if isinstance(data, dict) and isinstance(data.get("cookie"), str):
+        # GUI 保存的 saved_cookie.json
+        return parse_cookie_string(data["cookie"])
+    if isinstance(data, dict):
+        return {str(k): str(v) for k, v in data.items()}
+    raise ValueError("无法识别的 Cookie 文件格式")
+
+
+def parse_job_line(line, default_mode, default_save_dir):
+    """解析任务文件的一行，返回任务 dict，空行和注释返回 None"""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        job = json.loads(line)
+    else:
+        parts = line.split()
+        job = {"url": parts[0]}
+        if len(parts) > 1:
+            job["mode"] = parts[1]
+        if len(parts) > 2:
+            job["save_dir"] = " ".join(parts[2:])
+
+    job.setdefault("mode", default_mode)
+    job.setdefault("save_dir", default_save_dir)
+    if not job.get("url"):
+        raise ValueError("缺少 url")
+    if job["mode"] not in MODES:
+        raise ValueError(f"未知模式: {job['mode']}")
+    return job
+
+
+def load_jobs(lines, default_mode, default_save_dir):
+    jobs = []
+    for line_no, line in enumerate(lines, 1):
+        try:
+            job = parse_job_line(line, default_mode, default_save_dir)
+        except ValueError as e:
+            raise ValueError(f"任务第 {line_no} 行: {e}")
+        if job:
+            jobs.append(job)
+    return jobs
+
+
+def emit(message, quiet, log_file):
+    with print_lock:
+        if not quiet:
+            print(message, file=sys.stderr, flush=True)
+        if log_file:
+            log_file.write(message + "\n")
+            log_file.flush()
+
+
+def build_shared(args, metrics, log):
+    """同一进程内所有任务共用的 Session、并发控制、熔断器、重试策略和指标"""
+    workers = max(1, args.workers)
+    shared = {}
+
+    def on_limit_change(limit, reason):
+        shared["metrics"].inc("throttled")
+        log(f"⚠️ 服务器限流或变慢（{reason}），并发数降至 {limit}")
+
+    shared.update(
+        session=create_session(pool_size=max(workers, DEFAULT_POOL_SIZE)),
+        # 关闭自适应时同样共用一个固定大小的额度，--workers 仍是所有任务合计的上限
+        limiter=FixedLimiter(workers)
+        if args.no_adaptive
+        else AdaptiveLimiter(
+            initial=min(ADAPTIVE_INITIAL_LIMIT, workers),
+            max_limit=workers,
+            on_change=on_limit_change,
+        ),
+        breakers=CircuitBreakers(),
+        retry=RetryPolicy(args.retries + 1),
+        metrics=metrics,
+        postprocessor=PostProcessor(
+            create_stages(args.postprocess), processes=args.postprocess_processes
+        )
+        if args.postprocess
+        else None,
+    )
+    return shared
+
+
+def close_shared(shared):
+    """关闭后处理进程池（第一张图片下载后才启动，未启动时什么也不做）"""
+    if shared["postprocessor"]:
+        shared["postprocessor"].shutdown()
+
+
+def create_crawler(cookies, shared, args, log):
+    crawler = ChaoxingImageCrawler(
+        cookies,
+        max_workers=args.workers,
+        engine=args.engine,
+        session=shared["session"],
+        metrics_textfile=args.metrics_textfile,
+        pdf=args.pdf,
+        postprocessor=shared["postprocessor"],
+    )
+    # 所有任务共用并发控制、熔断器和指标：并发上限是整个进程的，不是每个任务的
+    crawler.limiter = shared["limiter"]
+    crawler.breakers = shared["breakers"]
+    crawler.retry = shared["retry"]
+    crawler.metrics = shared["metrics"]
+    if args.base_url:
+        crawler.MOOC_BASE_URL = crawler.PAN_BASE_URL = args.base_url.rstrip("/")
+    crawler.log_callback = log
+    return crawler
+
+
+def run_job(job_id, job, cookies, shared, args, log):
+    """执行一个任务，返回任务摘要"""
+    prefix = f"[任务{job_id}]"
+    crawler = create_crawler(
+        cookies, shared, args, lambda message: log(f"{prefix} {message}")
+    )
+    if job.get("chapter_name"):
+        # 整门课程拆分出的同名章节，使用拆分时确定的名称
+        chapter_id = crawler.parse_course_url(job["url"])["chapter_id"]
+        crawler.chapter_names[chapter_id] = job["chapter_name"]
+    crawl = {
+        "course": crawler.crawl_images,
+        "homework": crawler.crawl_homework_images,
+        "whole_course": crawler.crawl_course,
+    }[job["mode"]]
+
+    start = time.perf_counter()
+    error = None
+    try:
+        success = crawl(job["url"], job["save_dir"])
+    except Exception as e:
+        success = False
+        error = str(e)
+        crawler.log(f"❌ 任务出错: {e}")
+
+    summary = {
+        "id": job_id,
+        "url": job["url"],
+        "mode": job["mode"],
+        "save_dir": os.path.abspath(job["save_dir"]),
+        "success": bool(success),
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+        "images": {status: len(names) for status, names in crawler.outcomes.items()},
+    }
+    if error:
+        summary["error"] = error
+    log(f"{prefix} {'✅ 完成' if success else '❌ 失败'}")
+    return summary
+
+
+def run_in_threads(jobs, cookies, args, metrics, log):
+    shared = build_shared(args, metrics, log)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+            futures = [
+                executor.submit(run_job, job_id, job, cookies, shared, args, log)
+                for job_id, job in enumerate(jobs, 1)
+            ]
+            return [future.result() for future in futures]
+    finally:
+        close_shared(shared)
+
+
+def fetch_chapter_names(crawler, params, chapter_ids, save_dir, workers):
+    """并发请求各章节的卡片API，返回与 chapter_ids 对应的章节名称，失败的章节为 None"""
+
+    def fetch_name(chapter_id):
+        try:
+            return crawler.fetch_chapter_name(dict(params, chapter_id=chapter_id), save_dir)
+        except Exception as e:
+            crawler.log(f"章节 {chapter_id} 名称获取失败: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(fetch_name, chapter_ids))
+
+
+def expand_course_jobs(jobs, cookies, args, log):
+    """
+    把整门课程任务展开为逐章节的课程图片任务，章节才能分到不同进程；
+    同名章节按目录顺序重命名（与 crawl_course 相同），各进程保存的文件不会相互覆盖。
+    卡片API的响应存入保存目录的页面缓存，工作进程再次请求时服务器只返回 304
+    """
+    expanded = []
+    shared = None
+    for job in jobs:
+        if job["mode"] != "whole_course":
+            expanded.append(job)
+            continue
+        shared = shared or build_shared(args, CrawlMetrics(), log)
+        crawler = create_crawler(cookies, shared, args, log)
+        params = crawler.parse_course_url(job["url"])
+        try:
+            chapter_ids = crawler.list_chapter_ids(params)
+        except Exception as e:
+            log(f"获取课程目录失败，整门课程在一个进程内爬取: {e}")
+            expanded.append(job)
+            continue
+        names = fetch_chapter_names(
+            crawler, params, chapter_ids, os.path.abspath(job["save_dir"]), args.workers
+        )
+        log(f"课程 {params['course_id']}: {len(chapter_ids)} 个章节分配到各进程")
+        claimed_names = {}
+        for chapter_id, name in zip(chapter_ids, names):
+            chapter_job = dict(
+                job, url=crawler.build_chapter_url(params, chapter_id), mode="course"
+            )
+            if name is not None:
+                chapter_name = crawler.claim_chapter_name(claimed_names, chapter_id, name)
+                if chapter_name != name:
+                    chapter_job["chapter_name"] = chapter_name
+            expanded.append(chapter_job)
+    return expanded
+
+
+# 工作进程内的状态，由 init_worker 在进程启动时创建
+worker_state = {}
+
+
+def init_worker(cookies, args, log_queue):
+    # 指标由父进程合并后统一导出，工作进程不写 Prometheus 文件
+    args = argparse.Namespace(**dict(vars(args), metrics_textfile=None))
+    log = log_queue.put
+    worker_state.update(
+        cookies=cookies, args=args, log=log, shared=build_shared(args, CrawlMetrics(), log)
+    )
+
+
+def run_job_in_worker(job_id, job):
+    """在工作进程中执行一个任务，返回 (任务摘要, 指标 snapshot)"""
+    shared = worker_state["shared"]
+    # 每个任务单独统计指标，父进程合并时不会重复计算
+    shared["metrics"] = CrawlMetrics()
+    try:
+        summary = run_job(
+            job_id, job, worker_state["cookies"], shared, worker_state["args"], worker_state["log"]
+        )
+    finally:
+        # 工作进程退出时不会等待子进程池，每个任务结束就关闭，下个任务再启动
+        close_shared(shared)
+    return summary, shared["metrics"].snapshot()
+
+
+def run_in_processes(jobs, cookies, args, metrics, log):
+    """
+    把任务分到多个进程执行，每个进程有自己的 Session 和并发控制；
+    日志经队列转发到父进程输出，指标在父进程合并，下载清单是各进程共用的 SQLite 文件
+    """
+    jobs = expand_course_jobs(jobs, cookies, args, log)
+    log_queue = multiprocessing.Queue()
+    forwarder = threading.Thread(
+        target=lambda: [log(message) for message in iter(log_queue.get, None)], daemon=True
+    )
+    forwarder.start()
+
+    results = [None] * len(jobs)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.processes,
+            initializer=init_worker,
+            initargs=(cookies, args, log_queue),
+        ) as executor:
+            futures = {
+                executor.submit(run_job_in_worker, job_id, job): job_id
+                for job_id, job in enumerate(jobs, 1)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                job_id = futures[future]
+                try:
+                    summary, snapshot = future.result()
+                    metrics.merge(snapshot)
+                except Exception as e:
+                    # 工作进程崩溃等情况，任务记为失败
+                    job = jobs[job_id - 1]
+                    summary = {"id": job_id, "url": job["url"], "mode": job["mode"],
+                               "save_dir": os.path.abspath(job["save_dir"]),
+                               "success": False, "error": str(e)}
+                results[job_id - 1] = summary
+                log(f"[进度] {done}/{len(jobs)} 个任务完成")
+    finally:
+        log_queue.put(None)
+        forwarder.join()
+    return results
+
+
+def job_key(job):
+    return f"{job['mode']} {job['url']} {job['save_dir']}"
+
+
+def enqueue_jobs(broker, jobs, cookies, args, log):
+    """把任务（整门课程按章节拆分）放入任务队列，返回生产者摘要"""
+    jobs = expand_course_jobs(jobs, cookies, args, log)
+    enqueued = sum(1 for job in jobs if broker.put(job, key=job_key(job)))
+    log(f"已放入任务队列 {enqueued} 个任务，{len(jobs) - enqueued} 个已在队列中")
+    return {"enqueued": enqueued, "duplicates": len(jobs) - enqueued, "queue": broker.stats()}
+
+
+def run_queue_worker(broker, cookies, args, metrics, log):
+    """
+    从任务队列租用任务执行：成功 ack，失败 nack 后按退避时间重新可见；
+    执行期间定期延长租约，进程崩溃时租约到期，任务由其他节点重新执行
+    """
+    shared = build_shared(args, metrics, log)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    active = {}
+    lock = threading.Lock()
+    results = []
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(args.visibility_timeout / 3):
+            with lock:
+                tasks = list(active.values())
+            for task in tasks:
+                if not broker.extend(task):
+                    log(f"[任务{task.id}] ⚠️ 租约已过期，任务可能被其他节点重复执行")
+
+    def consume():
+        while True:
+            tasks = broker.lease(worker_id)
+            if not tasks:
+                if not args.wait:
+                    return
+                time.sleep(QUEUE_POLL_INTERVAL)
+                continue
+            task = tasks[0]
+            with lock:
+                active[task.id] = task
+            try:
+                summary = run_job(task.id, task.payload, cookies, shared, args, log)
+            finally:
+                with lock:
+                    del active[task.id]
+            summary["attempt"] = task.attempts
+            if summary["success"]:
+                broker.ack(task)
+            else:
+                broker.nack(
+                    task,
+                    delay=shared["retry"].delay(task.attempts),
+                    error=summary.get("error", "任务失败"),
+                )
+            with lock:
+                results.append(summary)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    log(f"工作节点 {worker_id} 开始从任务队列租用任务")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+            for future in [executor.submit(consume) for _ in range(max(1, args.parallel))]:
+                future.result()
+    finally:
+        stopped.set()
+        close_shared(shared)
+    log(f"任务队列: {broker.stats()}")
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="学习通图片批量爬取（命令行）")
+    parser.add_argument("urls", nargs="*", help="要爬取的链接，不提供时从 --jobs 或标准输入读取任务")
+    parser.add_argument("--jobs", help="任务文件，- 表示标准输入")
+    parser.add_argument("--cookie-file", help="Cookie 文件（默认读取环境变量 CHAOXING_COOKIE）")
+    parser.add_argument("--mode", choices=MODES, default="course", help="任务未指定模式时使用的模式")
+    parser.add_argument("--output-dir", default="images", help="任务未指定保存目录时使用的目录")
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL_JOBS, help="同时执行的任务数")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="多进程分片：任务（整门课程按章节拆分）分到多个进程，各进程的 --workers 和 --parallel 独立",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_MAX_WORKERS, help="所有任务合计的图片下载并发上限"
+    )
+    parser.add_argument("--no-adaptive", action="store_true", help="固定使用 --workers 个并发")
+    parser.add_argument("--retries", type=int, default=3, help="失败请求的最多重试次数")
+    parser.add_argument("--engine", choices=("thread", "async"), help="网络引擎（async 需要 aiohttp）")
+    parser.add_argument(
+        "--pdf", action="store_true", help="课程图片同时按页码顺序合成每个文档的 PDF（边下载边写入）"
+    )
+    parser.add_argument(
+        "--postprocess",
+        default=os.environ.get("CHAOXING_POSTPROCESS"),
+        help="下载后的处理阶段，逗号分隔，如 recompress,normalize,thumbnail:256"
+        "（默认读取环境变量 CHAOXING_POSTPROCESS）",
+    )
+    parser.add_argument(
+        "--postprocess-processes", type=int, help="后处理进程数（默认为 CPU 核心数）"
+    )
+    parser.add_argument("--summary", default="-", help="JSON 摘要输出文件，- 表示标准输出")
+    parser.add_argument("--metrics-textfile", help="Prometheus textfile 输出路径")
+    parser.add_argument("--log-file", help="完整日志追加写入的文件")
+    parser.add_argument("--quiet", action="store_true", help="不在标准错误输出日志")
+    parser.add_argument(
+        "--queue",
+        help="任务队列（SQLite 文件路径或 sqlite:///path），不加 --worker 时把任务放入队列后退出",
+    )
+    parser.add_argument("--worker", action="store_true", help="作为工作节点从 --queue 租用任务执行")
+    parser.add_argument("--wait", action="store_true", help="工作节点在队列为空时继续等待新任务")
+    parser.add_argument(
+        "--visibility-timeout",
+        type=float,
+        default=DEFAULT_VISIBILITY_TIMEOUT,
+        help="任务租约有效期(秒)，节点失联超过这个时间后任务重新分配",
+    )
+    parser.add_argument(
+        "--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="任务最多执行次数"
+    )
+    parser.add_argument("--base-url", help="替换学习通站点地址，用于连接本地模拟服务器 stub_server.py")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        if args.cookie_file:
+            cookies = load_cookies(args.cookie_file)
+        elif os.environ.get("CHAOXING_COOKIE"):
+            cookies = parse_cookie_string(os.environ["CHAOXING_COOKIE"])
+        else:
+            parser.error("需要 --cookie-file 或环境变量 CHAOXING_COOKIE")
+
+        if args.worker:
+            if not args.queue:
+                parser.error("--worker 需要 --queue")
+            jobs = []
+        elif args.urls:
+            jobs = load_jobs(args.urls, args.mode, args.output_dir)
+        elif args.jobs and args.jobs != "-":
+            with open(args.jobs, "r", encoding="utf-8") as f:
+                jobs = load_jobs(f, args.mode, args.output_dir)
+        else:
+            jobs = load_jobs(sys.stdin, args.mode, args.output_dir)
+        if args.postprocess:
+            # 在启动任何任务前检查阶段名和依赖（PIL）
+            create_stages(args.postprocess)
+        broker = (
+            open_broker(
+                args.queue,
+                visibility_timeout=args.visibility_timeout,
+                max_attempts=args.max_attempts,
+            )
+            if args.queue
+            else None
+        )
+    except (OSError, ValueError, RuntimeError, sqlite3.Error) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    if not jobs and not args.worker:
+        print("错误: 没有任务", file=sys.stderr)
+        return 2
+
+    log_file = open(args.log_file, "a", encoding="utf-8") if args.log_file else None
+    metrics = CrawlMetrics()
+    started_at = datetime.now()
+    try:
+        log = lambda message: emit(message, args.quiet, log_file)
+        if broker and not args.worker:
+            print(json.dumps(enqueue_jobs(broker, jobs, cookies, args, log), ensure_ascii=False, indent=2))
+            return 0
+        if broker:
+            results = run_queue_worker(broker, cookies, args, metrics, log)
+        elif args.processes > 1:
+            results = run_in_processes(jobs, cookies, args, metrics, log)
+        else:
+            results = run_in_threads(jobs, cookies, args, metrics, log)
+    finally:
+        if broker:
+            broker.close()
+        if log_file:
+            log_file.close()
+    if args.metrics_textfile:
+        metrics.write_prometheus(args.metrics_textfile)
+
+    summary = {
+        "started_at": started_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "elapsed_seconds": round((datetime.now() - started_at).total_seconds(), 3),
+        "jobs": len(results),
+        "succeeded": sum(1 for r in results if r["success"]),
+        "failed": sum(1 for r in results if not r["success"]),
+        "results": results,
+        "metrics": metrics.summary(),
+    }
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary == "-":
+        print(text)
+    else:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Cookie 存储与有效性缓存
+- CookieStore 把 Cookie 连同域名、路径和过期时间保存为 LWP 格式的 Cookie 文件，
+  爬取时服务器通过 Set-Cookie 轮换的 Cookie 写回文件；p_auth_token 过期时先用普通 HTTP 请求续期，
+  续期失败才需要打开浏览器重新登录
+- p_auth_token 是 JWT，本地解码 exp 即可判断是否已经过期，不需要请求服务器
+- 最近验证通过的 Cookie 在 VALIDATION_TTL 内直接视为有效
+- 无法确定时不再单独发请求验证，爬取的第一个页面请求（卡片API、作业页面等）
+  被重定向到登录页即说明 Cookie 失效，见 ChaoxingImageCrawler.with_retry
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from http.cookiejar import Cookie, LWPCookieJar
+
+# 验证通过后多长时间内不再验证(秒)
+VALIDATION_TTL = 600
+# JWT 剩余有效期少于这个时间(秒)时按已过期处理，避免爬取途中过期
+EXPIRY_MARGIN = 60
+AUTH_TOKEN_COOKIE = "p_auth_token"
+# 未登录时学习通把请求重定向到 passport2.chaoxing.com 的登录页
+LOGIN_URL_MARKERS = ("passport2.chaoxing.com", "/login")
+# 只有名称和值的 Cookie（用户粘贴的 Cookie 字符串）所属的域
+DEFAULT_DOMAIN = ".chaoxing.com"
+# 续期请求的页面：已登录时服务器在响应中通过 Set-Cookie 下发新的 p_auth_token
+RENEW_URL = "https://i.mooc.chaoxing.com/space/"
+
+
+def jwt_expiry(token):
+    """返回 JWT 载荷中的 exp（Unix 秒），不是 JWT 或没有 exp 时返回 None，不校验签名"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+    except (IndexError, ValueError, AttributeError):
+        return None
+    if not isinstance(exp, (int, float)):
+        return None
+    # 个别令牌的 exp 是毫秒
+    return exp / 1000 if exp > 1e11 else exp
+
+
+def is_login_response(response):
+    """请求被重定向到了登录页"""
+    urls = [r.headers.get("Location", "") for r in response.history]
+    urls.append(response.url or "")
+    if response.is_redirect:
+        urls.append(response.headers.get("Location", ""))
+    return any(marker in url for url in urls for marker in LOGIN_URL_MARKERS)
+
+
+def cookie_fingerprint(cookies):
+    text = ";".join(f"{name}={value}" for name, value in sorted(cookies.items()))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CookieValidityCache:
+    def __init__(self, path=None, ttl=VALIDATION_TTL):
+        """
+        Args:
+            path: 保存验证记录的 JSON 文件，None 时只保存在内存中；只保存 Cookie 的哈希
+            ttl: 验证通过后视为有效的时间(秒)
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.validated = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.validated = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def check(self, cookies):
+        """
+        Returns:
+            False: p_auth_token 已过期，Cookie 一定无效
+            True: 最近 ttl 秒内验证通过
+            None: 无法在本地确定，需要由服务器的响应判断
+        """
+        now = time.time()
+        expiry = jwt_expiry(cookies.get(AUTH_TOKEN_COOKIE, ""))
+        if expiry is not None and expiry - EXPIRY_MARGIN < now:
+            return False
+        with self.lock:
+            validated_at = self.validated.get(cookie_fingerprint(cookies))
+        if validated_at is not None and now - validated_at < self.ttl:
+            return True
+        return None
+
+    def record(self, cookies, valid):
+        """记录服务器对这组 Cookie 的验证结果"""
+        fingerprint = cookie_fingerprint(cookies)
+        now = time.time()
+        with self.lock:
+            if valid:
+                self.validated[fingerprint] = now
+            else:
+                self.validated.pop(fingerprint, None)
+            # 顺便清理过期记录
+            self.validated = {
+                key: at for key, at in self.validated.items() if now - at < self.ttl
+            }
+            data = dict(self.validated)
+        if self.path:
+            try:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+
+def make_cookie(name, value, domain=DEFAULT_DOMAIN, path="/", expires=None, secure=False, http_only=False):
+    return Cookie(
+        version=0,
+        name=name,
+        value=value,
+        port=None,
+        port_specified=False,
+        domain=domain,
+        domain_specified=domain.startswith("."),
+        domain_initial_dot=domain.startswith("."),
+        path=path,
+        path_specified=True,
+        secure=secure,
+        expires=int(expires) if expires is not None else None,
+        discard=expires is None,
+        comment=None,
+        comment_url=None,
+        rest={"HttpOnly": None} if http_only else {},
+    )
+
+
+class CookieStore:
+    """
+    持久化的 Cookie 文件（LWP 格式，保留域名和过期时间）
+
+    用法:
+        store = CookieStore("cookies.lwp")
+        store.apply(session)       # 爬取前放入 Session
+        ...                        # 爬取中 requests 自动接收 Set-Cookie
+        store.absorb(session)      # 爬取后把轮换的 Cookie 写回文件
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jar = LWPCookieJar(path)
+        if os.path.exists(path):
+            try:
+                # 会话 Cookie 没有过期时间，同样需要保存和读取
+                self.jar.load(ignore_discard=True)
+            except (OSError, ValueError):
+                pass
+
+    def save(self):
+        with self.lock:
+            self.jar.clear_expired_cookies()
+            tmp_path = self.path + ".tmp"
+            self.jar.save(tmp_path, ignore_discard=True)
+            os.replace(tmp_path, self.path)
+
+    def as_dict(self):
+        """{名称: 值}，同名 Cookie 以 chaoxing.com 主域上的为准"""
+        with self.lock:
+            cookies = sorted(self.jar, key=lambda c: c.domain == DEFAULT_DOMAIN)
+            return {cookie.name: cookie.value for cookie in cookies}
+
+    def to_cookie_string(self):
+        return "; ".join(f"{name}={value}" for name, value in self.as_dict().items())
+
+    def set_from_dict(self, cookies):
+        """
+        用只有名称和值的 Cookie（用户粘贴的 Cookie 字符串）替换全部 Cookie：
+        不在其中的 Cookie（用户删掉的、其他账号留下的）一并删除；
+        值与已保存的相同时保留原有的域名和过期时间，否则按 .chaoxing.com 的会话 Cookie 保存
+        """
+        current = self.as_dict()
+        with self.lock:
+            for cookie in [c for c in self.jar if c.name not in cookies]:
+                self.jar.clear(cookie.domain, cookie.path, cookie.name)
+            for name, value in cookies.items():
+                if current.get(name) != value:
+                    for cookie in [c for c in self.jar if c.name == name]:
+                        self.jar.clear(cookie.domain, cookie.path, cookie.name)
+                    self.jar.set_cookie(make_cookie(name, value))
+
+    def update_from_driver(self, driver_cookies):
+        """写入浏览器（Selenium get_cookies()）中的 Cookie，保留域名和过期时间"""
+        with self.lock:
+            for c in driver_cookies:
+                domain = c.get("domain") or DEFAULT_DOMAIN
+                self.jar.set_cookie(
+                    make_cookie(
+                        c["name"],
+                        c["value"],
+                        domain=domain,
+                        path=c.get("path") or "/",
+                        expires=c.get("expiry"),
+                        secure=bool(c.get("secure")),
+                        http_only=bool(c.get("httpOnly")),
+                    )
+                )
+
+    def apply(self, session):
+        """把全部 Cookie（含域名）放入 requests.Session"""
+        with self.lock:
+            for cookie in self.jar:
+                session.cookies.set_cookie(cookie)
+
+    def absorb(self, session):
+        """
+        把 Session 中的 Cookie（包括响应 Set-Cookie 轮换的新值）写回并保存
+
+        Returns:
+            bool: Cookie 是否有变化
+        """
+        before = self.as_dict()
+        with self.lock:
+            for cookie in session.cookies:
+                self.jar.set_cookie(cookie)
+        changed = self.as_dict() != before
+        self.save()
+        return changed
+
+    def expiry(self):
+        return jwt_expiry(self.as_dict().get(AUTH_TOKEN_COOKIE, ""))
+
+    def renew(self, session, url=RENEW_URL, timeout=10):
+        """
+        用普通 HTTP 请求续期：带着现有 Cookie 请求已登录才能访问的页面，服务器下发的新 Cookie 写回文件
+
+        Returns:
+            bool: 续期成功（未被重定向到登录页，且 p_auth_token 未过期）
+        """
+        self.apply(session)
+        try:
+            response = session.get(url, timeout=timeout)
+        except OSError:
+            # requests 的连接错误都是 OSError 的子类
+            return False
+        if is_login_response(response) or response.status_code != 200:
+            return False
+        self.absorb(session)
+        expiry = self.expiry()
+        return expiry is None or expiry - EXPIRY_MARGIN > time.time()
@@ -0,0 +1,203 @@
+"""
+爬取指标
+按阶段（课程目录、卡片API、预览页面、正则提取、图片下载等）统计次数、字节数和耗时分布，
+爬取结束后导出为 JSON 摘要和 Prometheus textfile 格式（供 node_exporter 采集）
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+METRICS_FILENAME = ".chaoxing_metrics.json"
+METRIC_PREFIX = "chaoxing"
+
+# 耗时直方图的桶上限(秒)，与 Prometheus 客户端默认值一致
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """按桶估算分位数（桶内线性插值），没有数据时返回 None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, n in zip(self.buckets + (self.max,), self.counts):
+            if n and seen + n >= rank:
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else None,
+            "p50": round_or_none(self.quantile(0.5)),
+            "p99": round_or_none(self.quantile(0.99)),
+            "max": round(self.max, 6),
+        }
+
+
+def round_or_none(value):
+    return round(value, 6) if value is not None else None
+
+
+class CrawlMetrics:
+    """
+    线程安全的计数器和耗时直方图，下载线程和异步引擎共用一个实例；
+    指定 parent 时同时计入 parent（单次爬取的指标汇总到整个进程的指标中）
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.parent:
+            self.parent.inc(name, value, **labels)
+
+    def observe(self, phase, seconds):
+        with self.lock:
+            if phase not in self.histograms:
+                self.histograms[phase] = Histogram()
+            self.histograms[phase].observe(seconds)
+        if self.parent:
+            self.parent.observe(phase, seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """统计 with 块的耗时，出错时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """可序列化（可跨进程传递）的原始数据，用 merge 合并到另一个实例"""
+        with self.lock:
+            return {
+                "counters": list(self.counters.items()),
+                "histograms": {
+                    phase: (h.counts[:], h.count, h.sum, h.max)
+                    for phase, h in self.histograms.items()
+                },
+            }
+
+    def merge(self, snapshot):
+        """合并其他进程的 snapshot()"""
+        with self.lock:
+            for key, value in snapshot["counters"]:
+                self.counters[key] = self.counters.get(key, 0) + value
+            for phase, (counts, count, total, maximum) in snapshot["histograms"].items():
+                if phase not in self.histograms:
+                    self.histograms[phase] = Histogram()
+                histogram = self.histograms[phase]
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.count += count
+                histogram.sum += total
+                histogram.max = max(histogram.max, maximum)
+
+    def summary(self):
+        """返回可直接 json.dump 的摘要"""
+        with self.lock:
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                label = ",".join(f"{k}={v}" for k, v in labels)
+                counters[f"{name}{{{label}}}" if label else name] = value
+            phases = {
+                phase: histogram.summary()
+                for phase, histogram in sorted(self.histograms.items())
+            }
+        return {
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "counters": counters,
+            "phases": phases,
+        }
+
+    def to_prometheus(self):
+        """Prometheus 文本格式: 计数器为 chaoxing_<name>_total，阶段耗时为一个带 phase 标签的直方图"""
+        lines = []
+        with self.lock:
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"{metric}{format_labels(labels)} {value}")
+
+            metric = f"{METRIC_PREFIX}_phase_duration_seconds"
+            if self.histograms:
+                lines.append(f"# TYPE {metric} histogram")
+            for phase, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for upper, n in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += n
+                    labels = (("phase", phase), ("le", str(upper)))
+                    lines.append(f"{metric}_bucket{format_labels(labels)} {cumulative}")
+                labels = format_labels((("phase", phase),))
+                lines.append(f"{metric}_sum{labels} {histogram.sum:.6f}")
+                lines.append(f"{metric}_count{labels} {histogram.count}")
+
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_crawl_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_crawl_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path):
+        # node_exporter 可能在任意时刻读取，必须整体替换，不能写到一半
+        write_atomic(path, self.to_prometheus())
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,85 @@
+"""
+爬取进度
+汇总爬虫发出的进度事件（见 ChaoxingImageCrawler.progress），界面按固定帧率读取 snapshot 显示，
+事件再多也只是在锁内累加计数，显示开销与下载速度无关
+"""
+
+import threading
+import time
+from collections import deque
+
+# 计算当前速度的时间窗口(秒)
+RATE_WINDOW = 3.0
+
+
+class CrawlProgress:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes = 0
+        # (时间, 已完成图片数, 字节数) 采样，由 snapshot 写入
+        self.samples = deque()
+
+    def handle(self, event, fields):
+        """可直接作为 crawler.progress_callback，在任意线程调用"""
+        with self.lock:
+            if event == "start":
+                self.reset()
+            elif event == "planned":
+                self.total += fields["images"]
+                self.done += fields["skipped"]
+            elif event == "image":
+                self.done += 1
+                if fields["outcome"] in ("failed", "circuit_open"):
+                    self.failed += 1
+            elif event == "bytes":
+                self.bytes += fields["n"]
+            elif event == "retry":
+                self.retries += 1
+            elif event == "finish":
+                self.finished = time.monotonic()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: done / total / failed / retries / bytes / elapsed，
+            以及最近 RATE_WINDOW 秒内的 mb_per_s 和按此速度估算的 eta（秒，无法估算时为 None）
+        """
+        with self.lock:
+            now = self.finished or time.monotonic()
+            # 结束后时间停在 finished，不再追加采样
+            if not self.samples or now > self.samples[-1][0]:
+                self.samples.append((now, self.done, self.bytes))
+            while len(self.samples) > 2 and now - self.samples[1][0] >= RATE_WINDOW:
+                self.samples.popleft()
+            then, done_then, bytes_then = self.samples[0]
+            window = now - then
+            if window <= 0:
+                # 采样不足时用整次爬取的平均速度
+                then, done_then, bytes_then = self.started, 0, 0
+                window = now - then
+            mb_per_s = (self.bytes - bytes_then) / window / 1e6 if window > 0 else 0.0
+            images_per_s = (self.done - done_then) / window if window > 0 else 0.0
+            remaining = max(self.total - self.done, 0)
+            if self.finished or not remaining:
+                eta = 0.0 if self.total else None
+            else:
+                eta = remaining / images_per_s if images_per_s > 0 else None
+            return {
+                "done": self.done,
+                "total": self.total,
+                "failed": self.failed,
+                "retries": self.retries,
+                "bytes": self.bytes,
+                "elapsed": now - self.started,
+                "mb_per_s": mb_per_s,
+                "eta": eta,
+            }
@@ -0,0 +1,124 @@
+"""
+下载清单
+用 SQLite 记录每张图片的下载结果（大小、哈希、状态），
+重新爬取同一章节时跳过已完成的图片，只下载新增或失败的页面
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+MANIFEST_FILENAME = ".chaoxing_manifest.db"
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+def file_sha256(filepath, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class DownloadManifest:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # 下载线程共用一个连接，写操作由 self.lock 串行化；
+        # 多进程分片爬取时几个进程会同时写同一个清单，用 WAL 并等待对方的写锁
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+                course TEXT NOT NULL,
+                chapter TEXT NOT NULL,
+                objectid TEXT NOT NULL,
+                url TEXT NOT NULL,
+                filename TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                updated_at TEXT,
+                PRIMARY KEY (course, chapter, objectid, url)
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sha256 ON images (sha256)")
+        self.conn.commit()
+
+    @classmethod
+    def in_dir(cls, save_dir):
+        """打开保存目录下的默认清单文件"""
+        return cls(os.path.join(save_dir, MANIFEST_FILENAME))
+
+    def get(self, key, url):
+        """
+        Args:
+            key: (课程, 章节, objectid) 元组
+            url: 图片URL
+
+        Returns:
+            dict: 记录内容，不存在时返回 None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT filename, size, sha256, status FROM images "
+                "WHERE course=? AND chapter=? AND objectid=? AND url=?",
+                (*key, url),
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(("filename", "size", "sha256", "status"), row))
+
+    def is_complete(self, key, url, filepath):
+        """记录为已完成且本地文件仍然存在、大小一致"""
+        record = self.get(key, url)
+        if not record or record["status"] != STATUS_DONE:
+            return False
+        try:
+            return os.path.getsize(filepath) == record["size"]
+        except OSError:
+            return False
+
+    def find_by_hash(self, sha256):
+        """返回内容哈希相同的已完成文件名，没有时返回 None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT filename FROM images WHERE sha256=? AND status=? LIMIT 1",
+                (sha256, STATUS_DONE),
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, key, url, filepath, ok, sha256=None):
+        """记录一张图片的下载结果，成功时写入文件大小和 SHA-256"""
+        size = None
+        if ok:
+            size = os.path.getsize(filepath)
+            sha256 = sha256 or file_sha256(filepath)
+        else:
+            sha256 = None
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO images "
+                "(course, chapter, objectid, url, filename, size, sha256, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *key,
+                    url,
+                    os.path.basename(filepath),
+                    size,
+                    sha256,
+                    STATUS_DONE if ok else STATUS_FAILED,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                ),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,290 @@
+"""
+流量控制
+- 自适应并发（AIMD）：图片请求正常且延迟平稳时逐步增加并发数，遇到限流响应（403/429/5xx）
+  或连接错误时立即减半，服务器给出 Retry-After 时在这段时间内不再发出新请求
+- 重试策略：指数退避 + 随机抖动
+- 熔断器：按图片服务器主机分别熔断，故障的镜像不再占用下载线程
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# 视为限流的状态码（5xx 也算在内）
+THROTTLE_STATUSES = {403, 429}
+# 平滑延迟超过最低延迟的倍数时认为服务器开始拥塞
+LATENCY_TOLERANCE = 2.0
+# 延迟拥塞时的温和降幅，限流时的降幅
+LATENCY_BACKOFF = 0.9
+THROTTLE_BACKOFF = 0.5
+# 平滑延迟的 EWMA 系数
+LATENCY_SMOOTHING = 0.2
+# 最低延迟基线每个请求缓慢上浮的比例，偶然的极低延迟不会让后续请求一直被判为拥塞
+BASELINE_DRIFT = 0.002
+# 接近上次被限流的并发数时，增长速度降为正常的这个比例，减少反复触发限流；
+# 在同一并发数上再次被限流时比例继续减半，最低到 MIN_PROBE
+PROBE_SLOWDOWN = 0.1
+MIN_PROBE = 0.01
+# Retry-After 最长遵守时间(秒)，避免异常响应让爬取停住
+MAX_PAUSE = 60.0
+
+
+def is_throttled(status):
+    return status in THROTTLE_STATUSES or (status is not None and status >= 500)
+
+
+def parse_retry_after(value):
+    """只支持秒数形式的 Retry-After，其他形式返回 None"""
+    try:
+        return min(max(float(value), 0.0), MAX_PAUSE)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestSlot:
+    """一次请求的结果，由调用方在 with 块内填写"""
+
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial=4, min_limit=1, max_limit=32, on_change=None):
+        """
+        Args:
+            initial: 初始并发数
+            min_limit / max_limit: 并发数上下限
+            on_change: 并发数因限流或拥塞下降时的回调 (新并发数, 原因)
+        """
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.on_change = on_change
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.min_latency = None
+        self.smoothed_latency = None
+        self.last_decrease = 0.0
+        self.paused_until = 0.0
+        self.throttled = 0
+        # 上次被限流时的并发数和接近它时的增长比例
+        self.ceiling = None
+        self.probe = PROBE_SLOWDOWN
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+    def try_acquire(self):
+        """有空闲并发额度且未暂停时占用一个，返回是否成功"""
+        with self.cond:
+            if time.monotonic() < self.paused_until or self.in_flight >= self.current:
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < self.current:
+                    self.in_flight += 1
+                    return
+                self.cond.wait(wait if wait > 0 else None)
+
+    async def acquire_async(self):
+        """供异步引擎使用，等待时让出事件循环"""
+        while not self.try_acquire():
+            pause = self.paused_until - time.monotonic()
+            await asyncio.sleep(min(max(pause, 0.01), 0.5))
+
+    def release(self, status=None, latency=None, retry_after=None, error=False):
+        """
+        归还并发额度并根据结果调整并发数
+
+        Args:
+            status: 响应状态码，连接错误时为 None
+            latency: 请求耗时(秒)
+            retry_after: 响应头 Retry-After 的原始值
+            error: 请求因连接错误或超时失败
+        """
+        changed = None
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if error or is_throttled(status):
+                self.throttled += 1
+                pause = parse_retry_after(retry_after)
+                if pause:
+                    self.paused_until = max(self.paused_until, now + pause)
+                reason = f"状态码 {status}" if status else "连接错误"
+                if not error:
+                    if self.ceiling is not None and self.current <= int(self.ceiling):
+                        self.probe = max(MIN_PROBE, self.probe / 2)
+                    else:
+                        self.probe = PROBE_SLOWDOWN
+                    self.ceiling = self.limit
+                changed = self.decrease(THROTTLE_BACKOFF, now, reason)
+            elif latency is not None:
+                changed = self.observe_latency(latency, now)
+            self.cond.notify_all()
+        if changed and self.on_change:
+            self.on_change(*changed)
+
+    def observe_latency(self, latency, now):
+        if self.min_latency is None:
+            self.min_latency = latency
+        self.min_latency = min(latency, self.min_latency * (1 + BASELINE_DRIFT))
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += LATENCY_SMOOTHING * (latency - self.smoothed_latency)
+
+        if self.smoothed_latency > self.min_latency * LATENCY_TOLERANCE:
+            return self.decrease(LATENCY_BACKOFF, now, "延迟升高")
+        # 每完成约 limit 个请求（一轮）并发数 +1，接近上次限流的并发数时放慢试探
+        step = 1 / self.limit
+        if self.ceiling is not None and self.limit + 1 >= self.ceiling:
+            step *= self.probe
+        self.limit = min(self.max_limit, self.limit + step)
+        return None
+
+    def decrease(self, factor, now, reason):
+        # 同一轮内的多个失败只算一次，避免并发数被连续减半到底
+        window = self.smoothed_latency or 0.1
+        if now - self.last_decrease < window:
+            return None
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+        return self.current, reason
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个并发额度，with 块结束时按 slot.status / slot.retry_after 调整并发数，
+        块内抛出异常视为连接错误
+        """
+        self.acquire()
+        slot = RequestSlot()
+        start = time.perf_counter()
+        try:
+            yield slot
+        except BaseException:
+            self.release(slot.status, error=slot.status is None)
+            raise
+        self.release(slot.status, time.perf_counter() - start, slot.retry_after)
+
+
+class FixedLimiter(AdaptiveLimiter):
+    """固定并发数的额度：只限制同时进行的请求数，不随限流和延迟调整（关闭自适应并发时使用）"""
+
+    def __init__(self, limit):
+        super().__init__(initial=limit, max_limit=limit)
+
+    def release(self, status=None, latency=None, retry_after=None, error=False):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+
+# 值得重试的状态码，其余非 200 状态（404 等）重试也不会成功
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(status):
+    """status 为 None 表示连接错误或超时"""
+    return status is None or status in RETRY_STATUSES
+
+
+class RetryPolicy:
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=30.0, seed=None):
+        """
+        Args:
+            attempts: 包括第一次在内的最多尝试次数
+            base_delay: 第一次重试前的最长等待(秒)，之后每次翻倍
+            max_delay: 单次等待上限(秒)
+        """
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.random = random.Random(seed)
+
+    def delay(self, attempt, retry_after=None):
+        """第 attempt 次失败后的等待时间：指数退避 + 全抖动，服务器给出 Retry-After 时不少于它"""
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = self.random.uniform(0, cap)
+        pause = parse_retry_after(retry_after)
+        return max(delay, pause) if pause else delay
+
+
+class CircuitBreaker:
+    """
+    单个图片服务器的熔断器
+    连续失败 failure_threshold 次后熔断，reset_timeout 秒内该服务器的请求直接失败，
+    之后只放行一个试探请求，成功则恢复，失败则继续熔断
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """记录一次失败，返回这次失败是否导致熔断"""
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class CircuitBreakers:
+    """按主机（s1 ~ s9.ananas.chaoxing.com 等）分别熔断"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def get(self, host):
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[host]
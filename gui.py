@@ -1,13 +1,33 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, font, filedialog
+import multiprocessing
 import threading
 import webbrowser
 import os
-import requests
-from chaoxing_crawler import ChaoxingImageCrawler
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from crawl_progress import CrawlProgress
 import json
 from datetime import datetime
-from auto_cookie import get_cookie_auto
+
+# 爬虫（requests）、Cookie 文件（http.cookiejar 连带导入 urllib.request 和 ssl）和 Selenium
+# 导入较慢，首次使用时才导入，窗口先显示出来；爬虫模块在窗口显示后于后台线程预先导入，见 preload_crawler
+
+# 日志面板最多保留的行数，更早的日志只保留在日志文件中
+LOG_MAX_LINES = 2000
+# 主线程每隔 LOG_PUMP_INTERVAL 毫秒取出排队的日志，一次最多显示 LOG_BATCH_SIZE 条
+LOG_PUMP_INTERVAL = 100
+LOG_BATCH_SIZE = 1000
+# 完整日志写入程序目录下的滚动日志文件
+LOG_FILENAME = "crawler.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+# Cookie 验证记录
+COOKIE_CACHE_FILENAME = "cookie_validity.json"
+COOKIE_JAR_FILENAME = "cookies.lwp"
+# 进度面板的刷新间隔(毫秒)，与进度事件的多少无关
+PROGRESS_FRAME_INTERVAL = 200
 
 
 class ChaoxingCrawlerGUI:
@@ -31,9 +51,23 @@ class ChaoxingCrawlerGUI:
         self.cookie_modified = False
         self.crawl_mode = "course"  # 默认爬取课程图片
 
+        # 下载线程只把日志放入队列，由主线程定时批量写入日志面板（tkinter 不是线程安全的）
+        self.log_queue = queue.SimpleQueue()
+        self.setup_log_file()
+        # 爬虫的进度事件只在 CrawlProgress 中累加，进度面板按固定帧率读取
+        self.progress = CrawlProgress()
+        # 最近验证通过的 Cookie（只保存哈希）和带域名、过期时间的 Cookie 文件，
+        # 开始爬取或获取 Cookie 时由 load_cookie_store 创建
+        self.cookie_cache = None
+        self.cookie_store = None
+        self.cookie_lock = threading.Lock()
+
         self.setup_styles()
         self.create_widgets()
         self.load_saved_data()
+        self.root.after(LOG_PUMP_INTERVAL, self.pump_log)
+        self.root.after(PROGRESS_FRAME_INTERVAL, self.render_progress)
+        self.root.after_idle(self.preload_crawler)
 
         self.cookie_text.bind("<KeyRelease>", self.on_cookie_change)
 
@@ -195,6 +229,7 @@ class ChaoxingCrawlerGUI:
         self.create_directory_section(input_frame)
         self.create_action_buttons(input_frame)
 
+        self.create_progress_section(log_frame)
         self.create_log_section(log_frame)
 
         input_frame.update()
@@ -394,7 +429,36 @@ class ChaoxingCrawlerGUI:
             activebackground=self.colors["bg"],
             cursor="hand2",
         )
-        homework_radio.pack(side=tk.LEFT)
+        homework_radio.pack(side=tk.LEFT, padx=(0, 5))
+
+        whole_course_radio = tk.Radiobutton(
+            mode_frame,
+            text="📖 整门课程",
+            variable=self.mode_var,
+            value="whole_course",
+            font=("Microsoft YaHei UI", 9, "bold"),
+            bg=self.colors["bg"],
+            fg=self.colors["text"],
+            selectcolor=self.colors["bg"],
+            activebackground=self.colors["bg"],
+            cursor="hand2",
+        )
+        whole_course_radio.pack(side=tk.LEFT, padx=(0, 5))
+
+        # 课程图片按页码顺序同时合成 PDF（作业图片不适用）
+        self.pdf_var = tk.BooleanVar(value=False)
+        pdf_check = tk.Checkbutton(
+            mode_frame,
+            text="📄 合成PDF",
+            variable=self.pdf_var,
+            font=("Microsoft YaHei UI", 9, "bold"),
+            bg=self.colors["bg"],
+            fg=self.colors["text"],
+            selectcolor=self.colors["bg"],
+            activebackground=self.colors["bg"],
+            cursor="hand2",
+        )
+        pdf_check.pack(side=tk.LEFT)
 
         self.crawl_btn = tk.Button(
             left_frame,
@@ -438,6 +502,43 @@ class ChaoxingCrawlerGUI:
         )
         save_btn.pack(side=tk.RIGHT)
 
+    def create_progress_section(self, parent):
+        section_frame = tk.Frame(parent, bg=self.colors["white"], padx=16, pady=8)
+        section_frame.pack(fill=tk.X, pady=(0, 6))
+
+        self.progress_bar = ttk.Progressbar(
+            section_frame, orient=tk.HORIZONTAL, mode="determinate", maximum=1
+        )
+        self.progress_bar.pack(fill=tk.X)
+
+        self.progress_label = tk.Label(
+            section_frame,
+            text="📊 等待开始",
+            font=("Microsoft YaHei UI", 9),
+            bg=self.colors["white"],
+            fg=self.colors["text_light"],
+            anchor="w",
+        )
+        self.progress_label.pack(fill=tk.X, pady=(4, 0))
+
+    def render_progress(self):
+        """按固定帧率刷新进度面板"""
+        state = self.progress.snapshot()
+        if state["total"]:
+            eta = state["eta"]
+            eta_text = (
+                f"{int(eta) // 60:02d}:{int(eta) % 60:02d}" if eta is not None else "--:--"
+            )
+            text = (
+                f"📊 {state['done']}/{state['total']} 张  ·  {state['bytes'] / 1e6:.1f} MB  ·  "
+                f"{state['mb_per_s']:.2f} MB/s  ·  剩余 {eta_text}  ·  "
+                f"重试 {state['retries']}  ·  失败 {state['failed']}"
+            )
+            self.progress_bar.config(maximum=state["total"], value=state["done"])
+            if text != self.progress_label.cget("text"):
+                self.progress_label.config(text=text)
+        self.root.after(PROGRESS_FRAME_INTERVAL, self.render_progress)
+
     def create_log_section(self, parent):
         section_frame = tk.Frame(parent, bg=self.colors["white"], padx=16, pady=11)
         section_frame.pack(fill=tk.BOTH, expand=True)
@@ -617,16 +718,74 @@ class ChaoxingCrawlerGUI:
             self.save_dir_entry.delete(0, tk.END)
             self.save_dir_entry.insert(0, os.path.abspath(directory))
 
+    def load_cookie_store(self):
+        """
+        首次使用时导入 cookie_store 并创建 self.cookie_store / self.cookie_cache（可在下载线程调用）：
+        有效期内的 Cookie 开始爬取时不再验证，服务器轮换的 Cookie 写回 Cookie 文件
+        """
+        with self.cookie_lock:
+            if self.cookie_store is None:
+                from cookie_store import CookieStore, CookieValidityCache
+
+                directory = os.path.dirname(__file__)
+                self.cookie_cache = CookieValidityCache(
+                    os.path.join(directory, COOKIE_CACHE_FILENAME)
+                )
+                self.cookie_store = CookieStore(os.path.join(directory, COOKIE_JAR_FILENAME))
+        return self.cookie_store
+
+    def preload_crawler(self):
+        """窗口显示后在后台导入爬虫模块，点击开始爬取时不再等待导入"""
+        threading.Thread(target=lambda: __import__("chaoxing_crawler"), daemon=True).start()
+
+    def setup_log_file(self):
+        """完整日志由后台线程写入滚动日志文件，不占用下载线程和界面线程"""
+        log_path = os.path.join(os.path.dirname(__file__), LOG_FILENAME)
+        handler = RotatingFileHandler(
+            log_path,
+            maxBytes=LOG_FILE_MAX_BYTES,
+            backupCount=LOG_FILE_BACKUPS,
+            encoding="utf-8",
+            delay=True,
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        file_queue = queue.SimpleQueue()
+        self.log_listener = QueueListener(file_queue, handler)
+        self.log_listener.start()
+        self.file_logger = logging.getLogger("chaoxing_gui")
+        self.file_logger.setLevel(logging.INFO)
+        self.file_logger.propagate = False
+        self.file_logger.handlers = [QueueHandler(file_queue)]
+
     def log(self, message, level="INFO"):
+        """可以在任意线程调用"""
         timestamp = datetime.now().strftime("%H:%M:%S")
+        self.log_queue.put((timestamp, level, message))
+        self.file_logger.info(f"[{level}] {message}")
 
-        prefix = f"[{timestamp}] [{level}]"
+    def pump_log(self):
+        """把排队的日志批量写入日志面板，面板只保留最近 LOG_MAX_LINES 行"""
+        records = []
+        try:
+            while len(records) < LOG_BATCH_SIZE:
+                records.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
 
-        self.log_text.config(state="normal")
-        self.log_text.insert(tk.END, prefix + " ", level)
-        self.log_text.insert(tk.END, message + "\n", level)
-        self.log_text.see(tk.END)
-        self.log_text.config(state="disabled")
+        if records:
+            self.log_text.config(state="normal")
+            for timestamp, level, message in records[-LOG_MAX_LINES:]:
+                self.log_text.insert(tk.END, f"[{timestamp}] [{level}] ", level)
+                self.log_text.insert(tk.END, message + "\n", level)
+            lines = int(self.log_text.index("end-1c").split(".")[0]) - 1
+            if lines > LOG_MAX_LINES:
+                self.log_text.delete("1.0", f"{lines - LOG_MAX_LINES + 1}.0")
+            self.log_text.see(tk.END)
+            self.log_text.config(state="disabled")
+
+        # 积压较多时立即处理下一批，否则按固定间隔轮询
+        delay = 1 if len(records) == LOG_BATCH_SIZE else LOG_PUMP_INTERVAL
+        self.root.after(delay, self.pump_log)
 
     def clear_log(self):
         self.log_text.config(state="normal")
@@ -706,9 +865,20 @@ class ChaoxingCrawlerGUI:
         
         def get_cookie_thread():
             try:
+                from auto_cookie import get_cookie_auto
+                from transport import shared_session
+
+                self.load_cookie_store()
+                # 已保存的 Cookie 能通过 HTTP 续期时不需要打开浏览器
+                if self.cookie_store.as_dict() and self.cookie_store.renew(shared_session({})):
+                    self.log("✅ 已通过续期获得有效Cookie，无需打开浏览器", "SUCCESS")
+                    self.on_cookie_rotated()
+                    return
+
                 cookie = get_cookie_auto(
                     callback=lambda msg: self.root.after(0, lambda: self.log(msg, "INFO")),
-                    keep_browser_open=True  # 保持浏览器打开
+                    keep_browser_open=True,  # 保持浏览器打开
+                    store=self.cookie_store,
                 )
                 
                 if cookie:
@@ -766,6 +936,7 @@ class ChaoxingCrawlerGUI:
             if cookie_str:
                 self.save_cookie(cookie_str)
 
+        self.log_listener.stop()
         self.root.destroy()
 
     def load_saved_data(self):
@@ -824,34 +995,33 @@ class ChaoxingCrawlerGUI:
                 cookies[key.strip()] = value.strip()
         return cookies
 
-    def validate_cookie(self, cookies):
-        try:
-            test_url = "https://mooc1.chaoxing.com/mooc-ans/mycourse/studentstudy"
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
+    def on_cookie_rotated(self):
+        """Cookie 文件中的 Cookie 有更新时同步到输入框和 saved_cookie.json（可在下载线程调用）"""
+        cookie_str = self.cookie_store.to_cookie_string()
 
-            session = requests.Session()
-            session.cookies.update(cookies)
+        def update_text():
+            self.cookie_text.delete(1.0, tk.END)
+            self.cookie_text.insert(1.0, cookie_str)
+            self.update_cookie_status()
 
-            response = session.get(
-                test_url, headers=headers, timeout=10, allow_redirects=False
-            )
+        self.save_cookie(cookie_str)
+        self.cookie_modified = False
+        self.root.after(0, update_text)
+        return cookie_str
 
-            if response.status_code == 200 or response.status_code == 302:
-                return True
-            elif "登录" in response.text or "login" in response.text.lower():
-                return False
-            else:
-                return True
-        except Exception:
-            return False
+    def save_modified_cookie(self, cookie_str):
+        """Cookie 验证通过后保存用户修改过的 Cookie（可在下载线程调用）"""
+        if self.cookie_modified and cookie_str:
+            self.save_cookie(cookie_str)
+            self.cookie_modified = False
+            self.root.after(0, self.update_cookie_status)
 
     def start_crawl(self):
         url = self.url_entry.get().strip()
         cookie_str = self.cookie_text.get(1.0, tk.END).strip()
         save_dir = self.save_dir_entry.get().strip()
         crawl_mode = self.mode_var.get()
+        make_pdf = self.pdf_var.get()
 
         if not url:
             if cookie_str:
@@ -879,50 +1049,85 @@ class ChaoxingCrawlerGUI:
             return
 
         self.crawl_btn.config(state="disabled", bg="#9E9E9E")
-        self.crawl_btn.config(text="⏳ 验证Cookie...")
+        self.crawl_btn.config(text="⏳ 爬取中...")
 
         save_dir_abs = os.path.abspath(save_dir)
 
-        mode_text = "课程图片" if crawl_mode == "course" else "作业图片"
+        mode_text = {
+            "course": "课程图片",
+            "homework": "作业图片",
+            "whole_course": "整门课程",
+        }[crawl_mode]
         self.log("=" * 70, "INFO")
         self.log(f"🚀 开始爬取任务 - {mode_text}", "INFO")
         self.log(f"📚 课程链接: {url[:80]}...", "INFO")
         self.log(f"📁 保存目录: {save_dir_abs}", "INFO")
         self.log("=" * 70, "INFO")
-        self.log("🔍 正在验证Cookie有效性...", "INFO")
 
         def validate_and_crawl():
             nonlocal cookie_str  # 声明使用外层变量
+            from chaoxing_crawler import ChaoxingImageCrawler, CookieExpiredError
+            from transport import shared_session
+
             try:
-                cookies = self.parse_cookie(cookie_str)
+                self.load_cookie_store()
+                # Cookie 文件中保留了域名和过期时间，Cookie 的集合以输入框为准（输入框中删掉的也从文件中删除）
+                self.cookie_store.set_from_dict(self.parse_cookie(cookie_str))
+                session = shared_session({})
+                self.cookie_store.apply(session)
+                cookies = self.cookie_store.as_dict()
+
+                # 本地能确定时不请求服务器；否则直接开始爬取，由第一个页面请求的响应验证 Cookie
+                cached = self.cookie_cache.check(cookies)
+                if cached is False:
+                    self.log("🔄 p_auth_token 已过期，正在续期...", "WARNING")
+                    if not self.cookie_store.renew(session):
+                        self.root.after(0, lambda: self.on_cookie_invalid())
+                        return
+                    self.log("✅ Cookie已续期", "SUCCESS")
+                    cookie_str = self.on_cookie_rotated()
+                    cookies = self.cookie_store.as_dict()
+                    cached = None
+                if cached:
+                    self.log("✅ Cookie验证通过（最近已验证）", "SUCCESS")
+                    self.save_modified_cookie(cookie_str)
+                else:
+                    self.log("🔍 Cookie将在第一个页面请求中验证", "INFO")
 
-                if not self.validate_cookie(cookies):
+                # Session 中已经是带域名的 Cookie，不再按名称重复设置
+                crawler = ChaoxingImageCrawler({}, session=session, pdf=make_pdf)
+                crawler.log_callback = self.log
+                crawler.progress_callback = self.progress.handle
+
+                try:
+                    if crawl_mode == "course":
+                        success = crawler.crawl_images(url, save_dir)
+                    elif crawl_mode == "whole_course":
+                        success = crawler.crawl_course(url, save_dir)
+                    else:
+                        success = crawler.crawl_homework_images(url, save_dir)
+                except CookieExpiredError:
+                    success = False
+
+                # 服务器在爬取中通过 Set-Cookie 轮换的 Cookie 写回 Cookie 文件和输入框
+                if self.cookie_store.absorb(session):
+                    self.log("🔄 服务器更新了Cookie，已保存", "INFO")
+                    cookie_str = self.on_cookie_rotated()
+                    cookies = self.cookie_store.as_dict()
+
+                if crawler.cookie_valid is not None:
+                    self.cookie_cache.record(cookies, crawler.cookie_valid)
+                if crawler.cookie_valid is False:
                     self.root.after(0, lambda: self.on_cookie_invalid())
                     return
-
-                if self.cookie_modified and cookie_str:
-                    self.save_cookie(cookie_str)
-                    self.cookie_modified = False
-                    self.root.after(0, self.update_cookie_status)
-
-                self.root.after(0, lambda: self.crawl_btn.config(text="⏳ 爬取中..."))
-                self.root.after(0, lambda: self.log("✅ Cookie验证通过", "SUCCESS"))
-
-                crawler = ChaoxingImageCrawler(cookies)
-                crawler.log_callback = self.log
-                
-                if crawl_mode == "course":
-                    success = crawler.crawl_images(url, save_dir)
-                else:
-                    success = crawler.crawl_homework_images(url, save_dir)
+                if crawler.cookie_valid and not cached:
+                    self.log("✅ Cookie验证通过", "SUCCESS")
+                    self.save_modified_cookie(cookie_str)
 
                 if success:
                     self.log("=" * 70, "SUCCESS")
                     self.log("✅ 爬取任务完成！", "SUCCESS")
                     self.log("=" * 70, "SUCCESS")
-                    
-                    # 爬取完成后打开带Cookie的浏览器
-                    self.root.after(0, lambda: self.open_browser_with_cookie(cookie_str))
                 else:
                     self.log("=" * 70, "ERROR")
                     self.log("❌ 爬取任务失败", "ERROR")
@@ -1000,8 +1205,19 @@ class ChaoxingCrawlerGUI:
 
 
 def main():
+    # 打包后的 exe 中，后处理进程池（CHAOXING_POSTPROCESS）的子进程会重新运行 exe，
+    # 必须在创建窗口之前交给 multiprocessing 处理，否则每个子进程都会打开一个界面
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ChaoxingCrawlerGUI(root)
+    if os.environ.get("CHAOXING_STARTUP_PROBE") == "1":
+        # 启动耗时测试（benchmark.py --startup）：窗口第一次绘制完成后报告并退出
+        def report_ready():
+            root.update()
+            print("window ready", flush=True)
+            root.destroy()
+
+        root.after_idle(report_ready)
     root.mainloop()
 
 
@@ -0,0 +1,122 @@
+"""
+作业页面增量解析
+边接收页面边解析，每个 stuAnswerContent 答案区块结束时立即得到其中的图片URL，
+内存占用与页面大小无关。
+
+课程名和题目名只从第一个答案区块之前的内容中查找：答案区块开始时名称即确定下来
+（缺少的用 knowledgename 或默认名称代替），图片不必等整页接收完才开始下载
+"""
+
+import re
+from html.parser import HTMLParser
+
+COURSE_NAME_PATTERN = re.compile(r'"coursename"\s*:\s*"([^"]+)"')
+KNOWLEDGE_NAME_PATTERN = re.compile(r'"knowledgename"\s*:\s*"([^"]+)"')
+ANSWER_MARKER = "stuAnswerContent"
+# 跨分块匹配时保留的上一块末尾长度
+TAIL_SIZE = 512
+
+
+class HomeworkPageParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.course_name = None
+        self.title = None
+        self.knowledge_name = None
+        self.images = []
+        self.seen = set()
+        self.received = 0
+
+        self.tail = ""
+        self.in_answer = False
+        self.section_originals = []
+        self.section_srcs = []
+        self.in_title = False
+        self.title_text = ""
+        # 第一个答案区块开始时确定的 (课程名, 题目名)
+        self.final_names = None
+        self.answers_reached = False
+
+    def feed(self, data):
+        self.received += len(data)
+        self.scan_names(data)
+        super().feed(data)
+
+    def scan_names(self, data):
+        """
+        在原始文本上查找课程名和章节名，保留上一块末尾以免名称被分块截断；
+        只查找第一个答案区块之前的部分，结果与分块方式无关
+        """
+        if self.answers_reached or (
+            self.course_name is not None and self.knowledge_name is not None
+        ):
+            return
+        window = self.tail + data
+        marker = window.find(ANSWER_MARKER)
+        if marker != -1:
+            window = window[:marker]
+            self.answers_reached = True
+        if self.course_name is None:
+            match = COURSE_NAME_PATTERN.search(window)
+            if match:
+                self.course_name = match.group(1)
+        if self.knowledge_name is None:
+            match = KNOWLEDGE_NAME_PATTERN.search(window)
+            if match:
+                self.knowledge_name = match.group(1)
+        self.tail = window[-TAIL_SIZE:]
+
+    @property
+    def names_ready(self):
+        """课程名和题目名已确定（都已找到，或答案区块已经开始），可以开始按最终文件名下载"""
+        return self.final_names is not None or (
+            self.course_name is not None and self.title is not None
+        )
+
+    def names(self):
+        """返回 (课程名, 题目名)，题目名优先用 mark_title，其次 knowledgename，与整页解析相同"""
+        if self.final_names is not None:
+            return self.final_names
+        course_name = self.course_name or "课程"
+        homework_name = self.title or self.knowledge_name or "作业"
+        return course_name, homework_name
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        self.in_title = False
+
+        if tag == "h2" and attrs.get("class") == "mark_title" and self.title is None:
+            self.in_title = True
+            self.title_text = ""
+        elif tag == "dd" and (attrs.get("class") or "").startswith("textwrap stuAnswerContent"):
+            if self.final_names is None:
+                self.final_names = self.names()
+            self.in_answer = True
+            self.section_originals = []
+            self.section_srcs = []
+
+        if self.in_answer:
+            # 优先使用 data-original（原图），区块内没有时才用 img 的 src
+            if attrs.get("data-original"):
+                self.section_originals.append(attrs["data-original"])
+            if tag == "img" and attrs.get("src"):
+                self.section_srcs.append(attrs["src"])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.in_title and tag == "h2" and self.title_text.strip():
+            self.title = self.title_text.strip()
+        self.in_title = False
+
+        if tag == "dd" and self.in_answer:
+            self.in_answer = False
+            for url in self.section_originals or self.section_srcs:
+                if url not in self.seen:
+                    self.seen.add(url)
+                    self.images.append(url)
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_text += data
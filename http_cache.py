@@ -0,0 +1,94 @@
+"""
+HTTP 条件请求缓存
+保存卡片API、预览页面响应的 ETag / Last-Modified，下次请求时带上
+If-None-Match / If-Modified-Since，服务器返回 304 时直接使用本地缓存的页面
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+HTTP_CACHE_DIRNAME = ".chaoxing_cache"
+
+
+class HttpCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def in_dir(cls, save_dir):
+        """使用保存目录下的默认缓存目录"""
+        return cls(os.path.join(save_dir, HTTP_CACHE_DIRNAME))
+
+    def paths(self, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, name)
+        return base + ".json", base + ".body"
+
+    def load(self, url):
+        meta_path, body_path = self.paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if meta.get("url") != url:
+            return None, None
+        return meta, body
+
+    def store(self, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            # 没有校验信息的响应无法做条件请求，不缓存
+            return
+
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "encoding": response.encoding,
+        }
+        meta_path, body_path = self.paths(url)
+        self.write(body_path, response.content)
+        self.write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def write(self, path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, session, url, headers=None, **kwargs):
+        """
+        发送条件 GET 请求
+
+        Returns:
+            requests.Response: 服务器返回 304 时状态码改为 200、内容替换为缓存的页面，
+            并设置 response.from_cache = True
+        """
+        headers = dict(headers or {})
+        meta, body = self.load(url)
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = session.get(url, headers=headers, **kwargs)
+        response.from_cache = False
+
+        if response.status_code == 304 and meta:
+            response.status_code = 200
+            response._content = body
+            response.encoding = meta.get("encoding") or "utf-8"
+            response.from_cache = True
+        elif response.status_code == 200 and not response.history and response.url == url:
+            # 被重定向的响应（例如 Cookie 失效时的登录页）不是这个 URL 的内容，不缓存
+            self.store(url, response)
+
+        return response
@@ -0,0 +1,253 @@
+"""
+爬取任务队列
+多台机器分担同一个镜像任务：生产者把章节任务放入队列，各节点的工作进程租用任务，
+完成后确认（ack），失败时退回（nack）稍后重试。租约在可见性超时后自动失效，
+工作进程崩溃或断网时它租用的任务会重新分配给其他节点。
+
+默认后端是 SQLite 文件（sqlite:///path 或直接给文件路径），离线即可使用。
+SQLite 使用回滚日志（不用 WAL，WAL 依赖同一台主机上的共享内存），靠文件锁互斥：
+多台机器共用时文件所在的网络文件系统必须正确实现 POSIX 文件锁（例如开启锁服务的 NFSv4、
+支持字节范围锁的 SMB）；不能保证这一点时 SQLite 队列只适合单机多进程，
+多机请改用其他后端。其他后端（Redis 等）实现 Broker 的接口后
+用 register_broker 注册即可通过 open_broker 打开。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_QUEUE = "chapters"
+# 租约有效期(秒)，工作进程需要在到期前 extend，否则任务会被重新分配
+DEFAULT_VISIBILITY_TIMEOUT = 300.0
+# 超过这个尝试次数仍失败的任务不再分配，留在队列中供人工检查
+DEFAULT_MAX_ATTEMPTS = 5
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_DEAD = "dead"
+
+
+class Task:
+    """租用到的一个任务，ack / nack / extend 时凭 token 确认租约仍属于自己"""
+
+    def __init__(self, task_id, queue, payload, attempts, token):
+        self.id = task_id
+        self.queue = queue
+        self.payload = payload
+        self.attempts = attempts
+        self.token = token
+
+    def __repr__(self):
+        return f"Task({self.id}, {self.queue}, attempts={self.attempts})"
+
+
+class Broker:
+    """队列后端的接口"""
+
+    def put(self, payload, queue=DEFAULT_QUEUE, key=None):
+        """
+        放入一个任务，返回是否放入
+
+        Args:
+            payload: 可 JSON 序列化的任务内容
+            key: 去重键，同一队列中已有相同 key 的未完成任务时不再放入
+        """
+        raise NotImplementedError
+
+    def lease(self, worker_id, queue=DEFAULT_QUEUE, limit=1):
+        """
+        租用最多 limit 个可见的任务，返回 Task 列表；
+        已用完最大尝试次数、最后一次租约又到期的任务记为 dead，不再分配
+        """
+        raise NotImplementedError
+
+    def extend(self, task):
+        """延长租约，返回 False 表示租约已过期并被其他节点取走"""
+        raise NotImplementedError
+
+    def ack(self, task):
+        """确认任务完成，返回 False 表示租约已失效"""
+        raise NotImplementedError
+
+    def nack(self, task, delay=0.0, error=None):
+        """退回任务，delay 秒后重新可见；达到最大尝试次数时不再分配"""
+        raise NotImplementedError
+
+    def stats(self, queue=DEFAULT_QUEUE):
+        """各状态的任务数，租用中的任务计为 leased"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SqliteBroker(Broker):
+    def __init__(
+        self,
+        path,
+        visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # 多个进程同时租用任务时等待对方的写锁；事务由 BEGIN IMMEDIATE 显式控制。
+        # 用回滚日志而不是 WAL：WAL 的共享内存索引在网络文件系统上无法跨主机同步，
+        # 以前用 WAL 创建的队列文件也在这里改回回滚日志
+        self.conn = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                key TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                visible_at REAL NOT NULL,
+                token TEXT,
+                worker TEXT,
+                last_error TEXT,
+                updated_at REAL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_visible ON tasks (queue, status, visible_at)"
+        )
+        # 只对未完成的任务去重，已完成的章节可以再次放入重新爬取
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_pending_key ON tasks (queue, key) "
+            f"WHERE status = '{STATUS_PENDING}'"
+        )
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE 事务：一开始就取得写锁，两个节点不会租到同一个任务"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def put(self, payload, queue=DEFAULT_QUEUE, key=None):
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO tasks (queue, payload, key, status, visible_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (queue, json.dumps(payload, ensure_ascii=False), key, STATUS_PENDING, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def lease(self, worker_id, queue=DEFAULT_QUEUE, limit=1):
+        now = time.time()
+        tasks = []
+        with self.transaction() as conn:
+            # 最后一次尝试的租约到期（工作进程每次都崩溃）的任务不再分配
+            conn.execute(
+                "UPDATE tasks SET status=?, token=NULL, updated_at=?, "
+                "last_error=COALESCE(last_error || '; ', '') || ? "
+                "WHERE queue=? AND status=? AND visible_at<=? AND attempts>=?",
+                (
+                    STATUS_DEAD, now, "租约到期，工作进程可能已崩溃",
+                    queue, STATUS_PENDING, now, self.max_attempts,
+                ),
+            )
+            rows = conn.execute(
+                "SELECT id, payload, attempts FROM tasks "
+                "WHERE queue=? AND status=? AND visible_at<=? ORDER BY id LIMIT ?",
+                (queue, STATUS_PENDING, now, limit),
+            ).fetchall()
+            for task_id, payload, attempts in rows:
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE tasks SET attempts=?, visible_at=?, token=?, worker=?, updated_at=? "
+                    "WHERE id=?",
+                    (attempts + 1, now + self.visibility_timeout, token, worker_id, now, task_id),
+                )
+                tasks.append(Task(task_id, queue, json.loads(payload), attempts + 1, token))
+        return tasks
+
+    def extend(self, task):
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET visible_at=?, updated_at=? WHERE id=? AND token=? AND status=?",
+                (now + self.visibility_timeout, now, task.id, task.token, STATUS_PENDING),
+            )
+            return cursor.rowcount == 1
+
+    def ack(self, task):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status=?, token=NULL, updated_at=? WHERE id=? AND token=?",
+                (STATUS_DONE, time.time(), task.id, task.token),
+            )
+            return cursor.rowcount == 1
+
+    def nack(self, task, delay=0.0, error=None):
+        now = time.time()
+        status = STATUS_DEAD if task.attempts >= self.max_attempts else STATUS_PENDING
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status=?, visible_at=?, token=NULL, last_error=?, updated_at=? "
+                "WHERE id=? AND token=?",
+                (status, now + delay, error, now, task.id, task.token),
+            )
+            return cursor.rowcount == 1
+
+    def stats(self, queue=DEFAULT_QUEUE):
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT CASE WHEN status=? AND token IS NOT NULL AND visible_at>? "
+                "THEN 'leased' ELSE status END, COUNT(*) FROM tasks WHERE queue=? GROUP BY 1",
+                (STATUS_PENDING, now, queue),
+            ).fetchall()
+        counts = {STATUS_PENDING: 0, "leased": 0, STATUS_DONE: 0, STATUS_DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def open_sqlite(url, **options):
+    # sqlite:///abs/path 为绝对路径，sqlite://rel/path 为相对路径
+    return SqliteBroker(url[len("sqlite://"):], **options)
+
+
+BROKERS = {"sqlite": open_sqlite}
+
+
+def register_broker(scheme, factory):
+    """
+    注册队列后端
+
+    Args:
+        scheme: URL 协议名，如 "redis"
+        factory: factory(url, **options) 返回实现 Broker 接口的对象
+    """
+    BROKERS[scheme] = factory
+
+
+def open_broker(url, **options):
+    """按 URL 打开队列后端，不含 :// 时视为 SQLite 文件路径"""
+    if "://" not in url:
+        return SqliteBroker(url, **options)
+    scheme = url.split("://", 1)[0]
+    if scheme not in BROKERS:
+        raise ValueError(f"不支持的任务队列: {url}")
+    return BROKERS[scheme](url, **options)
@@ -0,0 +1,440 @@
+"""
+边下载边合成 PDF
+不依赖 PIL（打包时已排除）：JPEG 原样嵌入（DCTDecode），PNG 的 IDAT 数据本身就是
+zlib 流，配合 PNG 预测器参数（Predictor 15）原样嵌入（FlateDecode），都不需要解码像素。
+带 alpha 通道的 PNG 按行把颜色和 alpha 拆成两个图像（alpha 作为 SMask），
+PNG 的行滤波按字节、按通道进行，拆分后的行仍是有效的滤波数据，无需反滤波。
+
+图片按块从文件流式写入 PDF，内存中始终只有一块数据；
+PdfBook 按页码顺序写入，乱序到达的页面只记录文件路径，等前面的页面到达后再写。
+"""
+
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+# 图片的像素按这个分辨率换算为 PDF 页面尺寸（点，1/72 英寸）
+DEFAULT_DPI = 96
+READ_SIZE = 64 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG 颜色类型 -> (通道数, PDF 颜色空间)，调色板图像的颜色空间由 PLTE 生成
+PNG_COLOR_TYPES = {
+    0: (1, "/DeviceGray"),
+    2: (3, "/DeviceRGB"),
+    3: (1, None),
+    4: (2, "/DeviceGray"),
+    6: (4, "/DeviceRGB"),
+}
+JPEG_COLOR_SPACES = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}
+# 带尺寸信息的 JPEG 帧头（SOF0-SOF15，不含 DHT/JPG/DAC）
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class UnsupportedImageError(ValueError):
+    """不是 PDF 可直接嵌入的 JPEG/PNG"""
+
+
+class ImageInfo:
+    def __init__(self, path, kind, width, height):
+        self.path = path
+        self.kind = kind
+        self.width = width
+        self.height = height
+        # 图像字典中除尺寸、滤波器和 Length 以外的条目
+        self.entries = []
+        self.decode_parms = None
+        # PNG: IDAT 块在文件中的 (偏移, 长度)
+        self.chunks = []
+        self.channels = 1
+        self.bit_depth = 8
+        self.has_alpha = False
+
+
+def read_jpeg_info(path):
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            raise UnsupportedImageError("不是 JPEG 文件")
+        adobe = False
+        while True:
+            byte = f.read(1)
+            if not byte:
+                raise UnsupportedImageError("JPEG 文件中没有帧头")
+            if byte != b"\xff":
+                continue
+            marker = f.read(1)
+            while marker == b"\xff":
+                marker = f.read(1)
+            if not marker:
+                raise UnsupportedImageError("JPEG 文件中没有帧头")
+            code = marker[0]
+            if code == 0x01 or 0xD0 <= code <= 0xD9:
+                continue
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                raise UnsupportedImageError("JPEG 文件不完整")
+            length = struct.unpack(">H", length_bytes)[0]
+            segment = f.read(length - 2)
+            if code == 0xEE and segment.startswith(b"Adobe"):
+                adobe = True
+            if code in JPEG_SOF_MARKERS:
+                if len(segment) < 6:
+                    raise UnsupportedImageError("JPEG 帧头不完整")
+                bits, height, width, components = struct.unpack(">BHHB", segment[:6])
+                break
+
+    if components not in JPEG_COLOR_SPACES or not width or not height:
+        raise UnsupportedImageError(f"不支持的 JPEG（{components} 个颜色分量）")
+    info = ImageInfo(path, "jpeg", width, height)
+    info.entries = [
+        f"/ColorSpace {JPEG_COLOR_SPACES[components]}",
+        f"/BitsPerComponent {bits}",
+    ]
+    if components == 4 and adobe:
+        # Photoshop 保存的 CMYK JPEG 是反相的
+        info.entries.append("/Decode [1 0 1 0 1 0 1 0]")
+    return info
+
+
+def read_png_info(path):
+    with open(path, "rb") as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise UnsupportedImageError("不是 PNG 文件")
+        header = None
+        palette = None
+        chunks = []
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise UnsupportedImageError("PNG 文件不完整")
+            length, chunk_type = struct.unpack(">I4s", chunk_header)
+            if chunk_type == b"IDAT":
+                chunks.append((f.tell(), length))
+                f.seek(length + 4, os.SEEK_CUR)
+            elif chunk_type == b"IEND":
+                break
+            else:
+                data = f.read(length)
+                f.seek(4, os.SEEK_CUR)
+                if chunk_type == b"IHDR":
+                    header = struct.unpack(">IIBBBBB", data)
+                elif chunk_type == b"PLTE":
+                    palette = data
+        if not chunks or chunks[-1][0] + chunks[-1][1] > os.fstat(f.fileno()).st_size:
+            raise UnsupportedImageError("PNG 文件不完整")
+
+    if header is None:
+        raise UnsupportedImageError("PNG 文件缺少 IHDR")
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if interlace:
+        # 隔行扫描的数据无法用 PDF 的预测器直接解码
+        raise UnsupportedImageError("不支持隔行扫描的 PNG")
+    if color_type not in PNG_COLOR_TYPES:
+        raise UnsupportedImageError(f"不支持的 PNG 颜色类型 {color_type}")
+    channels, color_space = PNG_COLOR_TYPES[color_type]
+    if color_type == 3:
+        if not palette:
+            raise UnsupportedImageError("PNG 调色板缺失")
+        color_space = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+
+    info = ImageInfo(path, "png", width, height)
+    info.chunks = chunks
+    info.channels = channels
+    info.bit_depth = bit_depth
+    info.has_alpha = color_type in (4, 6)
+    colors = channels - 1 if info.has_alpha else channels
+    info.entries = [f"/ColorSpace {color_space}", f"/BitsPerComponent {bit_depth}"]
+    info.decode_parms = png_decode_parms(colors, bit_depth, width)
+    return info
+
+
+def read_image_info(path):
+    """按文件头识别 JPEG/PNG 并读取尺寸等信息，不读取像素数据"""
+    with open(path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"\xff\xd8"):
+        return read_jpeg_info(path)
+    if head == PNG_SIGNATURE:
+        return read_png_info(path)
+    raise UnsupportedImageError("不是 JPEG 或 PNG 图片")
+
+
+def png_decode_parms(colors, bit_depth, width):
+    return (
+        f"<< /Predictor 15 /Colors {colors} /BitsPerComponent {bit_depth} "
+        f"/Columns {width} >>"
+    )
+
+
+def iter_file(path):
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def iter_idat(info):
+    """依次读出所有 IDAT 块的数据（合起来是一个 zlib 流）"""
+    with open(info.path, "rb") as f:
+        for offset, length in info.chunks:
+            f.seek(offset)
+            while length:
+                block = f.read(min(length, READ_SIZE))
+                if not block:
+                    raise UnsupportedImageError("PNG 文件不完整")
+                length -= len(block)
+                yield block
+
+
+def iter_png_rows(info):
+    """逐行解压 PNG 数据，每行以滤波类型字节开头"""
+    row_size = 1 + (info.width * info.channels * info.bit_depth + 7) // 8
+    decompressor = zlib.decompressobj()
+    buffer = b""
+    rows = 0
+    for block in iter_idat(info):
+        buffer += decompressor.decompress(block)
+        full = len(buffer) - len(buffer) % row_size
+        for start in range(0, full, row_size):
+            if rows == info.height:
+                return
+            yield buffer[start:start + row_size]
+            rows += 1
+        buffer = buffer[full:]
+    if rows < info.height:
+        raise UnsupportedImageError("PNG 数据不完整")
+
+
+def iter_png_plane(info, alpha):
+    """
+    带 alpha 的 PNG 拆出颜色或 alpha 部分，重新压缩后输出
+    滤波按字节、在同一通道的相邻像素间进行，同一行按通道拆分后滤波类型不变
+    """
+    size = info.bit_depth // 8
+    step = info.channels * size
+    picked = range(step - size, step) if alpha else range(step - size)
+    width = len(picked)
+    compressor = zlib.compressobj()
+    for row in iter_png_rows(info):
+        pixels = memoryview(row)[1:]
+        plane = bytearray(len(pixels) // step * width + 1)
+        plane[0] = row[0]
+        for target, source in enumerate(picked):
+            plane[1 + target::width] = pixels[source::step]
+        output = compressor.compress(bytes(plane))
+        if output:
+            yield output
+    yield compressor.flush()
+
+
+class PdfWriter:
+    """
+    顺序写出 PDF 对象，最后写页面树、交叉引用表和文件尾
+
+    用法:
+        with open(path, "wb") as f:
+            writer = PdfWriter(f)
+            writer.add_image_page("1.jpg")
+            writer.close()
+    """
+
+    def __init__(self, f, dpi=DEFAULT_DPI):
+        self.f = f
+        self.dpi = dpi
+        # 1 号对象是目录，2 号是页面树，在 close 时写出
+        self.offsets = {}
+        self.next_id = 3
+        self.pages = []
+        self.f.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+
+    def new_id(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.f.tell()
+        self.f.write(f"{object_id} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+    def write_stream(self, object_id, entries, blocks):
+        """写出流对象，长度写在随后的对象中，写之前不需要知道数据长度"""
+        length_id = self.new_id()
+        self.offsets[object_id] = self.f.tell()
+        header = f"{object_id} 0 obj\n<< {' '.join(entries)} /Length {length_id} 0 R >>\nstream\n"
+        self.f.write(header.encode("latin-1"))
+        length = 0
+        for block in blocks:
+            self.f.write(block)
+            length += len(block)
+        self.f.write(b"\nendstream\nendobj\n")
+        self.write_object(length_id, str(length))
+
+    def write_image(self, info):
+        """写出图像 XObject，返回对象号"""
+        entries = [
+            "/Type /XObject",
+            "/Subtype /Image",
+            f"/Width {info.width}",
+            f"/Height {info.height}",
+        ] + info.entries
+        if info.kind == "jpeg":
+            entries.append("/Filter /DCTDecode")
+            blocks = iter_file(info.path)
+        else:
+            entries += ["/Filter /FlateDecode", f"/DecodeParms {info.decode_parms}"]
+            blocks = iter_png_plane(info, alpha=False) if info.has_alpha else iter_idat(info)
+        if info.has_alpha:
+            mask_id = self.new_id()
+            mask_entries = [
+                "/Type /XObject",
+                "/Subtype /Image",
+                f"/Width {info.width}",
+                f"/Height {info.height}",
+                "/ColorSpace /DeviceGray",
+                f"/BitsPerComponent {info.bit_depth}",
+                "/Filter /FlateDecode",
+                f"/DecodeParms {png_decode_parms(1, info.bit_depth, info.width)}",
+            ]
+            self.write_stream(mask_id, mask_entries, iter_png_plane(info, alpha=True))
+            entries.append(f"/SMask {mask_id} 0 R")
+        image_id = self.new_id()
+        self.write_stream(image_id, entries, blocks)
+        return image_id
+
+    def add_image_page(self, path):
+        """
+        添加一页，页面大小与图片相同
+        图片无法嵌入时抛出 UnsupportedImageError（或 zlib.error、OSError），已写的部分被撤销
+        """
+        info = read_image_info(path)
+        start = self.f.tell()
+        next_id = self.next_id
+        try:
+            image_id = self.write_image(info)
+            width = info.width * 72 / self.dpi
+            height = info.height * 72 / self.dpi
+            content = f"q {width:.2f} 0 0 {height:.2f} 0 0 cm /Im0 Do Q".encode("latin-1")
+            content_id = self.new_id()
+            self.write_stream(content_id, [], [content])
+            page_id = self.new_id()
+            self.write_object(
+                page_id,
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+                f"/Contents {content_id} 0 R >>",
+            )
+        except BaseException:
+            # 回退到这一页之前，PDF 中不留下写了一半的对象
+            self.f.seek(start)
+            self.f.truncate()
+            for object_id in range(next_id, self.next_id):
+                self.offsets.pop(object_id, None)
+            self.next_id = next_id
+            raise
+        self.pages.append(page_id)
+
+    def close(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.pages)
+        self.write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>")
+        self.write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.f.tell()
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, self.next_id):
+            lines.append(f"{self.offsets[object_id]:010d} 00000 n \n")
+        lines.append(
+            f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+        )
+        self.f.write("".join(lines).encode("latin-1"))
+
+
+class PdfBook:
+    """
+    把一个文档（objectid）的 total 页按页码顺序写入 PDF，可在任意线程调用 add
+
+    页面下载完成的顺序与页码不一致，先到的后续页面只记录文件路径，
+    前面的页面一到就把连续的页面依次写入；所有页面都到达（或失败）后自动完成，
+    PDF 先写入同目录下的临时文件，完成时原子重命名，中途放弃不会留下不完整的 PDF
+    """
+
+    def __init__(self, path, total, log=print):
+        self.path = path
+        self.total = total
+        self.log = log
+        self.lock = threading.Lock()
+        self.next_index = 1
+        # 页码 -> 文件路径（None 表示下载失败），等待前面的页面
+        self.pending = {}
+        self.missing = []
+        self.tmp_path = None
+        self.file = None
+        self.writer = None
+        self.closed = False
+
+    def add(self, index, filepath):
+        """
+        第 index 页（从 1 开始）已保存到 filepath，下载失败时 filepath 为 None
+
+        Returns:
+            bool: 这一次调用是否完成了整个 PDF
+        """
+        with self.lock:
+            if self.closed:
+                return False
+            self.pending[index] = filepath
+            while self.next_index in self.pending:
+                self.write_page(self.next_index, self.pending.pop(self.next_index))
+                self.next_index += 1
+            if self.next_index > self.total:
+                self.finish()
+                return True
+            return False
+
+    def write_page(self, index, filepath):
+        if filepath is None:
+            self.missing.append(index)
+            return
+        if self.writer is None:
+            directory, name = os.path.split(self.path)
+            self.tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+            self.file = open(self.tmp_path, "xb")
+            self.writer = PdfWriter(self.file)
+        try:
+            self.writer.add_image_page(filepath)
+        except (UnsupportedImageError, zlib.error, OSError) as e:
+            self.missing.append(index)
+            self.log(f"⚠️ 第 {index} 页无法写入PDF（{e}）: {os.path.basename(filepath)}")
+
+    def finish(self):
+        self.closed = True
+        if self.writer is None or not self.writer.pages:
+            self.log(f"⚠️ 没有可写入的页面，未生成PDF: {os.path.basename(self.path)}")
+            self.discard()
+            return
+        self.writer.close()
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        pages = len(self.writer.pages)
+        if self.missing:
+            missing = ", ".join(str(i) for i in self.missing)
+            self.log(f"⚠️ PDF缺少第 {missing} 页")
+        self.log(f"✓ 已生成PDF（{pages}/{self.total} 页）: {self.path}")
+
+    def abort(self):
+        """放弃未完成的 PDF（爬取中途出错），删除临时文件"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.discard()
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
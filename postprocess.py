@@ -0,0 +1,292 @@
+"""
+下载后处理
+图片保存后交给进程池依次执行各处理阶段（重新压缩、格式规范化、生成缩略图等），
+CPU 密集的处理不占用下载线程，也不受 GIL 限制。
+
+- 处理阶段是可 pickle 的可调用对象 stage(filepath)，原地替换文件（先写临时文件再 os.replace），
+  或者在旁边生成新文件；用 register_stage 注册后可以按名称启用，如 "recompress,thumbnail:256"。
+  Windows 上进程池用 spawn 启动，自定义阶段需要定义在可导入的模块中
+- 等待处理的图片超过 max_pending 张时 submit 阻塞，下载随之放慢，处理积压不会无限增长
+- 每个阶段的耗时随结果返回，由爬虫记入 CrawlMetrics（阶段名 post_<名称>），与下载指标一起导出
+"""
+
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # PIL 为可选依赖，打包时已排除，不需要 PIL 的阶段照常可用
+    Image = None
+
+# 每个处理进程最多积压的图片数，超过后 submit 阻塞
+PENDING_PER_PROCESS = 4
+DEFAULT_THUMBNAIL_SIZE = 256
+THUMBNAIL_DIRNAME = "thumbnails"
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def replace_file(filepath, data):
+    """原地替换文件内容：读取中的文件（例如正在写入 PDF）不会读到写了一半的数据"""
+    directory, name = os.path.split(filepath)
+    tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, "xb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def png_chunks(data):
+    """返回 PNG 的 (类型, 数据) 列表，不是 PNG 时返回 None"""
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+    chunks = []
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+        chunks.append((chunk_type, data[offset + 8:offset + 8 + length]))
+        offset += length + 12
+        if chunk_type == b"IEND":
+            return chunks
+    raise ValueError("PNG 文件不完整")
+
+
+def png_chunk(chunk_type, data):
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+class Recompress:
+    """用最高压缩级别重新压缩 PNG 的图像数据（无损，不需要 PIL），变小时才替换；JPEG 不处理"""
+
+    name = "recompress"
+
+    def __init__(self, level=9):
+        self.level = int(level)
+
+    def __call__(self, filepath):
+        with open(filepath, "rb") as f:
+            data = f.read()
+        chunks = png_chunks(data)
+        if chunks is None:
+            return
+        idat = b"".join(body for chunk_type, body in chunks if chunk_type == b"IDAT")
+        compressed = zlib.compress(zlib.decompress(idat), self.level)
+
+        # 多个 IDAT 合并为一个，其他块原样保留在原来的位置
+        parts = [PNG_SIGNATURE]
+        written = False
+        for chunk_type, body in chunks:
+            if chunk_type != b"IDAT":
+                parts.append(png_chunk(chunk_type, body))
+            elif not written:
+                parts.append(png_chunk(b"IDAT", compressed))
+                written = True
+        output = b"".join(parts)
+        if len(output) < len(data):
+            replace_file(filepath, output)
+
+
+class Normalize:
+    """
+    统一为 8 位 RGB/灰度、非隔行扫描的图片（透明部分铺白底），格式和文件名不变；
+    这样的图片可以直接写入 PDF（见 pdf_writer.py）。需要 PIL
+    """
+
+    name = "normalize"
+
+    def __init__(self):
+        if Image is None:
+            raise RuntimeError("格式规范化需要安装 Pillow: pip install Pillow")
+
+    def __call__(self, filepath):
+        with Image.open(filepath) as image:
+            image_format = image.format
+            interlaced = bool(image.info.get("interlace") or image.info.get("progressive"))
+            if image.mode in ("RGB", "L") and not interlaced:
+                return
+            image.load()
+            if image.mode in ("RGBA", "LA", "P", "PA"):
+                rgba = image.convert("RGBA")
+                converted = Image.new("RGB", rgba.size, (255, 255, 255))
+                converted.paste(rgba, mask=rgba.getchannel("A"))
+            elif image.mode in ("1", "I", "I;16", "F"):
+                converted = image.convert("L")
+            else:
+                converted = image.convert("RGB")
+        directory, name = os.path.split(filepath)
+        tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            converted.save(tmp_path, format=image_format)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+class Thumbnail:
+    """在保存目录的 thumbnails 子目录中生成同名缩略图，原图不变。需要 PIL"""
+
+    name = "thumbnail"
+
+    def __init__(self, size=DEFAULT_THUMBNAIL_SIZE):
+        if Image is None:
+            raise RuntimeError("生成缩略图需要安装 Pillow: pip install Pillow")
+        self.size = int(size)
+
+    def __call__(self, filepath):
+        directory, name = os.path.split(filepath)
+        thumbnail_dir = os.path.join(directory, THUMBNAIL_DIRNAME)
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        with Image.open(filepath) as image:
+            image_format = image.format
+            image.thumbnail((self.size, self.size))
+            if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(os.path.join(thumbnail_dir, name), format=image_format)
+
+
+STAGES = {stage.name: stage for stage in (Recompress, Normalize, Thumbnail)}
+
+
+def register_stage(name, factory):
+    """
+    注册处理阶段
+
+    Args:
+        name: 阶段名，耗时记为 post_<name>
+        factory: factory(*参数) 返回可 pickle 的 stage(filepath)，参数来自 "name:参数1:参数2"
+    """
+    STAGES[name] = factory
+
+
+def create_stages(spec):
+    """按 "recompress,thumbnail:256" 这样的描述创建处理阶段，返回 [(名称, 阶段)]"""
+    stages = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, *options = item.split(":")
+        if name not in STAGES:
+            raise ValueError(f"未知的后处理阶段: {name}（可用: {', '.join(sorted(STAGES))}）")
+        stages.append((name, STAGES[name](*options)))
+    return stages
+
+
+# 处理进程中的阶段列表，由 init_worker 在进程启动时设置一次，不必每张图片都 pickle 一遍
+worker_stages = []
+
+
+def init_worker(stages):
+    worker_stages[:] = stages
+
+
+def run_stages(filepath):
+    """
+    在处理进程中依次执行各阶段，某个阶段出错时跳过后面的阶段
+
+    Returns:
+        ([(阶段名, 耗时秒数)], 错误信息或 None)
+    """
+    timings = []
+    for name, stage in worker_stages:
+        start = time.perf_counter()
+        try:
+            stage(filepath)
+        except Exception as e:
+            timings.append((name, time.perf_counter() - start))
+            return timings, f"{name}: {e}"
+        timings.append((name, time.perf_counter() - start))
+    return timings, None
+
+
+class PostProcessor:
+    """
+    用法:
+        processor = PostProcessor(create_stages("recompress"))
+        future = processor.submit(filepath, on_done)   # on_done(timings, error) 在回调线程中调用
+        future.result()                                 # on_done 执行完后才返回
+        processor.shutdown()
+    """
+
+    def __init__(self, stages, processes=None, max_pending=None):
+        self.stages = list(stages)
+        self.processes = max(1, int(processes or os.cpu_count() or 1))
+        self.max_pending = max(1, int(max_pending or self.processes * PENDING_PER_PROCESS))
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        # 第一张图片提交时才启动进程池，GUI 启动和不下载图片的运行不受影响
+        self.executor = None
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    initializer=init_worker,
+                    initargs=(self.stages,),
+                )
+            return self.executor
+
+    def submit(self, filepath, on_done):
+        """
+        提交一张图片，积压达到 max_pending 时阻塞到有图片处理完
+
+        Returns:
+            (Future, 阻塞等待的秒数)：Future 在 on_done 返回后才完成，
+            等待它的线程一定能看到 on_done 的结果（例如已写入 PDF）
+        """
+        start = time.perf_counter()
+        self.slots.acquire()
+        waited = time.perf_counter() - start
+        done = Future()
+        try:
+            future = self.start().submit(run_stages, filepath)
+        except Exception as e:
+            # 进程池已损坏或已关闭：不处理这张图片，照常交给 on_done
+            self.slots.release()
+            self.finish(done, on_done, [], f"进程池不可用: {e}")
+            return done, waited
+
+        def callback(future):
+            self.slots.release()
+            try:
+                timings, error = future.result()
+            except Exception as e:
+                timings, error = [], str(e)
+            self.finish(done, on_done, timings, error)
+
+        future.add_done_callback(callback)
+        return done, waited
+
+    def finish(self, done, on_done, timings, error):
+        try:
+            on_done(timings, error)
+        finally:
+            done.set_result(error is None)
+
+    def shutdown(self):
+        """等待已提交的图片处理完并关闭进程池，之后再 submit 会重新启动"""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
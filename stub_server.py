@@ -0,0 +1,428 @@
+"""
+学习通本地模拟服务器
+模拟课程目录、卡片API、预览页面、作业答案页面、登录页和 sN.ananas 图片服务器，
+用于基准测试和离线调试，不需要账号和网络；StubDriver 代替 Chrome 测试自动获取 Cookie
+
+用法:
+    python stub_server.py [--port 8000] [--chapters 3] [--pages 50] [--image-size 200000]
+                          [--latency 0.05] [--error-rate 0.0] [--throttle 0]
+
+爬虫指向模拟服务器:
+    crawler.MOOC_BASE_URL = crawler.PAN_BASE_URL = "http://127.0.0.1:8000"
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import multiprocessing
+import random
+import re
+import socket
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+# 模拟数据的编号
+FIRST_CHAPTER_ID = 1001
+COURSE_NAME = "模拟课程"
+HOMEWORK_TITLE = "模拟作业"
+STUB_UID = "10001"
+# 模拟 p_auth_token 的有效期(秒)
+TOKEN_LIFETIME = 3600
+
+
+def auth_token(lifetime=TOKEN_LIFETIME):
+    """与学习通 p_auth_token 格式相同的 JWT（签名无效）"""
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+
+    payload = {"uid": STUB_UID, "exp": int(time.time() + lifetime)}
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(payload)}.stub"
+
+
+def png_chunk(chunk_type, data):
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+def image_body(path, size):
+    """
+    每个路径对应固定且互不相同的图片内容，续传和去重测试都依赖这一点
+    内容是 size 字节的有效 PNG（32x32 灰度图，其余字节放在私有块中），可用于测试合成 PDF
+    """
+    digest = hashlib.sha256(path.encode("utf-8")).digest()
+    filler = (digest * (size // len(digest) + 1))[:size]
+    rows = b"".join(b"\x00" + bytes([value]) * 32 for value in digest)
+    head = (
+        b"\x89PNG\r\n\x1a\n"
+        + png_chunk(b"IHDR", struct.pack(">IIBBBBB", 32, 32, 8, 0, 0, 0, 0))
+        + png_chunk(b"IDAT", zlib.compress(rows))
+    )
+    tail = png_chunk(b"IEND", b"")
+    padding = size - len(head) - len(tail) - 12
+    if padding < 0:
+        # 太小放不下 PNG 结构
+        return filler
+    return head + png_chunk(b"stUb", filler[:padding]) + tail
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 每个新 TCP 连接调用一次，用来检查客户端是否复用长连接
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with server.lock:
+            server.stats["requests"] += 1
+
+        if url.path == "/__stats":
+            with server.lock:
+                return self.send_body(json.dumps(server.stats).encode("utf-8"), "application/json")
+
+        routes = {
+            "/mooc-ans/mycourse/studentcourse": self.course_page,
+            "/mooc-ans/knowledge/cards": self.cards_page,
+            "/preview/objectshowpreview.html": self.preview_page,
+            "/mooc2/work/view": self.homework_page,
+        }
+        if url.path in routes:
+            return self.send_page(routes[url.path](query))
+        if url.path.startswith("/sv-w8/doc/"):
+            return self.send_image(url.path)
+        if url.path == "/login":
+            return self.login()
+        if url.path == "/space/":
+            return self.space_page()
+
+        self.send_error(404)
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def course_page(self, query):
+        links = "".join(
+            f'<li id="cur{chapter_id}"><a href="/mycourse/studentstudy?chapterId={chapter_id}">第{n}章</a></li>'
+            for n, chapter_id in enumerate(self.server.chapter_ids, 1)
+        )
+        return f"<html><body><ul>{links}</ul></body></html>"
+
+    def cards_page(self, query):
+        chapter_id = query.get("knowledgeid", str(FIRST_CHAPTER_ID))
+        n = int(chapter_id) - FIRST_CHAPTER_ID + 1
+        return (
+            "<html><script>var mArg = {"
+            f'"coursename":"{COURSE_NAME}","knowledgename":"第{n}章",'
+            f'"attachments":[{{"objectid":"obj{chapter_id}"}}]'
+            "};</script></html>"
+        )
+
+    def preview_page(self, query):
+        objectid = query.get("objectid", "obj")
+        base = self.base_url()
+        pages = "".join(
+            f'<div class="page"><img class="lazy" src="{base}/sv-w8/doc/{objectid}/{i}.png"></div>\n'
+            f"<p>{self.server.filler}</p>\n"
+            for i in range(1, self.server.pages + 1)
+        )
+        return f"<html><body>{pages}</body></html>"
+
+    def homework_page(self, query):
+        base = self.base_url()
+        answers = "".join(
+            f'<dd class="textwrap stuAnswerContent">'
+            f'<img src="{base}/sv-w8/doc/hw/thumb/{i}.png" data-original="{base}/sv-w8/doc/hw/{i}.png">'
+            f"</dd><div>{'作业正文 ' * 50}</div>\n"
+            for i in range(1, self.server.pages + 1)
+        )
+        return (
+            f'<html><script>var a = {{"coursename":"{COURSE_NAME}"}};</script>'
+            f'<h2 class="mark_title">{HOMEWORK_TITLE}</h2>{answers}</html>'
+        )
+
+    def login(self):
+        """模拟用户在登录页完成登录：下发 Cookie 后跳转到个人空间"""
+        self.send_response(302)
+        self.send_header("Location", "/space/")
+        self.send_header("Set-Cookie", f"UID={STUB_UID}; Path=/; HttpOnly")
+        self.send_header("Set-Cookie", f"p_auth_token={auth_token()}; Path=/; Max-Age={TOKEN_LIFETIME}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def space_page(self):
+        """已登录时轮换 p_auth_token（HTTP 续期），未登录时跳转到登录页"""
+        cookies = SimpleCookie(self.headers.get("Cookie", ""))
+        if "UID" not in cookies:
+            self.send_response(302)
+            self.send_header("Location", "/login?refer=/space/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with self.server.lock:
+            self.server.stats["renewals"] += 1
+        body = "<html><body>个人空间</body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Set-Cookie", f"p_auth_token={auth_token()}; Path=/; Max-Age={TOKEN_LIFETIME}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_page(self, html):
+        body = html.encode("utf-8")
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_body(body, "text/html; charset=utf-8", {"ETag": etag})
+
+    def send_body(self, body, content_type, headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_image(self, path):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            throttled = 0 < server.throttle_concurrency < server.in_flight
+        try:
+            if throttled:
+                # 同时进行的图片请求过多，模拟 ananas 服务器限流
+                with server.lock:
+                    server.stats["throttled"] += 1
+                self.send_response(429)
+                self.send_header("Retry-After", str(server.retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_image_body(path)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def send_image_body(self, path):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.error_rate and server.random.random() < server.error_rate:
+            with server.lock:
+                server.stats["errors"] += 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        size = server.image_size
+        body = image_body(path, size)
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+
+        range_match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        start = int(range_match.group(1)) if range_match else 0
+        if self.headers.get("If-Range", etag) != etag or start >= size:
+            start = 0
+
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(size - start))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.end_headers()
+
+        with server.lock:
+            drop = server.drop_first and path not in server.dropped
+            server.dropped.add(path)
+        payload = body[start:size // 2] if drop and start < size // 2 else body[start:]
+        self.wfile.write(payload)
+        self.wfile.flush()
+        with server.lock:
+            server.stats["images"] += 1
+            server.stats["bytes_sent"] += len(payload)
+        if drop:
+            # 第一次请求只发送一半就断开连接，模拟网络中断
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(
+    host="127.0.0.1",
+    port=0,
+    chapters=3,
+    pages=50,
+    image_size=200_000,
+    latency=0.0,
+    error_rate=0.0,
+    drop_first=False,
+    throttle_concurrency=0,
+    retry_after=1,
+    filler_kb=1,
+    seed=0,
+):
+    """
+    创建模拟服务器（未启动）
+
+    Args:
+        chapters: 课程目录中的章节数
+        pages: 每个章节预览页面 / 作业页面中的图片数量
+        image_size: 单张图片字节数
+        latency: 图片请求的响应延迟(秒)
+        error_rate: 图片请求返回 503 的概率
+        drop_first: 每张图片的第一次请求只发送一半就断开
+        throttle_concurrency: 同时进行的图片请求超过这个数时返回 429，0 表示不限流
+        retry_after: 429 响应的 Retry-After(秒)
+        filler_kb: 预览页面每张图片之后的正文大小(KB)，调大可模拟解析耗 CPU 的大页面
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.chapter_ids = [str(FIRST_CHAPTER_ID + n) for n in range(chapters)]
+    server.pages = pages
+    server.image_size = image_size
+    server.latency = latency
+    server.error_rate = error_rate
+    server.drop_first = drop_first
+    server.throttle_concurrency = throttle_concurrency
+    server.retry_after = retry_after
+    filler = "预览页面正文 "
+    server.filler = filler * max(1, filler_kb * 1024 // len(filler.encode("utf-8")))
+    server.in_flight = 0
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.dropped = set()
+    server.stats = {"connections": 0, "requests": 0, "images": 0, "errors": 0, "throttled": 0, "bytes_sent": 0, "renewals": 0}
+    return server
+
+
+def start_server(**options):
+    """在后台线程启动模拟服务器，返回 (server, base_url)"""
+    server = create_server(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def serve_forever(options, port_queue):
+    server = create_server(**options)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def start_server_process(**options):
+    """
+    在独立进程中启动模拟服务器，避免服务器占用被测进程的 CPU 和内存
+
+    Returns:
+        (process, base_url)，用完后调用 process.terminate()
+    """
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve_forever, args=(options, port_queue), daemon=True
+    )
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+
+
+class StubDriver:
+    """
+    代替 Selenium WebDriver 的模拟浏览器，用于在没有 Chrome 的环境测试 auto_cookie：
+    打开模拟服务器的 /login 即视为用户完成登录，随后跳转到 /space/
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.current_url = "about:blank"
+
+    def maximize_window(self):
+        pass
+
+    def get(self, url):
+        self.current_url = self.session.get(url, timeout=10).url
+
+    def get_cookies(self):
+        return [
+            {
+                "name": c.name,
+                "value": c.value,
+                "domain": c.domain,
+                "path": c.path,
+                "expiry": c.expires,
+                "secure": c.secure,
+                "httpOnly": c.has_nonstandard_attr("HttpOnly"),
+            }
+            for c in self.session.cookies
+        ]
+
+    def add_cookie(self, cookie):
+        self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""))
+
+    def quit(self):
+        self.session.close()
+
+
+def course_url(base_url, chapter_id=FIRST_CHAPTER_ID):
+    """模拟服务器上的课程章节链接"""
+    return f"{base_url}/mycourse/studentstudy?chapterId={chapter_id}&courseId=1&clazzid=1&cpi=1"
+
+
+def homework_url(base_url):
+    """模拟服务器上的作业页面链接"""
+    return f"{base_url}/mooc2/work/view?courseId=1&classId=1&workId=1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="学习通本地模拟服务器")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--chapters", type=int, default=3, help="章节数")
+    parser.add_argument("--pages", type=int, default=50, help="每章图片数")
+    parser.add_argument("--image-size", type=int, default=200_000, help="单张图片字节数")
+    parser.add_argument("--latency", type=float, default=0.0, help="图片响应延迟(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="图片请求失败概率")
+    parser.add_argument("--throttle", type=int, default=0, help="超过这个并发数时返回 429")
+    args = parser.parse_args()
+
+    server = create_server(
+        port=args.port,
+        chapters=args.chapters,
+        pages=args.pages,
+        image_size=args.image_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_concurrency=args.throttle,
+    )
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"模拟服务器已启动: {base_url}")
+    print(f"课程章节链接: {course_url(base_url)}")
+    print(f"作业页面链接: {homework_url(base_url)}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+HTTP 传输层
+爬虫和 Cookie 验证共用按主机配置好连接池的 requests.Session，连接保持长连接复用，
+验证 Cookie 时建立的 TLS 连接在随后的爬取中继续使用，不会每次请求都重新握手。
+图片服务器（sN.ananas.chaoxing.com）可选使用 HTTP/2 多路复用，需要安装 httpx[http2]
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import httpx
+except ImportError:  # httpx 为可选依赖，只在启用 HTTP/2 时使用
+    httpx = None
+
+# 课程接口和文档预览的主机，请求数量少，保持少量长连接即可
+PAGE_HOSTS = ("https://mooc1.chaoxing.com", "https://pan-yz.chaoxing.com")
+PAGE_POOL_SIZE = 4
+# 图片服务器 s1 ~ s9.ananas.chaoxing.com
+IMAGE_HOSTS = tuple(f"https://s{n}.ananas.chaoxing.com" for n in range(1, 10))
+# 其他主机（主要是图片服务器）每个主机保持的长连接数，应不小于下载并发数，
+# 否则超出的连接用完即关闭，下一次请求又要重新握手
+DEFAULT_POOL_SIZE = 32
+# PoolManager 缓存的主机连接池数量，需要容纳全部图片服务器和页面主机
+POOL_CONNECTIONS = 32
+
+# HTTP/2 禁止的逐跳请求头
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"}
+
+shared = None
+shared_lock = threading.Lock()
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, host_pool_sizes=None, http2=False):
+    """
+    创建配置好连接池的 Session
+
+    Args:
+        pool_size: 每个主机保持的长连接数上限
+        host_pool_sizes: {URL前缀: 连接数}，单独设置个别主机的连接数
+        http2: 图片服务器使用 HTTP/2（未安装 httpx 时忽略）
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    page_adapter = HTTPAdapter(pool_connections=len(PAGE_HOSTS), pool_maxsize=PAGE_POOL_SIZE)
+    for prefix in PAGE_HOSTS:
+        session.mount(prefix, page_adapter)
+
+    if http2 and httpx is not None:
+        # 所有图片服务器共用一个 HTTP/2 客户端，每个主机一条连接即可承载全部并发请求
+        http2_adapter = Http2Adapter(pool_size)
+        for prefix in IMAGE_HOSTS:
+            session.mount(prefix, http2_adapter)
+
+    for prefix, size in (host_pool_sizes or {}).items():
+        session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=size))
+    return session
+
+
+def shared_session(cookies=None, **options):
+    """
+    进程内共用的 Session，第一次调用时按 options 创建
+
+    Args:
+        cookies: 提供时替换 Session 中的全部 Cookie
+        options: create_session 的参数；未指定 http2 时读取环境变量 CHAOXING_HTTP2=1，
+            与 ChaoxingImageCrawler 自己创建 Session 时一致
+    """
+    global shared
+    options.setdefault("http2", os.environ.get("CHAOXING_HTTP2") == "1")
+    with shared_lock:
+        if shared is None:
+            shared = create_session(**options)
+        if cookies is not None:
+            shared.cookies.clear()
+            shared.cookies.update(cookies)
+        return shared
+
+
+class Http2Body:
+    """把 httpx 的流式响应包装成 requests 通过 response.raw 读取内容所需的接口"""
+
+    def __init__(self, response):
+        self.response = response
+        # 与 urllib3 的接口保持一致，响应是否完整由调用方按长度检查
+        self.enforce_content_length = True
+
+    def stream(self, chunk_size, decode_content=True):
+        # 不按 chunk_size 缓冲，收到多少交出多少，连接中断时已收到的数据不会丢在缓冲区里
+        chunks = self.response.iter_bytes() if decode_content else self.response.iter_raw()
+        try:
+            yield from chunks
+        except httpx.RemoteProtocolError as e:
+            if self.enforce_content_length:
+                raise requests.ConnectionError(e)
+            # 与 urllib3 相同：不强制长度时正常结束，由调用方检查长度后断点续传
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e)
+        finally:
+            self.response.close()
+
+    def read(self, amt=None):
+        return b"".join(self.stream(amt or 65536))
+
+    def tell(self):
+        return self.response.num_bytes_downloaded
+
+    def close(self):
+        self.response.close()
+
+    def release_conn(self):
+        self.response.close()
+
+
+class Http2Adapter(BaseAdapter):
+    """通过 httpx 以 HTTP/2 发送请求的 requests 适配器（不处理代理和响应中的 Set-Cookie）"""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        super().__init__()
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout = read_timeout = timeout
+        headers = {
+            name: value
+            for name, value in request.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        }
+        try:
+            http_request = self.client.build_request(
+                request.method,
+                request.url,
+                headers=headers,
+                content=request.body,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+            http_response = self.client.send(http_request, stream=True)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e, request=request)
+
+        response = requests.Response()
+        response.status_code = http_response.status_code
+        response.reason = http_response.reason_phrase
+        response.headers = CaseInsensitiveDict(http_response.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = Http2Body(http_response)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        self.client.close()